@@ -2,5 +2,9 @@ from .pdf_converter import batch_convert
 from .tiqu import ocr_folder_to_markdown
 from .markdown_cleaner import process_markdown_files
 from .me import allin
-from .semantic_deduplicator import semantic_deduplicate
-from .txt_to_jsonl_converter import txt_to_jsonl
\ No newline at end of file
+from .semantic_deduplicator import Deduplicator, semantic_deduplicate, sweep_thresholds
+from .txt_to_jsonl_converter import txt_to_jsonl
+from .shuffle import shuffle_jsonl_shards
+from .token_shards import tokenize_jsonl_shards
+from .pipeline import Pipeline
+from .streaming import stream_corpus
\ No newline at end of file
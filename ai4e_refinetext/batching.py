@@ -0,0 +1,60 @@
+import re
+import numpy as np
+
+_CJK = re.compile(r"[\u4e00-\u9fa5]")
+
+
+def estimate_token_lengths(lines):
+    """
+    无分词器时的 token 数估计：中文按一字一个 token，其余字符约 4 个一个 token，再加 [CLS]/[SEP]。
+    """
+    cjk = np.fromiter((len(_CJK.findall(t)) for t in lines), dtype=np.int64, count=len(lines))
+    chars = np.fromiter((len(t) for t in lines), dtype=np.int64, count=len(lines))
+    return cjk + (chars - cjk) // 4 + 2
+
+
+def token_lengths(lines, model=None):
+    """
+    每行 token 数的估计（按模型最大长度截断），只用于分桶组批。
+    不调用模型的分词器：model.encode 内部还会再分词一次，预先完整分词会使分词开销翻倍；
+    组批只需要相对长度，字符估计足够把长度相近的行放在一起。
+    """
+    lengths = estimate_token_lengths(lines)
+    max_length = getattr(model, 'max_seq_length', None)
+    if max_length is not None:
+        lengths = np.minimum(lengths, max_length)
+    return lengths
+
+
+def plan_batches(lengths, token_budget=16384, max_batch_size=256):
+    """
+    按 token 长度分桶组批：先按长度排序，再贪心地把相邻的行放进同一批，
+    使每批的填充后 token 数（批内最大长度 × 行数）不超过 token_budget。
+    返回每批在原顺序中的下标数组列表。
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    order = np.argsort(lengths, kind='stable')
+    batches = []
+    start = 0
+    while start < len(order):
+        end = start + 1
+        # 升序排列，批内最大长度就是最后一行的长度
+        while end < len(order) and end - start < max_batch_size \
+                and lengths[order[end]] * (end - start + 1) <= token_budget:
+            end += 1
+        batches.append(order[start:end])
+        start = end
+    return batches
+
+
+def encode_bucketed(lines, encode_fn, lengths, token_budget=16384, max_batch_size=256):
+    """
+    按 plan_batches 的计划分批调用 encode_fn(文本列表) -> 嵌入矩阵，并把结果还原为原始顺序。
+    """
+    result = None
+    for idx in plan_batches(lengths, token_budget, max_batch_size):
+        embs = encode_fn([lines[i] for i in idx])
+        if result is None:
+            result = np.empty((len(lines), embs.shape[1]), dtype=embs.dtype)
+        result[idx] = embs
+    return result
@@ -0,0 +1,250 @@
+import sys
+import time
+import numpy as np
+
+
+def make_clustered_vectors(n, dim=384, n_clusters=None, noise=0.3, seed=0):
+    """
+    生成带聚类结构的单位向量，模拟句向量的分布（纯随机高维向量彼此几乎正交，无法反映真实检索难度）。
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = n_clusters or max(1, n // 50)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, n)
+    vectors = centers[labels] + noise * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def benchmark_similarity_index(sizes=(10000, 20000, 40000), dim=384, n_queries=1000,
+                               index_types=('flat', 'ivf', 'hnsw'), index_params=None, seed=0):
+    """
+    对比各相似度索引的插入/查询耗时随规模的变化，以及相对精确检索（flat）的 top-1 召回率。
+
+    参数说明：
+    - sizes: 入库向量规模列表
+    - dim: 向量维度
+    - n_queries: 每个规模下的查询数
+    - index_types: 参与对比的索引类型
+    - index_params: {索引类型: 构造参数} 的字典
+    """
+    from .similarity_index import build_index
+
+    index_params = index_params or {}
+    rows = []
+    for n in sizes:
+        data = make_clustered_vectors(n + n_queries, dim, seed=seed)
+        base, queries = data[:n], data[n:]
+        exact_ids = None
+        for index_type in index_types:
+            index = build_index(index_type, dim, **index_params.get(index_type, {}))
+            start = time.perf_counter()
+            # 按 1024 条一批增量插入，与去重流程的写入方式一致
+            for i in range(0, n, 1024):
+                index.add(base[i:i + 1024])
+            add_time = time.perf_counter() - start
+            start = time.perf_counter()
+            _, ids = index.search(queries)
+            search_time = time.perf_counter() - start
+            if index_type == 'flat':
+                exact_ids = ids
+            recall = float(np.mean(ids == exact_ids)) if exact_ids is not None else float('nan')
+            rows.append((index_type, n, add_time, search_time, recall))
+            print(f"{index_type:>6} n={n:>9} 插入 {add_time:8.3f}s ({add_time / n * 1e6:7.1f}us/条) "
+                  f"查询 {search_time:8.3f}s ({search_time / n_queries * 1e3:7.3f}ms/条) recall@1={recall:.4f}",
+                  file=sys.stderr)
+    return rows
+
+
+def make_variable_length_lines(n, seed=0):
+    """
+    生成长度从十几个字符到数千字符不等的中英文混合行，模拟 OCR 章节文本的长度分布。
+    """
+    rng = np.random.default_rng(seed)
+    vocab = ["催化剂", "反应", "温度", "压力", "活性位点", "吸附", "catalyst", "reaction", "surface", "energy",
+             "的", "在", "和", "，", "。"]
+    lengths = np.minimum(rng.lognormal(mean=3.5, sigma=1.2, size=n).astype(int) + 3, 3000)
+    return ["".join(rng.choice(vocab, size=k)) for k in lengths]
+
+
+def benchmark_length_bucketing(model_name='sentence-transformers/all-MiniLM-L6-v2', n_lines=2000,
+                               token_budget=16384, max_batch_size=256, seed=0):
+    """
+    在 CPU 上对比按文件顺序固定批大小编码与按 token 长度分桶、按 token 预算组批编码的吞吐（行/秒）。
+    """
+    from sentence_transformers import SentenceTransformer
+    from .embedders import BucketedEncoder
+
+    model = SentenceTransformer(model_name, device='cpu')
+    lines = make_variable_length_lines(n_lines, seed)
+    encoders = [
+        ('文件顺序', BucketedEncoder(model, token_budget=None)),
+        ('分桶组批', BucketedEncoder(model, token_budget, max_batch_size)),
+    ]
+    rows = []
+    for name, encoder in encoders:
+        start = time.perf_counter()
+        encoder.encode(lines)
+        elapsed = time.perf_counter() - start
+        rows.append((name, n_lines / elapsed))
+        print(f"{name}: {n_lines} 行 {elapsed:.2f}s，{n_lines / elapsed:.1f} 行/秒", file=sys.stderr)
+    return rows
+
+
+def benchmark_quantization(n=50000, dim=384, n_queries=1000, threshold=0.8, noise=0.5, seed=0):
+    """
+    对比全精度与 int8 / binary 量化检索的常驻内存、查询耗时，以及去重判定（相似度 >= threshold）与全精度的一致率。
+    """
+    from .similarity_index import build_index
+
+    data = make_clustered_vectors(n + n_queries, dim, noise=noise, seed=seed)
+    base, queries = data[:n], data[n:]
+    rows = []
+    exact_decision = None
+    for name, index_type, params in [('float32', 'flat', {}),
+                                     ('int8', 'quantized', {'mode': 'int8', 'threshold': threshold}),
+                                     ('binary', 'quantized', {'mode': 'binary', 'threshold': threshold})]:
+        index = build_index(index_type, dim, **params)
+        index.add(base)
+        memory = (index._codes if index_type == 'quantized' else index._vectors).nbytes
+        start = time.perf_counter()
+        scores, _ = index.search(queries)
+        elapsed = time.perf_counter() - start
+        decision = scores >= threshold
+        if exact_decision is None:
+            exact_decision = decision
+        agreement = float(np.mean(decision == exact_decision))
+        rows.append((name, memory, elapsed, agreement))
+        extra = f"，{index.report()}" if hasattr(index, 'report') else ""
+        print(f"{name:>7}: 常驻向量 {memory / 2 ** 20:8.1f} MB，查询 {elapsed:.3f}s，"
+              f"判定一致率 {agreement:.4%}{extra}", file=sys.stderr)
+    return rows
+
+
+def benchmark_rescore_margin(n=50000, dim=384, n_queries=2000, threshold=0.9, noises=(0.2, 0.35, 0.5),
+                             margins=(None, 0.05, 0.075, 0.15), mode='binary', seed=0):
+    """
+    量化检索的重算区间标定：对不同近似重复程度的数据（noise 越小，查询与入库向量越相似），
+    报告每个区间半宽下需要回盘重算的查询比例、去重判定（相似度 >= threshold）相对全精度的召回率与误删数。
+    margins 中的 None 表示默认区间（见 QuantizedIndex.margin）。
+    """
+    from .similarity_index import build_index
+
+    rows = []
+    for noise in noises:
+        data = make_clustered_vectors(n + n_queries, dim, noise=noise, seed=seed)
+        base, queries = data[:n], data[n:]
+        flat = build_index('flat', dim)
+        flat.add(base)
+        exact = flat.search(queries)[0] >= threshold
+        index = build_index('quantized', dim, mode=mode, threshold=threshold)
+        index.add(base)
+        for margin in margins:
+            index.rescore_margin = margin
+            rescored = index.stats['rescored']
+            start = time.perf_counter()
+            scores, _ = index.search(queries)
+            elapsed = time.perf_counter() - start
+            decision = scores >= threshold
+            rescore_rate = (index.stats['rescored'] - rescored) / n_queries
+            recall = float(np.sum(decision & exact) / max(np.sum(exact), 1))
+            false_drops = int(np.sum(decision & ~exact))
+            rows.append((noise, index.margin(), rescore_rate, recall, false_drops, elapsed))
+            print(f"{mode} noise={noise} margin={index.margin():.4f}: 重算 {rescore_rate:.2%}，"
+                  f"召回率 {recall:.4%}（全精度判重 {int(np.sum(exact))} 条），误删 {false_drops} 条，"
+                  f"查询 {elapsed:.3f}s", file=sys.stderr)
+    return rows
+
+
+def make_markdown_document(size_mb=8, seed=0):
+    """
+    生成约 size_mb MB 的 OCR 风格 markdown 行：标题、正文、目录、图片、链接、版权行、图表编号、引用与乱码字符混杂。
+    """
+    rng = np.random.default_rng(seed)
+    words = ["催化剂", "反应", "温度", "吸附", "活性位点", "catalyst", "surface", "energy", "的", "在", "，", "。"]
+    noise = ["表 3-2", "图12", "Table 4", "FIGURE 2-1", "[12]", "[注释]", "(Wang et al., 2019)", "Smith和Lee (2020，2021)",
+             "https://example.org/a?b=1", "西安交通大学XIANJIAOTONGUNIVERSITY", "\u00e9\u2022", "\ufffd", "α", "  "]
+    special = ["![图片](img.png)", "参见 [链接](http://x.y)", "Copyright 2020", "Email: a@b.c", "访问 WWW.example.com",
+               "目录", "Contents", "第一章 绪论 ...... 1", "", ""]
+    lines, size = [], 0
+    while size < size_mb * 2 ** 20:
+        r = rng.random()
+        if r < 0.05:
+            line = "#" * int(rng.integers(1, 4)) + " " + "".join(rng.choice(words, size=3))
+        elif r < 0.15:
+            line = str(rng.choice(special))
+        else:
+            parts = list(rng.choice(words, size=int(rng.integers(5, 60))))
+            for _ in range(int(rng.integers(0, 3))):
+                parts.insert(int(rng.integers(0, len(parts) + 1)), str(rng.choice(noise)))
+            line = "".join(parts)
+        lines.append(line + "\n")
+        size += len(line.encode("utf-8")) + 1
+    return lines
+
+
+def benchmark_markdown_cleaning(size_mb=8, seed=0):
+    """
+    在约 size_mb MB 的 markdown 上对比原来的四趟列表清洗与单趟规则引擎的耗时，校验输出一致并打印各规则命中数。
+    """
+    from .cleaning_rules import RuleEngine
+    from .markdown_cleaner import clean_markdown, clean_references, remove_garbled_characters, \
+        remove_specific_patterns
+
+    lines = make_markdown_document(size_mb, seed)
+    start = time.perf_counter()
+    expected = remove_garbled_characters(clean_references(remove_specific_patterns(clean_markdown(lines))))
+    four_pass = time.perf_counter() - start
+    engine = RuleEngine()
+    start = time.perf_counter()
+    actual = list(engine.clean(lines))
+    single_pass = time.perf_counter() - start
+    if actual != expected:
+        raise AssertionError("规则引擎的输出与四趟清洗不一致")
+    print(f"{len(lines)} 行 ({size_mb} MB)：四趟清洗 {four_pass:.2f}s，规则引擎 {single_pass:.2f}s，"
+          f"加速 {four_pass / single_pass:.2f}x", file=sys.stderr)
+    print("规则命中：" + "，".join(f"{name} {n}" for name, n in engine.report()), file=sys.stderr)
+    return four_pass, single_pass
+
+
+def benchmark_keyword_automaton(counts=(10, 100, 1000, 10000), n_lines=5000, seed=0):
+    """
+    对比逐个子串检查（any(k in line)）与 KeywordAutomaton 一次扫描的每行耗时随关键词数量的变化，并校验结果一致。
+    """
+    from .keyword_automaton import KeywordAutomaton
+
+    rng = np.random.default_rng(seed)
+    lines = [line.rstrip() for line in make_markdown_document(1, seed)[:n_lines]]
+    alphabet = list("abcdefghijklmnopqrstuvwxyz") + [chr(c) for c in range(0x4e00, 0x4e00 + 500)]
+    rows = []
+    for count in counts:
+        keywords = ["".join(rng.choice(alphabet, size=int(rng.integers(3, 9)))) for _ in range(count)]
+        # 混入几个真实出现的词，保证有命中
+        keywords[:3] = ["copyright", "催化剂反应", "www."]
+        start = time.perf_counter()
+        expected = [any(k in line for k in keywords) for line in lines]
+        naive = time.perf_counter() - start
+        automaton = KeywordAutomaton((k, 'drop_line', False) for k in keywords)
+        start = time.perf_counter()
+        actual = [bool(automaton.matches(line)) for line in lines]
+        scan = time.perf_counter() - start
+        if actual != expected:
+            raise AssertionError("自动机与子串检查的结果不一致")
+        rows.append((count, naive, scan))
+        print(f"{count:>6} 个关键词：子串检查 {naive / len(lines) * 1e6:8.2f}us/行，"
+              f"自动机 {scan / len(lines) * 1e6:8.2f}us/行", file=sys.stderr)
+    return rows
+
+
+BENCHMARKS = {
+    'index': benchmark_similarity_index,
+    'bucketing': benchmark_length_bucketing,
+    'quantization': benchmark_quantization,
+    'markdown': benchmark_markdown_cleaning,
+    'keywords': benchmark_keyword_automaton,
+}
+
+
+if __name__ == '__main__':
+    # 用法：python -m ai4e_refinetext.benchmark [名称 ...]，不带参数时运行全部
+    for name in sys.argv[1:] or list(BENCHMARKS):
+        BENCHMARKS[name]()
@@ -0,0 +1,179 @@
+import hashlib
+import sys
+from collections import Counter
+import numpy as np
+from .compression import open_input
+from .prefilter import normalize_text
+
+
+class CountMinSketch:
+    """
+    Count-Min Sketch 计数器：用 depth × width 的固定大小计数表近似统计任意多个键的出现次数，
+    内存与键的数量无关。估计值只会偏大不会偏小，偏大的概率随 width、depth 增大而迅速降低。
+
+    参数说明：
+    - width: 每行计数表的宽度
+    - depth: 哈希函数（计数表行）个数
+    - seed: 哈希参数的随机种子
+    """
+
+    def __init__(self, width=1 << 20, depth=4, seed=0):
+        rng = np.random.default_rng(seed)
+        self.width = width
+        # 奇数乘数的乘法哈希，溢出即按 2^64 取模
+        self._mul = rng.integers(1, 1 << 62, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._add = rng.integers(0, 1 << 62, size=depth, dtype=np.uint64)
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+
+    def _buckets(self, keys):
+        h = np.asarray(keys, dtype=np.uint64)[None, :] * self._mul[:, None] + self._add[:, None]
+        h ^= h >> np.uint64(31)
+        return (h % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, keys, counts=1):
+        """
+        把每个键的计数加上 counts（同一批中重复的键会累加）。
+        """
+        for row, idx in zip(self.table, self._buckets(keys)):
+            np.add.at(row, idx, counts)
+
+    def estimate(self, keys):
+        """
+        返回每个键计数的估计值（不小于真实值）。
+        """
+        buckets = self._buckets(keys)
+        return np.min(self.table[np.arange(len(self.table))[:, None], buckets], axis=0)
+
+
+def line_key(line, min_chars=1):
+    """
+    行的键：归一化文本 blake2b 摘要的 8 字节整数；归一化后短于 min_chars 的行返回 None。
+    """
+    text = normalize_text(line)
+    if len(text) < min_chars:
+        return None
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), 'little')
+
+
+class BoilerplateFilter:
+    """
+    基于频率统计的模板行过滤：OCR 书籍每页重复的页眉、页脚、水印行在同一本书内反复出现，
+    机构水印等还会出现在大量不同的书中。两遍处理，均为线性时间：
+
+    - 第一遍 fit：对每个文档的归一化行哈希去重后计入语料级的文档频率（Count-Min Sketch，内存固定）
+    - 第二遍 filter_file：重新统计当前文档内每行的出现次数（精确），
+      删除文档内出现超过 max_doc_repeats 次、或出现在超过 max_doc_fraction 比例（且至少 min_docs 个）文档中的行
+
+    参数说明：
+    - max_doc_repeats: 同一文档内允许的最大重复次数，为 None 时不启用该规则
+    - max_doc_fraction: 允许出现的最大文档比例，为 None 时不启用该规则
+    - min_docs: 按文档比例删除时至少要出现的文档数，避免小语料中误删
+    - min_chars: 归一化后短于该长度的行（页码、编号等）不参与判定
+    - keep_headings: 是否保留以 # 开头的标题行（删除标题会改变章节结构）
+    - width, depth: Count-Min Sketch 的大小
+    - encoding: 文件编码
+    """
+
+    def __init__(self, max_doc_repeats=5, max_doc_fraction=0.3, min_docs=5, min_chars=4, keep_headings=True,
+                 width=1 << 20, depth=4, encoding='utf-8'):
+        self.max_doc_repeats = max_doc_repeats
+        self.max_doc_fraction = max_doc_fraction
+        self.min_docs = min_docs
+        self.min_chars = min_chars
+        self.keep_headings = keep_headings
+        self.encoding = encoding
+        self.doc_freq = CountMinSketch(width, depth)
+        self.n_docs = 0
+        self.removed = Counter()
+
+    def _keys(self, lines):
+        # 返回 (每行的键, 是否参与判定)；空行、过短的行与（保留时的）标题行不参与判定
+        keys, valid = [], []
+        for line in lines:
+            key = None
+            if not (self.keep_headings and line.lstrip().startswith("#")):
+                key = line_key(line, self.min_chars)
+            keys.append(key or 0)
+            valid.append(key is not None)
+        return np.array(keys, dtype=np.uint64), np.array(valid, dtype=bool)
+
+    def fit_document(self, lines):
+        """
+        第一遍：把一个文档（行的可迭代对象）计入文档频率统计。
+        """
+        keys, valid = self._keys(lines)
+        keys = np.unique(keys[valid])
+        if len(keys):
+            self.doc_freq.add(keys)
+        self.n_docs += 1
+
+    def fit(self, paths):
+        """
+        第一遍：统计所有文件的文档频率，返回自身。
+        """
+        for path in paths:
+            with open_input(path, 'r', encoding=self.encoding) as f:
+                self.fit_document(f)
+        return self
+
+    def boilerplate_mask(self, keys, valid):
+        """
+        第二遍：根据一个文档全部行的键，返回需要删除的行的布尔掩码，并累计各规则删除的行数。
+        """
+        mask = np.zeros(len(keys), dtype=bool)
+        idx = np.flatnonzero(valid)
+        if not len(idx):
+            return mask
+        if self.max_doc_repeats is not None:
+            _, inverse, counts = np.unique(keys[idx], return_inverse=True, return_counts=True)
+            repeated = counts[inverse] > self.max_doc_repeats
+            mask[idx[repeated]] = True
+            self.removed['doc_repeats'] += int(repeated.sum())
+        if self.max_doc_fraction is not None and self.n_docs:
+            limit = max(self.min_docs, self.max_doc_fraction * self.n_docs)
+            rest = idx[~mask[idx]]
+            common = self.doc_freq.estimate(keys[rest]) > limit
+            mask[rest[common]] = True
+            self.removed['corpus_freq'] += int(common.sum())
+        return mask
+
+    def filter_lines(self, lines):
+        """
+        过滤一个已在内存中的文档，返回保留的行列表。
+        """
+        lines = list(lines)
+        mask = self.boilerplate_mask(*self._keys(lines))
+        return [line for line, drop in zip(lines, mask) if not drop]
+
+    def filter_file(self, path):
+        """
+        流式过滤一个文件：先扫描一遍计算每行的键（每行只占 8 字节），再重新读取并逐行产出保留的行。
+        """
+        with open_input(path, 'r', encoding=self.encoding) as f:
+            mask = self.boilerplate_mask(*self._keys(f))
+        with open_input(path, 'r', encoding=self.encoding) as f:
+            for line, drop in zip(f, mask):
+                if not drop:
+                    yield line
+
+    def config(self):
+        """
+        返回参数与语料统计的可序列化描述；语料统计随文件增删而变化，变化时所有文件都需要重新过滤。
+        """
+        return {'max_doc_repeats': self.max_doc_repeats, 'max_doc_fraction': self.max_doc_fraction,
+                'min_docs': self.min_docs, 'min_chars': self.min_chars, 'keep_headings': self.keep_headings,
+                'n_docs': self.n_docs,
+                'doc_freq': hashlib.blake2b(self.doc_freq.table.tobytes(), digest_size=16).hexdigest()}
+
+    def report(self):
+        return (f"模板行过滤：{self.n_docs} 个文档，文档内重复删除 {self.removed['doc_repeats']} 行，"
+                f"跨文档高频删除 {self.removed['corpus_freq']} 行")
+
+
+def fit_boilerplate_filter(paths, **params):
+    """
+    构造 BoilerplateFilter 并在给定文件上完成第一遍统计。
+    """
+    boilerplate = BoilerplateFilter(**params).fit(paths)
+    print(f"模板行统计完成：{boilerplate.n_docs} 个文档。", file=sys.stderr)
+    return boilerplate
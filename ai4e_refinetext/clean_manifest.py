@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = '.clean_manifest.json'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    文件内容的 blake2b 摘要（十六进制），按块读取，不把整个文件读入内存。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_fingerprint(path):
+    """
+    输入文件的 {'size', 'mtime_ns', 'digest'}。先取 stat 再读内容：读取期间或之后文件被修改时，记录的修改时间早于修改，
+    下次运行能发现变化；反过来先读后 stat 会把读取之后的修改当作已处理。
+    """
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'digest': file_digest(path)}
+
+
+def config_digest(config):
+    """
+    把可 JSON 序列化的配置转成稳定的摘要，用作清洗规则版本。
+    """
+    text = json.dumps(config, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class CleanManifest:
+    """
+    增量清洗清单：保存在输出目录中，为每个输入文件记录大小、修改时间、内容摘要、清洗规则版本与输出文件名。
+
+    - 快速路径：大小与修改时间都未变且规则版本相同的文件直接跳过，不读取内容
+    - 大小或修改时间变了但内容摘要相同（例如重新拷贝）的文件同样跳过，只更新记录
+    - 输入已删除的记录连同其输出文件一起清理
+
+    参数说明：
+    - output_folder: 输出目录，清单文件为其中的 .clean_manifest.json
+    """
+
+    def __init__(self, output_folder):
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self.output_folder = output_folder
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get('files', {})
+            except (OSError, ValueError):
+                # 清单损坏时当作首次运行，全部重新清洗
+                self.entries = {}
+
+    def is_current(self, filename, input_path, version, output_name=None):
+        """
+        判断输入文件自上次清洗以来是否未变（且规则版本相同）；给出 output_name 时，上次的输出文件名不同（例如改了压缩方式）
+        也视为需要重新清洗。
+        """
+        entry = self.entries.get(filename)
+        if entry is None or entry['version'] != version:
+            return False
+        if output_name is not None and entry['output'] not in (None, output_name):
+            return False
+        if entry['output'] is not None and not os.path.exists(os.path.join(self.output_folder, entry['output'])):
+            # 输出被手动删除时重新生成
+            return False
+        st = os.stat(input_path)
+        if entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return True
+        if entry['size'] != st.st_size:
+            return False
+        digest = file_digest(input_path)
+        if digest != entry['digest']:
+            return False
+        entry['mtime_ns'] = st.st_mtime_ns
+        return True
+
+    def record(self, filename, input_path, version, output_name, fingerprint=None):
+        """
+        记录一次成功的清洗；output_name 为输出文件名，清洗后没有任何章节（未生成输出）时为 None。
+        fingerprint 为清洗前读取输入之前取得的 file_fingerprint，不给出时现取（只适用于记录期间输入不会变化的场合）。
+        输出文件名与上次不同时（例如改为压缩输出）删除上次的输出。
+        """
+        previous = self.entries.get(filename, {}).get('output')
+        if previous is not None and previous != output_name:
+            path = os.path.join(self.output_folder, previous)
+            if os.path.exists(path):
+                os.remove(path)
+        self.entries[filename] = dict(fingerprint or file_fingerprint(input_path), version=version, output=output_name)
+
+    def forget(self, filename):
+        self.entries.pop(filename, None)
+
+    def prune(self, live_filenames):
+        """
+        清理输入已不存在的记录，并删除不再被任何现存输入使用的输出文件。返回删除的输出文件名列表。
+        """
+        live_filenames = set(live_filenames)
+        stale = [name for name in self.entries if name not in live_filenames]
+        in_use = {entry['output'] for name, entry in self.entries.items() if name in live_filenames}
+        removed = []
+        for name in stale:
+            output = self.entries.pop(name)['output']
+            if output is None or output in in_use:
+                continue
+            path = os.path.join(self.output_folder, output)
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(output)
+        return removed
+
+    def save(self):
+        # 先写临时文件再原子替换，中途中断不会留下损坏的清单
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
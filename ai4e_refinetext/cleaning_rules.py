@@ -0,0 +1,197 @@
+import re
+from collections import Counter
+from .keyword_automaton import KeywordAutomaton
+
+_SCOPED_FLAGS = {re.IGNORECASE: 'i', re.MULTILINE: 'm', re.DOTALL: 's', re.VERBOSE: 'x'}
+
+
+class CleaningRule:
+    """
+    一条声明式清洗规则。
+
+    参数说明：
+    - name: 规则名称，用于命中计数
+    - pattern: 正则表达式
+    - replacement: 替换文本，drop_line 为 True 时不使用
+    - drop_line: 为 True 时匹配到的整行被删除，否则把匹配部分替换为 replacement
+    - flags: re 标志，只支持 IGNORECASE、MULTILINE、DOTALL、VERBOSE 的组合
+    - lowercase: 为 True 时在 line.lower() 上匹配（只用于删行规则，对应原来的 "xxx" in line.lower()）
+    - stage: 所属阶段；同一阶段的替换规则按声明顺序依次执行，阶段结束后按 STAGE_STRIP 决定是否去掉首尾空白
+    - gate: 可选的廉价预检正则，必须是 pattern 能匹配的必要条件（pattern 能匹配时 gate 一定能匹配）；
+      pattern 回溯开销大时用它快速排除不可能命中的行
+    """
+
+    def __init__(self, name, pattern, replacement="", drop_line=False, flags=0, lowercase=False, stage='markup',
+                 gate=None):
+        self.name = name
+        self.pattern = pattern
+        self.replacement = replacement
+        self.drop_line = drop_line
+        self.flags = flags
+        self.lowercase = lowercase
+        self.stage = stage
+        self.gate = gate
+        self.regex = re.compile(pattern, flags)
+        self.gate_regex = re.compile(gate, flags) if gate is not None else None
+
+    def config(self):
+        return {'name': self.name, 'pattern': self.pattern, 'replacement': self.replacement,
+                'drop_line': self.drop_line, 'flags': self.flags, 'lowercase': self.lowercase, 'stage': self.stage,
+                'gate': self.gate}
+
+    def scoped_gate(self):
+        # 带局部标志的非捕获组，便于与其它规则拼成一个交替表达式
+        pattern = self.pattern if self.gate is None else self.gate
+        inline = "".join(c for flag, c in _SCOPED_FLAGS.items() if self.flags & flag)
+        return f"(?{inline}:{pattern})" if inline else f"(?:{pattern})"
+
+
+# 各阶段依次对应原来的 clean_markdown、remove_specific_patterns、clean_references、remove_garbled_characters
+STAGES = ('markup', 'patterns', 'references', 'garbled')
+# 阶段结束后是否 strip 并丢弃空行（clean_markdown 只 rstrip，空行由下一阶段丢弃）
+STAGE_STRIP = {'markup': False, 'patterns': True, 'references': True, 'garbled': True}
+
+DEFAULT_RULES = [
+    CleaningRule('image', r"!\[", drop_line=True),
+    CleaningRule('link', r"\]\(", drop_line=True),
+    CleaningRule('bracket', r"\[.*?\]"),
+    CleaningRule('author_year', r"\b[A-Za-z\u4e00-\u9fa5]+(?:和[A-Za-z\u4e00-\u9fa5]+)?\s*[（(]\d{4}(?:，\d{4})*[）)]",
+                 gate=r"[（(]\d{4}"),
+    CleaningRule('table_cn', r"表\s?\d+-?\d*", stage='patterns'),
+    CleaningRule('figure_cn', r"图\s?\d+-?\d*", stage='patterns'),
+    CleaningRule('table_en', r"Table\s?\d+-?\d*", flags=re.IGNORECASE, stage='patterns'),
+    CleaningRule('figure_en', r"Figure\s?\d+-?\d*", flags=re.IGNORECASE, stage='patterns'),
+    CleaningRule('url', r"https?://\S+", stage='patterns'),
+    CleaningRule('xjtu_banner', r"西安交通大学XIANJIAOTONGUNIVERSITY", flags=re.IGNORECASE, stage='patterns'),
+    CleaningRule('et_al', r"\([A-Za-z\u4e00-\u9fa5]+\s+et\s+al\.,\s+\d{4}\)", stage='references'),
+    CleaningRule('numeric_citation', r"\[[0-9]+\]", stage='references'),
+    CleaningRule('garbled', r"[^\x20-\x7E\u4E00-\u9FA5]", stage='garbled'),
+    CleaningRule('replacement_char', r"�", stage='garbled'),
+]
+
+SKIP_SECTION_KEYWORDS = ["前言", "思考题", "参考文献", "ACKNOWLEDGEMENTS", "Conference Papers", "TABLE OF CONTENTS",
+                         "LIST OF FIGURES", " LIST OF TABLES", "Fundamental Concepts in Heterogeneous Catalysis",
+                         " 图书在版编目CIP数据", "例题", "Magnetism"]
+
+# 关键词检查共用一个自动机：(关键词, 标签, 是否忽略大小写)
+# - toc: 行中出现即进入目录
+# - drop_line: 行中出现（忽略大小写）即删除该行
+# - skip_section: 章节标题中出现即跳过整个章节
+DEFAULT_KEYWORDS = ([("目录", 'toc', False)]
+                    + [(k, 'drop_line', True) for k in ("copyright", "email", "www.")]
+                    + [(k, 'skip_section', False) for k in SKIP_SECTION_KEYWORDS])
+
+
+def _fuse(rules):
+    return re.compile("|".join(rule.scoped_gate() for rule in rules)) if rules else None
+
+
+class RuleEngine:
+    """
+    把清洗规则编译一次，对每行单次流式处理，输出与依次调用 clean_markdown、remove_specific_patterns、
+    clean_references、remove_garbled_characters 完全一致。
+
+    每个阶段的规则（有 gate 的用 gate）拼成一个交替表达式作为闸门：闸门在一行上没有匹配时该阶段的规则都不会改动这一行，
+    直接跳过；命中时再按声明顺序逐条替换（前一条替换可能产生新的匹配，逐条执行保证结果不变）。
+    关键词类检查（目录、删行关键词、跳过章节）由一个 KeywordAutomaton 对每行一次扫描完成，关键词数量增长时代价基本不变。
+    hits 记录每条规则改动或删除的行数，关键词删行计在关键词本身下，目录跳过的行计在 'toc' 下。
+
+    参数说明：
+    - rules: CleaningRule 列表，默认 DEFAULT_RULES
+    - keywords: KeywordAutomaton，默认由 DEFAULT_KEYWORDS 构造；可用 KeywordAutomaton.from_file 加载客户语料的屏蔽词表
+    """
+
+    def __init__(self, rules=None, keywords=None):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self.keywords = KeywordAutomaton(DEFAULT_KEYWORDS) if keywords is None else keywords
+        self.hits = Counter()
+        drop_rules = [r for r in self.rules if r.drop_line]
+        self._drop_rules = drop_rules
+        self._drop_gate = _fuse([r for r in drop_rules if not r.lowercase])
+        self._drop_gate_lower = _fuse([r for r in drop_rules if r.lowercase])
+        self._stages = []
+        for stage in STAGES:
+            subs = [r for r in self.rules if not r.drop_line and r.stage == stage]
+            self._stages.append((subs, _fuse(subs), STAGE_STRIP[stage]))
+
+    def _dropped_by(self, line):
+        lower = None
+        hit = self._drop_gate is not None and self._drop_gate.search(line)
+        if not hit and self._drop_gate_lower is not None:
+            lower = line.lower()
+            hit = self._drop_gate_lower.search(lower)
+        if not hit:
+            return None
+        if lower is None:
+            lower = line.lower()
+        for rule in self._drop_rules:
+            if rule.regex.search(lower if rule.lowercase else line):
+                return rule.name
+        return None
+
+    def clean_line(self, line, found=None):
+        """
+        对一行（已跳过目录）执行删行规则、删行关键词与各阶段替换，返回清洗后的行；被删除时返回 None。
+        found 为该行已算好的关键词匹配结果，为 None 时重新扫描。
+        """
+        dropped = self._dropped_by(line)
+        if dropped is None:
+            if found is None:
+                found = self.keywords.matches(line)
+            dropped = next((keyword for _, _, keyword, label in found if label == 'drop_line'), None)
+        if dropped is not None:
+            self.hits[dropped] += 1
+            return None
+        for subs, gate, strip in self._stages:
+            if gate is not None and gate.search(line):
+                for rule in subs:
+                    if rule.gate_regex is not None and not rule.gate_regex.search(line):
+                        continue
+                    line, n = rule.regex.subn(rule.replacement, line)
+                    if n:
+                        self.hits[rule.name] += 1
+            if strip:
+                line = line.strip()
+                if not line:
+                    return None
+        return line
+
+    def clean(self, lines):
+        """
+        逐行清洗的生成器：按原逻辑跳过目录（以 contents 开头或含 toc 关键词的行起，到空行或标题行止），
+        其余行交给 clean_line，产出非空结果。
+        """
+        is_in_toc = False
+        for line in lines:
+            line = line.rstrip()
+            found = self.keywords.matches(line)
+            if line.lower().startswith("contents") or any(label == 'toc' for _, _, _, label in found):
+                is_in_toc = True
+                self.hits['toc'] += 1
+                continue
+            if is_in_toc and (not line.strip() or line.startswith("#")):
+                is_in_toc = False
+            if is_in_toc:
+                self.hits['toc'] += 1
+                continue
+            line = self.clean_line(line, found)
+            if line is not None:
+                yield line
+
+    def config(self):
+        """
+        返回规则与关键词的可序列化描述，用于判断清洗规则是否变化。
+        """
+        return {'rules': [rule.config() for rule in self.rules], 'keywords': self.keywords.entries}
+
+    def skip_section(self, title):
+        """
+        章节标题中是否出现 skip_section 关键词。
+        """
+        return any(label == 'skip_section' for _, _, _, label in self.keywords.matches(title))
+
+    def report(self):
+        """
+        返回按命中次数降序排列的 [(规则名, 命中行数), ...]。
+        """
+        return self.hits.most_common()
@@ -0,0 +1,189 @@
+import bz2
+import gzip
+import hashlib
+import io
+import re
+
+# 压缩方式对应的文件后缀
+SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst', 'bz2': '.bz2'}
+# 按文件头识别压缩格式，不依赖文件名。bz2 的 "BZh" 之后必须是块大小数字 1-9，再接第一个块的魔数 1AY&SY
+# （π 的 BCD 码）或空流的结束标记（√π），以 "BZh" 开头的普通文本不会被误认
+MAGIC = ((re.compile(rb'\x1f\x8b'), 'gzip'), (re.compile(rb'\x28\xb5\x2f\xfd'), 'zstd'),
+         (re.compile(rb'BZh[1-9](?:1AY&SY|\x17rE8P\x90)'), 'bz2'))
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd 压缩需要安装 zstandard：pip install zstandard") from None
+    return zstandard
+
+
+class HashingWriter:
+    """
+    包装二进制文件对象：写入时同时计算 sha256 与字节数，写完即得到落盘内容的校验和，无需再读一遍。
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+    def close(self):
+        self.raw.close()
+
+
+def open_compressed_writer(raw, compression=None, level=None):
+    """
+    在二进制文件对象 raw 上打开（压缩的）写入流，关闭返回的流不会关闭 raw。
+
+    参数说明：
+    - compression: None、'gzip'、'bz2' 或 'zstd'（需要 zstandard）
+    - level: 压缩级别，None 时使用各自的默认值
+    """
+    if compression is None:
+        return _Unclosing(raw)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6 if level is None else level, mtime=0)
+    if compression == 'bz2':
+        return bz2.BZ2File(raw, mode='wb', compresslevel=9 if level is None else level)
+    if compression == 'zstd':
+        zstandard = _zstandard()
+        return zstandard.ZstdCompressor(level=3 if level is None else level).stream_writer(raw, closefd=False)
+    raise ValueError(f"未知的压缩方式: {compression}，可选 {sorted(k for k in SUFFIXES if k)}")
+
+
+def open_compressed(path, compression=None):
+    """
+    以二进制方式读取按 compression 压缩的文件，返回解压后的字节流。
+    """
+    if compression is None:
+        return open(path, 'rb')
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(path, 'rb')
+    if compression == 'zstd':
+        zstandard = _zstandard()
+        # 套一层 BufferedReader 以支持按行迭代
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    raise ValueError(f"未知的压缩方式: {compression}，可选 {sorted(k for k in SUFFIXES if k)}")
+
+
+class _Unclosing:
+    # 不压缩时直接写 raw，close 只刷新，与压缩流的行为一致
+    def __init__(self, raw):
+        self.raw = raw
+
+    def write(self, data):
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+    def close(self):
+        self.raw.flush()
+
+
+def detect_compression(path):
+    """
+    根据文件头（magic bytes）判断压缩格式，返回 'gzip'、'zstd'、'bz2' 或 None（未压缩）。
+    """
+    with open(path, 'rb') as f:
+        head = f.read(10)
+    for magic, compression in MAGIC:
+        if magic.match(head):
+            return compression
+    return None
+
+
+def compression_from_name(path):
+    """
+    根据文件名后缀判断压缩格式，用于决定输出是否压缩。
+    """
+    for compression, suffix in SUFFIXES.items():
+        if compression and path.endswith(suffix):
+            return compression
+    return None
+
+
+def strip_compression_suffix(name):
+    compression = compression_from_name(name)
+    return name[:-len(SUFFIXES[compression])] if compression else name
+
+
+def open_input(path, mode='r', encoding='utf-8', errors=None):
+    """
+    打开输入文件，按文件头自动识别 gzip / zstd / bz2 并流式解压，调用方按普通文件逐行读取即可，
+    无需先解压到临时目录。mode 为 'r'（文本）或 'rb'（二进制）；未压缩的文件直接以普通方式打开。
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, mode, encoding=encoding, errors=errors) if 'b' not in mode else open(path, 'rb')
+    stream = open_compressed(path, compression)
+    return stream if 'b' in mode else io.TextIOWrapper(stream, encoding=encoding, errors=errors)
+
+
+class CountingWriter(io.BufferedIOBase):
+    """
+    压缩输出的二进制写入流：tell() 返回已写入的未压缩字节数，与写普通文件时的偏移一致；关闭时一并关闭底层文件。
+    """
+
+    def __init__(self, raw, stream):
+        super().__init__()
+        self.raw = raw
+        self.stream = stream
+        self.bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.bytes += len(data)
+        self.stream.write(data)
+        return len(data)
+
+    def tell(self):
+        return self.bytes
+
+    def flush(self):
+        if not self.closed:
+            self.stream.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()
+            self.stream.close()
+        finally:
+            self.raw.close()
+
+
+def open_output(path, mode='w', compression='auto', encoding='utf-8', level=None, newline='\n'):
+    """
+    打开输出文件，按 compression 边写边压缩。compression 为 'auto' 时由文件名后缀（.gz / .zst / .bz2）决定，
+    为 None 时不压缩。mode 为 'w'（文本）或 'wb'（二进制）。
+    文本模式默认按 newline='\n' 写出，不把 "\n" 转换为平台换行符：Windows 上写出的字节与 POSIX 相同，
+    allin 按字节合并清洗结果时不会混入 "\r\n"。
+    """
+    if compression == 'auto':
+        compression = compression_from_name(path)
+    if compression is None:
+        return open(path, mode, encoding=encoding, newline=newline) if 'b' not in mode else open(path, 'wb')
+    raw = open(path, 'wb')
+    try:
+        stream = CountingWriter(raw, open_compressed_writer(raw, compression, level))
+    except BaseException:
+        raw.close()
+        raise
+    return stream if 'b' in mode else io.TextIOWrapper(stream, encoding=encoding, newline=newline)
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+import numpy as np
+from .embedding_cache import _FileLock
+from .embedding_store import EmbeddingStore
+from .similarity_index import build_index, restore_index
+
+MANIFEST_NAME = 'manifest.json'
+VECTORS_NAME = 'vectors.f32'
+
+
+class CorpusIndex:
+    """
+    跨运行持久化的语料相似度索引：新数据只需与已发布语料的索引比较，保留的行追加进索引后再原子保存。
+
+    目录结构：
+    - vectors.f32: 只追加的 np.memmap 向量文件，新运行直接在文件尾部追加，不重写已有数据
+    - delta-<代数>.npz: 该代新增的、除向量外的索引状态（IVF 新分入各桶的编号、HNSW 新节点与邻居表被改动节点的邻接表、
+      量化码等），大小与该代新增的数据成正比，不重写已有状态
+    - manifest.json: 当前代数、有效向量条数、按顺序排列的各代状态文件、模型与索引参数以及历次运行记录；
+      每次保存先写新状态文件，最后用 os.replace 原子替换 manifest，中途中断时仍指向上一代完整数据
+    加载时按顺序回放全部状态文件，耗时与语料规模成正比；保存只写本代的变化。
+
+    参数说明：
+    - index_dir: 索引目录
+    - model_name: 模型名称，与已有索引不一致时报错
+    - dim: 向量维度
+    - index_type: 新建索引时使用的索引类型，已有索引沿用其记录的类型
+    - index_params: 新建索引时传给索引构造函数的参数
+    """
+
+    def __init__(self, index_dir, model_name, dim, index_type='flat', index_params=None):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        # 同一索引目录同时只允许一个运行写入
+        self._lock = _FileLock(os.path.join(index_dir, '.lock'))
+        self._lock.__enter__()
+        try:
+            self.manifest = self._load_manifest()
+            vectors_path = os.path.join(index_dir, VECTORS_NAME)
+            if self.manifest is None:
+                self.manifest = {
+                    'model_name': model_name,
+                    'dim': dim,
+                    'index_type': index_type,
+                    'index_params': dict(index_params or {}),
+                    'count': 0,
+                    'generation': 0,
+                    'state_files': [],
+                    'runs': [],
+                }
+                self.index = build_index(index_type, dim, store_path=vectors_path, **self.manifest['index_params'])
+            else:
+                if self.manifest['model_name'] != model_name or self.manifest['dim'] != dim:
+                    raise ValueError(f"索引目录 {index_dir} 由模型 {self.manifest['model_name']}"
+                                     f"（{self.manifest['dim']} 维）构建，与当前模型 {model_name}（{dim} 维）不一致")
+                vectors = EmbeddingStore.open(vectors_path, dim, self.manifest['count'])
+                # 旧版本的索引目录只有一个完整状态文件，等同于空索引上的第一份变化
+                old_state = self.manifest.pop('state_file', None)
+                self.manifest.setdefault('state_files', [old_state] if old_state else [])
+                self.index = restore_index(self.manifest['index_type'], dim, vectors, self._iter_deltas(),
+                                           **self.manifest['index_params'])
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self.index)
+
+    def _iter_deltas(self):
+        for state_file in self.manifest['state_files']:
+            with np.load(os.path.join(self.index_dir, state_file)) as npz:
+                yield dict(npz)
+
+    def _load_manifest(self):
+        path = os.path.join(self.index_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def commit(self, **run_info):
+        """
+        原子保存本次运行对索引的改动（只写新增部分），并在 manifest 中追加一条运行记录。
+        """
+        generation = self.manifest['generation'] + 1
+        delta = self.index.get_delta()
+        state_files = list(self.manifest['state_files'])
+        if delta:
+            state_file = f'delta-{generation:06d}.npz'
+            tmp_state = os.path.join(self.index_dir, state_file + '.tmp')
+            with open(tmp_state, 'wb') as f:
+                np.savez(f, **delta)
+            os.replace(tmp_state, os.path.join(self.index_dir, state_file))
+            state_files.append(state_file)
+        self.index._vectors.flush()
+
+        run_info.update(added=len(self.index) - self.manifest['count'], time=time.strftime('%Y-%m-%d %H:%M:%S'))
+        self.manifest.update(count=len(self.index), generation=generation, state_files=state_files)
+        self.manifest['runs'].append(run_info)
+        tmp_manifest = os.path.join(self.index_dir, MANIFEST_NAME + '.tmp')
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_manifest, os.path.join(self.index_dir, MANIFEST_NAME))
+        self.index.clear_delta()
+
+    def close(self):
+        if self._lock is not None:
+            self._lock.__exit__(None, None, None)
+            self._lock = None
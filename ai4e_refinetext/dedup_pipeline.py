@@ -0,0 +1,129 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_END = object()
+
+
+class DedupPipeline:
+    """
+    读取 → 编码 → 检索 → 写出 四个阶段的生产者/消费者流水线，阶段之间用有界队列连接。
+
+    - 读取线程：读文件、过滤并组批，放入 read 队列
+    - 分发线程：把批次提交给编码线程池，按提交顺序把 (批次, future) 放入 encode 队列
+    - 检索（调用线程）：按顺序取出编码结果，检索并更新索引，把保留的行放入 write 队列
+    - 写出线程：写输出文件
+
+    检索严格按批次顺序执行，结果与串行处理完全一致；编码与检索、读写相互重叠。
+    任一阶段出错时其余阶段停止，异常在 run() 中重新抛出。
+
+    参数说明：
+    - batches: 产生文本批次的可迭代对象（在读取线程中迭代）
+    - encode_fn: encode_fn(batch) -> 嵌入矩阵，在线程池中执行
+    - search_fn: search_fn(batch, embs) -> 需要写出的结果，按顺序在调用线程中执行
+    - write_fn: write_fn(result)，在写出线程中执行
+    - encode_workers: 编码线程数
+    - queue_size: 每个队列的最大长度（批次数）
+    """
+
+    def __init__(self, batches, encode_fn, search_fn, write_fn, encode_workers=1, queue_size=4):
+        self.batches = batches
+        self.encode_fn = encode_fn
+        self.search_fn = search_fn
+        self.write_fn = write_fn
+        self.encode_workers = encode_workers
+        self._queues = {
+            'read': queue.Queue(maxsize=queue_size),
+            'encode': queue.Queue(maxsize=queue_size),
+            'write': queue.Queue(maxsize=queue_size),
+        }
+        self._stop = threading.Event()
+        self._errors = []
+
+    def queue_depths(self):
+        """
+        返回各阶段输入队列当前的长度，用于观察瓶颈所在。
+        """
+        return {name: q.qsize() for name, q in self._queues.items()}
+
+    def _put(self, name, item):
+        # 带超时轮询，出错停止时不会永久阻塞在满队列上
+        while not self._stop.is_set():
+            try:
+                self._queues[name].put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, name):
+        while True:
+            try:
+                return self._queues[name].get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
+
+    def _guard(self, target):
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                self._errors.append(e)
+                self._stop.set()
+        return run
+
+    def _read(self):
+        for batch in self.batches:
+            if not self._put('read', batch):
+                return
+        self._put('read', _END)
+
+    def _dispatch(self, pool):
+        while True:
+            batch = self._get('read')
+            if batch is _END:
+                break
+            if not self._put('encode', (batch, pool.submit(self.encode_fn, batch))):
+                return
+        self._put('encode', _END)
+
+    def _write(self):
+        while True:
+            result = self._get('write')
+            if result is _END:
+                break
+            self.write_fn(result)
+
+    def run(self, on_batch=None):
+        """
+        运行流水线直至输入耗尽；on_batch(batch) 在每批检索完成后回调（例如更新进度条）。
+        """
+        with ThreadPoolExecutor(max_workers=self.encode_workers) as pool:
+            threads = [
+                threading.Thread(target=self._guard(self._read), name='dedup-read', daemon=True),
+                threading.Thread(target=self._guard(lambda: self._dispatch(pool)), name='dedup-dispatch',
+                                 daemon=True),
+                threading.Thread(target=self._guard(self._write), name='dedup-write', daemon=True),
+            ]
+            for t in threads:
+                t.start()
+            try:
+                while True:
+                    item = self._get('encode')
+                    if item is _END:
+                        break
+                    batch, future = item
+                    result = self.search_fn(batch, future.result())
+                    if not self._put('write', result):
+                        break
+                    if on_batch is not None:
+                        on_batch(batch)
+                self._put('write', _END)
+            except BaseException as e:
+                self._errors.append(e)
+                self._stop.set()
+            for t in threads:
+                t.join()
+        if self._errors:
+            raise self._errors[0]
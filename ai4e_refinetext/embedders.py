@@ -0,0 +1,138 @@
+import numpy as np
+from .batching import encode_bucketed, token_lengths
+from .prefilter import normalize_text
+
+
+class BucketedEncoder:
+    """
+    包装 SentenceTransformer：按 token 长度分桶、按 token 预算动态组批后编码，结果还原为原始顺序。
+    token_budget 为 None 时直接调用 model.encode。
+    """
+
+    def __init__(self, model, token_budget=16384, max_batch_size=256):
+        self.model = model
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+
+    def encode(self, lines, convert_to_numpy=True):
+        if self.token_budget is None:
+            return self.model.encode(lines, convert_to_numpy=convert_to_numpy)
+        return encode_bucketed(lines,
+                               lambda batch: self.model.encode(batch, batch_size=len(batch),
+                                                               convert_to_numpy=convert_to_numpy),
+                               token_lengths(lines, self.model), self.token_budget, self.max_batch_size)
+
+
+class SentenceTransformerEmbedder:
+    """
+    Sentence-BERT 嵌入后端，模型只在构造时加载一次。
+
+    参数说明：
+    - model_name: SentenceTransformer 可加载的模型名称
+    - device: 运行设备，例如 'cpu'、'cuda'；为 None 时自动选择
+    - token_budget: 按 token 长度分桶组批时每批的 token 上限，为 None 时按原顺序整批编码
+    - max_batch_size: 分桶组批时每批的最大行数
+    """
+
+    def __init__(self, model_name='sentence-transformers/all-MiniLM-L6-v2', device=None, token_budget=16384,
+                 max_batch_size=256):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self._encoder = BucketedEncoder(self.model, token_budget, max_batch_size)
+
+    def encode(self, lines):
+        return np.asarray(self._encoder.encode(list(lines)), dtype=np.float32)
+
+
+class HashingEmbedder:
+    """
+    不需要下载模型权重的 CPU 嵌入后端：对归一化文本的字符 n-gram 做带符号的特征哈希（hashing trick），
+    词频取对数，可选用 fit() 在样本上估计的 IDF 加权（即哈希版 TF-IDF），最后 L2 归一化。
+    适合做快速的粗去重，以及在测试、基准中代替 Sentence-BERT。
+
+    参数说明：
+    - dim: 哈希空间维度
+    - ngram_range: 字符 n-gram 的 (最小, 最大) 长度
+    - seed: 哈希种子，不同种子得到不同的特征映射
+    """
+
+    def __init__(self, dim=1024, ngram_range=(1, 3), seed=0):
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+        self.seed = seed
+        self.idf = None
+
+    @property
+    def name(self):
+        # 作为缓存与持久化索引的模型标识，参数或 IDF 不同的嵌入互不混用
+        name = f"hashing-{self.dim}-{self.ngram_range[0]}-{self.ngram_range[1]}-{self.seed}"
+        return name + "-idf" if self.idf is not None else name
+
+    def _features(self, text):
+        codes = np.frombuffer(normalize_text(text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        hashes = []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            if len(codes) < n:
+                break
+            h = np.full(len(codes) - n + 1, self.seed * 0x9E3779B1 + n, dtype=np.uint64)
+            for k in range(n):
+                h = h * np.uint64(1000003) + codes[k:len(codes) - n + 1 + k]
+            # splitmix64 风格的混合，使低位与高位都充分随机
+            h ^= h >> np.uint64(30)
+            h *= np.uint64(0xBF58476D1CE4E5B9)
+            hashes.append(h ^ (h >> np.uint64(31)))
+        if not hashes:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        h = np.concatenate(hashes)
+        buckets = (h % np.uint64(self.dim)).astype(np.int64)
+        signs = np.where((h >> np.uint64(63)) & np.uint64(1), -1.0, 1.0).astype(np.float32)
+        return buckets, signs
+
+    def fit(self, lines):
+        """
+        在样本行上估计每个哈希桶的 IDF，之后 encode 使用 TF-IDF 权重。返回自身。
+        """
+        df = np.zeros(self.dim, dtype=np.float64)
+        n_docs = 0
+        for text in lines:
+            buckets, _ = self._features(text)
+            df[np.unique(buckets)] += 1
+            n_docs += 1
+        self.idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def encode(self, lines):
+        out = np.zeros((len(lines), self.dim), dtype=np.float32)
+        for i, text in enumerate(lines):
+            buckets, signs = self._features(text)
+            if len(buckets):
+                counts = np.bincount(buckets, weights=signs, minlength=self.dim)
+                out[i] = np.sign(counts) * np.log1p(np.abs(counts))
+        if self.idf is not None:
+            out *= self.idf
+        norms = np.linalg.norm(out, axis=1)
+        # 没有任何 n-gram 的行（如纯标点）统一映射到同一个单位向量
+        out[norms == 0, 0] = 1.0
+        norms[norms == 0] = 1.0
+        return out / norms[:, None]
+
+
+EMBEDDERS = {
+    'sentence-transformers': SentenceTransformerEmbedder,
+    'hashing': HashingEmbedder,
+}
+
+
+def build_embedder(backend='sentence-transformers', **params):
+    """
+    按名称构造嵌入后端：'sentence-transformers' 或 'hashing'。
+    所有后端都提供 name、dim 属性与 encode(lines) -> float32 矩阵。
+    """
+    try:
+        embedder_cls = EMBEDDERS[backend]
+    except KeyError:
+        raise ValueError(f"未知的嵌入后端: {backend}，可选 {sorted(EMBEDDERS)}")
+    return embedder_cls(**params)
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_INDEX_DTYPE = np.dtype([('key', '<u8'), ('slot', '<i8'), ('tick', '<i8')])
+
+
+class _FileLock:
+    """
+    基于锁文件的进程间锁：POSIX 下支持共享/独占，Windows 下统一为独占。
+    """
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+def cache_key(text, model_name=''):
+    """
+    缓存键：(模型名, 文本) 的 8 字节 blake2b 摘要（uint64）。
+    文本为送入嵌入模型的原文（已去除首尾空白），不做归一化：只有编码结果必然相同的行才共用缓存条目。
+    """
+    data = model_name.encode('utf-8') + b'\0' + text.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+class EmbeddingCache:
+    """
+    按 (模型名, 文本哈希) 寻址的磁盘嵌入缓存，重跑时只编码缓存中没有的行。
+
+    每个模型一个子目录，内含：
+    - vectors.f32: np.memmap 向量文件，按槽位存放，容量倍增直到 max_entries
+    - index.npy: 按键排序的 (key, slot, tick) 紧凑索引，tick 为最近使用时间，用于 LRU 淘汰
+    - .lock: 进程间锁文件；读取持共享锁，写回持独占锁，索引通过临时文件 + os.replace 原子替换，
+      同一台机器上的多个去重任务可以共享一个缓存目录
+
+    参数说明：
+    - cache_dir: 缓存根目录
+    - model_name: 模型名称
+    - dim: 向量维度
+    - max_entries: 缓存条目上限，超出时淘汰最久未使用的条目
+    - flush_every: 新增条目或待写回的最近使用记录积累到多少条时写回磁盘
+    """
+
+    def __init__(self, cache_dir, model_name, dim, max_entries=1_000_000, flush_every=8192):
+        safe_name = re.sub(r'[^\w.-]+', '_', model_name)
+        digest = hashlib.blake2b(model_name.encode('utf-8'), digest_size=4).hexdigest()
+        self.path = os.path.join(cache_dir, f"{safe_name}-{digest}")
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._vectors_path = os.path.join(self.path, 'vectors.f32')
+        self._index_path = os.path.join(self.path, 'index.npy')
+        self._lock_path = os.path.join(self.path, '.lock')
+        self._index = np.empty(0, dtype=_INDEX_DTYPE)
+        self._index_stamp = None
+        self._pending = {}
+        self._touched = {}
+        # 流水线中多个编码线程可能同时访问同一缓存
+        self._thread_lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+        with _FileLock(self._lock_path):
+            meta_path = os.path.join(self.path, 'meta.json')
+            if os.path.exists(meta_path):
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if meta['dim'] != dim:
+                    raise ValueError(f"缓存目录 {self.path} 的向量维度为 {meta['dim']}，与模型维度 {dim} 不一致")
+            else:
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({'model_name': model_name, 'dim': dim}, f, ensure_ascii=False)
+                open(self._vectors_path, 'ab').close()
+
+    def __len__(self):
+        self._reload_index()
+        return len(self._index)
+
+    def _reload_index(self):
+        try:
+            st = os.stat(self._index_path)
+        except FileNotFoundError:
+            return
+        # 索引总是整体替换为新文件，(mtime, inode, 大小) 任一变化即说明其他进程已写回
+        stamp = (st.st_mtime_ns, st.st_ino, st.st_size)
+        if stamp != self._index_stamp:
+            self._index = np.load(self._index_path)
+            self._index_stamp = stamp
+
+    def _open_vectors(self, mode='r'):
+        rows = os.path.getsize(self._vectors_path) // (self.dim * 4)
+        if rows == 0:
+            return None
+        return np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(rows, self.dim))
+
+    def _lookup(self, keys):
+        pos = np.searchsorted(self._index['key'], keys)
+        pos = np.minimum(pos, max(len(self._index) - 1, 0))
+        found = np.zeros(len(keys), dtype=bool)
+        if len(self._index):
+            found = self._index['key'][pos] == keys
+        return found, pos
+
+    def get_many(self, keys):
+        """
+        批量查询，返回 (命中掩码, 向量矩阵)，未命中的行为 0。
+        """
+        with self._thread_lock:
+            return self._get_many(np.asarray(keys, dtype=np.uint64))
+
+    def _get_many(self, keys):
+        vectors = np.zeros((len(keys), self.dim), dtype=np.float32)
+        with _FileLock(self._lock_path, shared=True):
+            self._reload_index()
+            found, pos = self._lookup(keys)
+            if found.any():
+                # 在锁内拷贝出来，避免其他进程淘汰并覆盖同一槽位
+                vectors[found] = self._open_vectors()[self._index['slot'][pos[found]]]
+        for i in np.flatnonzero(~found):
+            pending = self._pending.get(int(keys[i]))
+            if pending is not None:
+                vectors[i] = pending
+                found[i] = True
+        now = time.time_ns()
+        for key in keys[found].tolist():
+            self._touched[key] = now
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        # 全部命中的重跑不会产生新条目，最近使用记录也按 flush_every 写回，内存占用不随不同行数增长
+        if len(self._touched) >= self.flush_every:
+            self._flush()
+        return found, vectors
+
+    def put_many(self, keys, vectors):
+        with self._thread_lock:
+            for key, vec in zip(np.asarray(keys, dtype=np.uint64).tolist(), np.asarray(vectors, dtype=np.float32)):
+                self._pending[key] = vec
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        """
+        在独占锁内合并其他进程的更新，写入新向量、刷新最近使用时间并按 LRU 淘汰，然后原子替换索引。
+        """
+        with self._thread_lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending and not self._touched:
+            return
+        with _FileLock(self._lock_path):
+            self._index_stamp = None
+            self._reload_index()
+            index = self._index.copy()
+            if self._touched:
+                touched_keys = np.fromiter(self._touched.keys(), dtype=np.uint64, count=len(self._touched))
+                touched_ticks = np.fromiter(self._touched.values(), dtype=np.int64, count=len(self._touched))
+                found, pos = self._lookup(touched_keys)
+                index['tick'][pos[found]] = np.maximum(index['tick'][pos[found]], touched_ticks[found])
+            new_keys = np.fromiter(self._pending.keys(), dtype=np.uint64, count=len(self._pending))
+            found, _ = self._lookup(new_keys)
+            new_keys = new_keys[~found][:self.max_entries]
+            if len(new_keys):
+                # 超出上限时淘汰最久未使用的条目，释放其槽位
+                overflow = len(index) + len(new_keys) - self.max_entries
+                if overflow > 0:
+                    keep = np.sort(np.argsort(index['tick'], kind='stable')[overflow:])
+                    index = index[keep]
+                slots = self._allocate_slots(index['slot'], len(new_keys))
+                vectors = self._open_vectors('r+')
+                vectors[slots] = np.stack([self._pending[k] for k in new_keys.tolist()])
+                vectors.flush()
+                added = np.empty(len(new_keys), dtype=_INDEX_DTYPE)
+                added['key'], added['slot'], added['tick'] = new_keys, slots, time.time_ns()
+                index = np.concatenate([index, added])
+                index = index[np.argsort(index['key'], kind='stable')]
+            tmp_path = self._index_path + f'.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, index)
+            os.replace(tmp_path, self._index_path)
+            self._index_stamp = None
+            self._reload_index()
+        self._pending.clear()
+        self._touched.clear()
+
+    def _allocate_slots(self, used_slots, n):
+        rows = os.path.getsize(self._vectors_path) // (self.dim * 4)
+        need = len(used_slots) + n
+        if need > rows:
+            rows = min(max(need, 2 * rows), self.max_entries)
+            with open(self._vectors_path, 'r+b') as f:
+                f.truncate(rows * self.dim * 4)
+        used = np.zeros(rows, dtype=bool)
+        used[used_slots] = True
+        return np.flatnonzero(~used)[:n]
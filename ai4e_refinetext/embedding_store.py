@@ -0,0 +1,93 @@
+import os
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    连续、按容量倍增的二维向量矩阵，可选用 np.memmap 存放在磁盘上。
+
+    追加时不会重建整个列表，view() 返回的是底层矩阵的切片而不是拷贝；
+    使用磁盘存储时扩容只需截断文件并重新映射，常驻内存由操作系统页缓存管理，不随语料规模增长。
+
+    参数说明：
+    - dim: 每行的列数（向量维度）
+    - dtype: 元素类型
+    - path: 磁盘存储文件路径，为 None 时存放在内存中；文件已存在时会被覆盖
+    - initial_capacity: 初始容量（行数）
+    """
+
+    def __init__(self, dim, dtype=np.float32, path=None, initial_capacity=1024):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self._size = 0
+        self._data = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'wb'):
+                pass
+        self._allocate(initial_capacity)
+
+    @classmethod
+    def open(cls, path, dim, size, dtype=np.float32):
+        """
+        重新打开已有的磁盘存储：前 size 行视为有效数据，之后的行（例如中断运行留下的）会被后续追加覆盖。
+        """
+        store = cls.__new__(cls)
+        store.dim = dim
+        store.dtype = np.dtype(dtype)
+        store.path = path
+        store._size = size
+        store._data = None
+        rows = os.path.getsize(path) // (dim * store.dtype.itemsize)
+        store._allocate(max(rows, size, 1))
+        return store
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    @property
+    def nbytes(self):
+        return self._size * self.dim * self.dtype.itemsize
+
+    def _allocate(self, capacity):
+        if self.path is None:
+            data = np.empty((capacity, self.dim), dtype=self.dtype)
+            if self._data is not None:
+                data[:self._size] = self._data[:self._size]
+            self._data = data
+            return
+        # 磁盘存储：先释放旧映射，再扩展文件并重新映射，已有数据原地保留
+        if self._data is not None:
+            self._data.flush()
+            self._data = None
+        with open(self.path, 'r+b') as f:
+            f.truncate(capacity * self.dim * self.dtype.itemsize)
+        self._data = np.memmap(self.path, dtype=self.dtype, mode='r+', shape=(capacity, self.dim))
+
+    def append(self, rows):
+        """
+        追加若干行，返回第一行的编号。
+        """
+        rows = np.asarray(rows, dtype=self.dtype).reshape(-1, self.dim)
+        start = self._size
+        need = start + len(rows)
+        if need > self.capacity:
+            self._allocate(max(need, 2 * self.capacity))
+        self._data[start:need] = rows
+        self._size = need
+        return start
+
+    def view(self):
+        """
+        返回已写入部分的视图（不拷贝）。扩容后旧视图失效，不要跨 append 持有。
+        """
+        return self._data[:self._size]
+
+    def flush(self):
+        if isinstance(self._data, np.memmap):
+            self._data.flush()
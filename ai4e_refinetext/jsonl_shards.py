@@ -0,0 +1,139 @@
+import json
+import os
+import re
+from .compression import SUFFIXES, HashingWriter, open_compressed, open_compressed_writer
+
+
+def manifest_path(output_folder, prefix='part'):
+    return os.path.join(output_folder, f"{prefix}.manifest.json")
+
+
+class JsonlShardWriter:
+    """
+    流式 JSONL 分片写出器：每条记录立即编码写出（可边写边压缩），当前分片达到 max_bytes（未压缩字节数）
+    或 max_records 条时滚动到下一个分片（单条记录超过 max_bytes 时独占一个分片），内存占用与数据量无关。
+    关闭时写出分片清单 <prefix>.manifest.json：每个分片的文件名、记录数、未压缩字节数、落盘字节数与 sha256，
+    按顺序排列的 [来源文件, 记录数]（可据此把分片内每条记录对应回来源），以及处理出错的文件。清单最后原子写出，存在清单即表示全部分片已完整写完。
+    关闭时同时删除同一前缀下以前运行留下、本次没有写出的分片。
+
+    参数说明：
+    - output_folder: 输出目录
+    - prefix: 分片文件名前缀，分片为 <prefix>-00000.jsonl[.gz|.zst|.bz2]
+    - max_bytes: 单个分片的最大未压缩字节数，为 None 时不按大小滚动
+    - max_records: 单个分片的最大记录数，为 None 时不按记录数滚动
+    - compression: None、'gzip'、'bz2' 或 'zstd'（需要 zstandard）
+    - level: 压缩级别，None 时使用默认值
+    """
+
+    def __init__(self, output_folder, prefix='part', max_bytes=256 << 20, max_records=None, compression='gzip',
+                 level=None):
+        if compression not in SUFFIXES:
+            raise ValueError(f"未知的压缩方式: {compression}，可选 {sorted(k for k in SUFFIXES if k)}")
+        os.makedirs(output_folder, exist_ok=True)
+        self.output_folder = output_folder
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.compression = compression
+        self.level = level
+        self.shards = []
+        self.errors = {}
+        # 附加写入清单的说明信息（例如打乱的种子与权重）
+        self.info = {}
+        self._raw = None
+        self._stream = None
+        self._current = None
+
+    def _open_shard(self):
+        name = f"{self.prefix}-{len(self.shards):05d}.jsonl{SUFFIXES[self.compression]}"
+        self._raw = HashingWriter(open(os.path.join(self.output_folder, name), 'wb', buffering=1 << 20))
+        self._stream = open_compressed_writer(self._raw, self.compression, self.level)
+        self._current = {'file': name, 'records': 0, 'bytes': 0, 'sources': []}
+
+    def _close_shard(self):
+        if self._current is None:
+            return
+        self._stream.close()
+        self._raw.close()
+        self._current['stored_bytes'] = self._raw.bytes
+        self._current['sha256'] = self._raw.sha256.hexdigest()
+        self.shards.append(self._current)
+        self._raw = self._stream = self._current = None
+
+    def write(self, record, source=None):
+        """
+        写出一条记录；source 为记录的来源文件名，计入所在分片的 sources。
+        """
+        self.write_line((json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8'), source)
+
+    def write_line(self, data, source=None):
+        """
+        写出一行已编码的 JSONL（以换行结尾的 UTF-8 字节），用于原样搬运记录而不重新解析。
+        """
+        current = self._current
+        if current is not None and current['records'] and (
+                (self.max_records is not None and current['records'] >= self.max_records)
+                or (self.max_bytes is not None and current['bytes'] + len(data) > self.max_bytes)):
+            self._close_shard()
+        if self._current is None:
+            self._open_shard()
+        self._stream.write(data)
+        self._current['records'] += 1
+        self._current['bytes'] += len(data)
+        sources = self._current['sources']
+        if sources and sources[-1][0] == source:
+            sources[-1][1] += 1
+        else:
+            sources.append([source, 1])
+
+    def add_error(self, source, error):
+        self.errors[source] = error
+
+    @property
+    def records(self):
+        return sum(s['records'] for s in self.shards) + (self._current['records'] if self._current else 0)
+
+    def _remove_stale_shards(self):
+        # 删除同一前缀下本次没有写出的分片（例如上次运行分片更多或压缩方式不同），避免下游按文件名匹配时读到旧数据
+        current = {shard['file'] for shard in self.shards}
+        suffixes = "|".join(re.escape(suffix) for suffix in SUFFIXES.values() if suffix)
+        pattern = re.compile(re.escape(self.prefix) + rf"-\d{{5}}\.jsonl({suffixes})?")
+        for name in os.listdir(self.output_folder):
+            if pattern.fullmatch(name) and name not in current:
+                os.remove(os.path.join(self.output_folder, name))
+
+    def close(self):
+        self._close_shard()
+        self._remove_stale_shards()
+        manifest = {'compression': self.compression, 'records': self.records, 'shards': self.shards,
+                    'errors': self.errors}
+        if self.info:
+            manifest['info'] = self.info
+        path = manifest_path(self.output_folder, self.prefix)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(path + '.tmp', path)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # 异常中断时只关闭当前分片，不写清单，避免把不完整的输出标记为完成
+            self._close_shard()
+        return False
+
+
+def iter_shard_records(output_folder, prefix='part'):
+    """
+    按清单顺序逐条读取 JsonlShardWriter 写出的记录。
+    """
+    with open(manifest_path(output_folder, prefix), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    for shard in manifest['shards']:
+        with open_compressed(os.path.join(output_folder, shard['file']), manifest['compression']) as f:
+            for line in f:
+                yield json.loads(line)
@@ -0,0 +1,159 @@
+import re
+from collections import deque
+
+# 首字符种类不超过该值时用前缀树正则做整行闸门（sre 依次尝试顶层分支，分支多时反而变慢）
+GATE_MAX_BRANCHES = 32
+
+
+def _trie_pattern(node):
+    # 把前缀树转成正则，公共前缀只出现一次；只需判断是否存在匹配，走到关键词末尾即可停止
+    if None in node:
+        return ""
+    singles, branches = [], []
+    for ch in sorted(node):
+        sub = _trie_pattern(node[ch])
+        if sub:
+            branches.append(re.escape(ch) + sub)
+        else:
+            singles.append(re.escape(ch))
+    if singles:
+        branches.append(singles[0] if len(singles) == 1 else "[" + "".join(singles) + "]")
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+
+class KeywordAutomaton:
+    """
+    Aho–Corasick 多模式关键词自动机：一次扫描找出文本中出现的全部关键词，扫描代价与关键词数量基本无关。
+    每个关键词带一个标签（例如 'drop_line'、'skip_section'），多种检查可以共用同一个自动机。
+
+    自动机处于根状态时，用关键词首字符组成的字符集正则在 C 层跳到下一个可能开始匹配的位置，
+    只有可能处于匹配中的字符才在 Python 层逐个转移；字符集判定是常数时间，因此代价不随关键词数量增长。
+    关键词首字符种类较少时（例如默认的十几个关键词），再用前缀树正则先判断整行是否含有任何关键词，
+    不含的行（绝大多数）完全不进入 Python 层扫描。
+
+    参数说明：
+    - entries: (关键词, 标签, 是否忽略大小写) 的可迭代对象；忽略大小写的关键词等价于 keyword.lower() in text.lower()
+    """
+
+    def __init__(self, entries=()):
+        self.entries = [(keyword, label, bool(ignore_case)) for keyword, label, ignore_case in entries if keyword]
+        self._lowercase = any(ignore_case for _, _, ignore_case in self.entries)
+        # 自动机在（需要时）小写化后的文本上运行；区分大小写的关键词命中后再核对原文
+        self._goto = [{}]
+        self._output = [[]]
+        self._lengths = []
+        trie = {}
+        for i, (keyword, _, _) in enumerate(self.entries):
+            key = keyword.lower() if self._lowercase else keyword
+            self._lengths.append(len(key))
+            state, node = 0, trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+                if ch not in self._goto[state]:
+                    self._goto[state][ch] = len(self._goto)
+                    self._goto.append({})
+                    self._output.append([])
+                state = self._goto[state][ch]
+            node[None] = True
+            self._output[state].append(i)
+        self._fail = [0] * len(self._goto)
+        # 广度优先计算失败链接，并把失败状态的输出合并进来
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0) if state else 0
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+        self._root = re.compile("[" + "".join(re.escape(ch) for ch in sorted(self._goto[0])) + "]") \
+            if self.entries else None
+        self._gate = re.compile(_trie_pattern(trie)) if self.entries and len(trie) <= GATE_MAX_BRANCHES else None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def from_file(cls, path, defaults=(), encoding='utf-8'):
+        """
+        从关键词配置文件构造自动机，defaults 中的条目排在文件条目之前。
+        文件每行一个关键词，空行与以 # 开头的行忽略；[标签] 开始一组关键词，
+        [标签:ignore_case] 表示该组忽略大小写。没有标签头的关键词归入 'drop_line'。
+        """
+        return cls(list(defaults) + load_keywords(path, encoding))
+
+    def _prepare(self, text):
+        return text.lower() if self._lowercase else text
+
+    def matches(self, text):
+        """
+        返回文本中所有关键词出现的位置：[(起点, 终点, 关键词, 标签), ...]，按终点排序。
+        """
+        if self._root is None:
+            return []
+        scan = self._prepare(text)
+        if self._gate is not None and not self._gate.search(scan):
+            return []
+        # 小写化改变长度时（极少数字符）位置无法对应原文，区分大小写的关键词改用子串检查
+        aligned = len(scan) == len(text)
+        found = []
+        goto, fail, output = self._goto, self._fail, self._output
+        state, pos = 0, 0
+        while pos < len(scan):
+            if not state:
+                m = self._root.search(scan, pos)
+                if m is None:
+                    break
+                pos = m.start()
+            ch = scan[pos]
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            pos += 1
+            for i in output[state]:
+                keyword, label, ignore_case = self.entries[i]
+                start = pos - self._lengths[i]
+                if self._lowercase and not ignore_case:
+                    if aligned and text[start:pos] != keyword:
+                        continue
+                    if not aligned and keyword not in text:
+                        continue
+                found.append((start, pos, keyword, label))
+        return found
+
+    def labels(self, text):
+        """
+        返回文本中出现的关键词标签集合。
+        """
+        return {label for _, _, _, label in self.matches(text)}
+
+    def first(self, text, label=None):
+        """
+        返回最早结束的（指定标签的）关键词，没有时返回 None。
+        """
+        for _, _, keyword, found_label in self.matches(text):
+            if label is None or found_label == label:
+                return keyword
+        return None
+
+
+def load_keywords(path, encoding='utf-8'):
+    """
+    读取关键词配置文件，返回 (关键词, 标签, 是否忽略大小写) 列表，格式见 KeywordAutomaton.from_file。
+    """
+    entries = []
+    label, ignore_case = 'drop_line', False
+    with open(path, 'r', encoding=encoding) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                label, _, option = line[1:-1].partition(':')
+                ignore_case = option.strip() == 'ignore_case'
+                label = label.strip()
+                continue
+            entries.append((line, label, ignore_case))
+    return entries
@@ -1,6 +1,33 @@
+import multiprocessing
 import os
 import re
+import sys
+from collections import Counter
 from tqdm import tqdm
+from .boilerplate_filter import BoilerplateFilter
+from .clean_manifest import CleanManifest, config_digest, file_fingerprint
+from .compression import SUFFIXES, compression_from_name, open_input, open_output, strip_compression_suffix
+from .cleaning_rules import DEFAULT_KEYWORDS, RuleEngine
+from .keyword_automaton import KeywordAutomaton
+from .quality_filter import QualityFilter
+
+# 清洗逻辑（章节切分、过滤条件等规则之外的代码）改变输出时递增，使增量清洗清单失效
+CLEANER_VERSION = 1
+# 默认规则引擎，规则只编译一次；hits 在所有文件间累计
+default_engine = RuleEngine()
+# 按关键词配置文件缓存的规则引擎，每个进程只构建一次
+_engines = {}
+# 当前进程使用的模板行过滤器与质量过滤器（进程池中由 initializer 设置，避免随每个任务重复序列化）
+_boilerplate = None
+_quality = None
+
+def engine_for(keywords_file=None):
+    # keywords_file 中的关键词追加在默认关键词之后，格式见 KeywordAutomaton.from_file
+    if keywords_file is None:
+        return default_engine
+    if keywords_file not in _engines:
+        _engines[keywords_file] = RuleEngine(keywords=KeywordAutomaton.from_file(keywords_file, DEFAULT_KEYWORDS))
+    return _engines[keywords_file]
 
 def clean_markdown(content):
     # 内容清洗代码保持不变
@@ -69,50 +96,261 @@ def clean_references(content):
             cleaned_content.append(line)
     return cleaned_content
 
-def clean_and_extract_markdown(content):
-    cleaned_content = clean_markdown(content)
-    cleaned_content = remove_specific_patterns(cleaned_content)
-    cleaned_content = clean_references(cleaned_content)
-    cleaned_content = remove_garbled_characters(cleaned_content)
-    result = []
+
+def iter_section_records(cleaned_lines, engine=None):
+    # 逐行组装章节并逐个产出 (标题, 正文, 正文原始行数)，内存中只保留当前章节；
+    # 中间章节要求超过 50 个词，最后一个章节超过 20 个词
     current_title = None
     current_text = []
     skip_section = False
-    for line in cleaned_content:
+    for line in cleaned_lines:
         if line.startswith("#"):
             if current_title and current_text:
                 combined_text = "".join(current_text).strip()
                 if not skip_section and len(re.findall(r"[\u4e00-\u9fa5\w]+", combined_text)) > 50:
-                    result.append(f"{current_title}\n{combined_text}\n")
+                    yield current_title, combined_text, len(current_text)
             current_title = line.strip()
             current_text = []
-            skip_section = any(keyword in current_title for keyword in ["前言", "思考题", "参考文献", "ACKNOWLEDGEMENTS", "Conference Papers", "TABLE OF CONTENTS", "LIST OF FIGURES", " LIST OF TABLES", "Fundamental Concepts in Heterogeneous Catalysis", " 图书在版编目CIP数据", "例题", "Magnetism"])
+            skip_section = (engine or default_engine).skip_section(current_title)
         else:
             if not skip_section and line.strip():
                 current_text.append(line.strip())
     if current_title and current_text:
         combined_text = "".join(current_text).strip()
         if not skip_section and len(re.findall(r"[\u4e00-\u9fa5\w]+", combined_text)) > 20:
-            result.append(f"{current_title}\n{combined_text}\n")
-    return result
+            yield current_title, combined_text, len(current_text)
+
+def iter_sections(cleaned_lines, engine=None):
+    for title, text, _ in iter_section_records(cleaned_lines, engine):
+        yield f"{title}\n{text}\n"
+
+def iter_quality_sections(records, quality, batch_size=256):
+    for title, text, _ in iter_quality_records(records, quality, batch_size):
+        yield f"{title}\n{text}\n"
+
+def iter_quality_records(records, quality, batch_size=256):
+    # 按批计算质量信号，只产出通过质量过滤的章节记录；内存中最多保留 batch_size 个章节
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield from _accepted_records(batch, quality)
+            batch = []
+    if batch:
+        yield from _accepted_records(batch, quality)
 
-def process_specific_file(file_path, output_file):
+def _accepted_records(batch, quality):
+    mask = quality.accept_mask([text for _, text, _ in batch], [n for _, _, n in batch])
+    for record, keep in zip(batch, mask):
+        if keep:
+            yield record
+
+def iter_clean_and_extract_markdown(lines, engine=None):
+    # 流式版本：逐行读入、逐行清洗、逐个产出章节，峰值内存取决于最大的章节而不是整个文件
+    engine = engine or default_engine
+    return iter_sections(engine.clean(lines), engine)
+
+def clean_and_extract_markdown(content, engine=None):
+    # 单次流式执行 clean_markdown、remove_specific_patterns、clean_references、remove_garbled_characters 四个阶段
+    return list(iter_clean_and_extract_markdown(content, engine))
+
+def iter_file_sections(file_path, engine=None, boilerplate=None, quality=None):
+    # 逐个产出一个文件清洗后保留的章节 (标题, 正文)，与 process_specific_file 写出的内容一一对应；
+    # 输入可以是 gzip / zstd / bz2 压缩文件（按文件头识别）
+    engine = engine or default_engine
+    with open_input(file_path, 'r', encoding='utf-8') as file:
+        # 提供已统计好的 BoilerplateFilter 时先删除页眉页脚等模板行，再进入清洗规则
+        lines = boilerplate.filter_file(file_path) if boilerplate is not None else file
+        records = iter_section_records(engine.clean(lines), engine)
+        if quality is not None:
+            # 提供 QualityFilter 时丢弃乱码、符号堆砌、压平的表格与高度重复的章节
+            records = iter_quality_records(records, quality)
+        for title, text, _ in records:
+            yield title, text
+
+def process_specific_file(file_path, output_file, engine=None, boilerplate=None, quality=None):
     if not os.path.exists(file_path):
         return
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.readlines()
-    cleaned_content = clean_and_extract_markdown(content)
-    if cleaned_content:
-        with open(output_file, 'w', encoding='utf-8') as cleaned_file:
-            cleaned_file.write("\n".join(cleaned_content))
-
-def process_markdown_files(input_folder, output_folder):
+    tmp_file = output_file + ".tmp"
+    cleaned_file = None
+    try:
+        # output_file 以 .gz / .zst / .bz2 结尾时压缩写出
+        for title, text in iter_file_sections(file_path, engine, boilerplate, quality):
+            # 至少有一个章节时才创建输出文件；章节之间以换行分隔，与 "\n".join 的结果逐字节一致
+            if cleaned_file is None:
+                cleaned_file = open_output(tmp_file, 'w', compression_from_name(output_file), encoding='utf-8')
+            else:
+                cleaned_file.write("\n")
+            cleaned_file.write(f"{title}\n{text}\n")
+    except BaseException:
+        if cleaned_file is not None:
+            cleaned_file.close()
+            os.remove(tmp_file)
+        raise
+    if cleaned_file is not None:
+        cleaned_file.close()
+        os.replace(tmp_file, output_file)
+
+def _set_filters(boilerplate, quality):
+    global _boilerplate, _quality
+    _boilerplate, _quality = boilerplate, quality
+
+def _init_worker(boilerplate, quality):
+    # 进程池的 initializer：工作进程（fork 时继承、spawn 时随参数序列化）带着父进程已有的规则命中与过滤统计，
+    # 先全部清零，之后 _take_stats 传回的只是本进程清洗时新增的计数，父进程汇总时不会重复累加
+    _set_filters(boilerplate, quality)
+    for engine in [default_engine, *_engines.values()]:
+        engine.hits.clear()
+    if boilerplate is not None:
+        boilerplate.removed.clear()
+    if quality is not None:
+        quality.reset_stats()
+
+def _take_stats(engine=None):
+    # 取出并清零当前进程规则引擎与过滤器的统计，由父进程汇总
+    stats = {}
+    if engine is not None:
+        stats['rules'] = Counter(engine.hits)
+        engine.hits.clear()
+    if _boilerplate is not None:
+        stats['boilerplate'] = Counter(_boilerplate.removed)
+        _boilerplate.removed.clear()
+    if _quality is not None:
+        stats['quality'] = _quality.get_stats()
+        _quality.reset_stats()
+    return stats
+
+def _clean_file_task(task):
+    # 进程池中执行：由工作进程直接写出结果，只把文件名、错误信息、过滤统计与（增量模式下）输入指纹传回父进程
+    input_file_path, output_file_path, keywords_file, incremental = task
+    fingerprint = None
+    engine = engine_for(keywords_file)
+    try:
+        if incremental:
+            # 在读取输入之前取指纹：清洗期间输入被修改时记录的是修改前的状态，下次运行会重新清洗
+            fingerprint = file_fingerprint(input_file_path)
+            # 重新清洗时先删除旧输出：新结果可能没有任何章节，不能留下过期的输出
+            if os.path.exists(output_file_path):
+                os.remove(output_file_path)
+        process_specific_file(input_file_path, output_file_path, engine, _boilerplate, _quality)
+    except Exception as e:
+        return os.path.basename(input_file_path), f"{type(e).__name__}: {e}", _take_stats(engine), None
+    return os.path.basename(input_file_path), None, _take_stats(engine), fingerprint
+
+def cleaning_version(engine, boilerplate=None, quality=None):
+    """
+    清洗配置的摘要：清洗逻辑版本、规则与关键词、模板行过滤参数及语料统计、质量过滤规则，任一变化时全部文件需重新清洗。
+    """
+    return config_digest({
+        'cleaner': CLEANER_VERSION,
+        'engine': engine.config(),
+        'boilerplate': boilerplate.config() if boilerplate is not None else None,
+        'quality': quality.config() if quality is not None else None,
+    })
+
+def cleaned_name(filename, compression=None):
+    # 输入文件对应的清洗输出文件名：<原名>_cleaned.txt，压缩写出时加上对应后缀
+    return strip_compression_suffix(filename).replace('.md', '.txt').replace('.txt', '_cleaned.txt') \
+        + SUFFIXES[compression]
+
+def prepare_filters(input_paths, boilerplate=None, quality=None):
+    # True 与 dict 形式的参数构造为过滤器，返回 (boilerplate, quality)；
+    # 模板行过滤器尚未统计时先在全部输入文件上完成第一遍统计，读取失败的文件在清洗时会再次报错并记录
+    if boilerplate is True or isinstance(boilerplate, dict):
+        boilerplate = BoilerplateFilter(**(boilerplate if isinstance(boilerplate, dict) else {}))
+    if quality is True or isinstance(quality, dict):
+        quality = QualityFilter(**(quality if isinstance(quality, dict) else {}))
+    if boilerplate is not None and not boilerplate.n_docs:
+        for input_file_path in tqdm(input_paths, desc="Boilerplate"):
+            try:
+                with open_input(input_file_path, 'r', encoding=boilerplate.encoding) as f:
+                    boilerplate.fit_document(f)
+            except Exception:
+                continue
+    return boilerplate, quality
+
+def process_markdown_files(input_folder, output_folder, workers=1, chunksize=4, keywords_file=None, boilerplate=None,
+                           quality=None, incremental=True, compression=None):
+    """
+    清洗 input_folder 下的 .md / .txt 文件，结果写到 output_folder 下的 <原名>_cleaned.txt。
+    workers > 1 时用进程池并行处理，按 chunksize 个文件一组分批提交，进度条由父进程驱动。
+    keywords_file 为额外的关键词配置文件（删行、跳过章节等屏蔽词表）。
+    boilerplate 启用跨文档的模板行过滤：True 使用默认参数，dict 为 BoilerplateFilter 的参数，
+    也可以直接传入已统计好的 BoilerplateFilter；未统计时先在全部输入文件上完成第一遍统计。
+    quality 启用章节质量过滤（在语义去重之前剔除低质量章节）：True 使用默认规则，dict 为 QualityFilter 的参数，
+    也可以直接传入 QualityFilter；结束时打印各质量信号的直方图。
+    incremental 为 True 时在 output_folder 中维护清洗清单（见 CleanManifest）：内容与清洗配置都未变的文件直接跳过，
+    输入已删除的文件连同其输出一起清理；模板行统计依赖整个语料，启用时第一遍统计仍覆盖全部文件，统计变化时全部重新清洗。
+    输入文件可以是 gzip / zstd / bz2 压缩的 .md / .txt（按文件头识别，流式解压）；compression 为 'gzip'、'zstd' 或 'bz2' 时
+    输出也压缩写出，文件名加上对应后缀。
+    单个文件出错不会中断整体处理，返回 {文件名: 错误信息}。
+    """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-    files = [f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f)) and (f.endswith('.md') or f.endswith('.txt'))]
-    for filename in tqdm(files, desc="Markdown_cleaner"):
-        input_file_path = os.path.join(input_folder, filename)
-        output_file_path = os.path.join(output_folder, filename.replace('.md', '.txt').replace('.txt', '_cleaned.txt'))
-        process_specific_file(input_file_path, output_file_path)
+    files = [f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f))
+             and strip_compression_suffix(f).endswith(('.md', '.txt'))]
+    tasks = [(os.path.join(input_folder, filename),
+              os.path.join(output_folder, cleaned_name(filename, compression)),
+              keywords_file, incremental)
+             for filename in files]
+    boilerplate, quality = prepare_filters([task[0] for task in tasks], boilerplate, quality)
+    errors = {}
+    manifest = None
+    if incremental:
+        manifest = CleanManifest(output_folder)
+        version = cleaning_version(engine_for(keywords_file), boilerplate, quality)
+        removed = manifest.prune(files)
+        pending = [task for task in tasks
+                   if not manifest.is_current(os.path.basename(task[0]), task[0], version, os.path.basename(task[1]))]
+        print(f"增量清洗：{len(tasks) - len(pending)} 个文件未变化已跳过，{len(pending)} 个文件待清洗，"
+              f"清理 {len(removed)} 个已删除输入的输出。", file=sys.stderr)
+        tasks = pending
 
+    def collect(result):
+        filename, error, stats, fingerprint = result
+        if error is not None:
+            errors[filename] = error
+        if manifest is not None:
+            if error is None:
+                output = output_names[filename]
+                manifest.record(filename, os.path.join(input_folder, filename), version,
+                                os.path.basename(output) if os.path.exists(output) else None, fingerprint)
+            else:
+                manifest.forget(filename)
+        if 'rules' in stats:
+            # 工作进程中规则引擎的命中计数汇总到父进程的引擎，report() 覆盖全部文件
+            engine_for(keywords_file).hits.update(stats['rules'])
+        if 'boilerplate' in stats:
+            boilerplate.removed.update(stats['boilerplate'])
+        if 'quality' in stats:
+            quality.merge_stats(stats['quality'])
 
+    output_names = {os.path.basename(task[0]): task[1] for task in tasks}
+    try:
+        with tqdm(total=len(tasks), desc="Markdown_cleaner") as pbar:
+            if workers > 1 and len(tasks) > 1:
+                with multiprocessing.Pool(min(workers, len(tasks)), initializer=_init_worker,
+                                          initargs=(boilerplate, quality)) as pool:
+                    # imap_unordered 按完成顺序返回，父进程只接收很小的状态元组，内存占用与文件数无关
+                    for result in pool.imap_unordered(_clean_file_task, tasks, chunksize=chunksize):
+                        collect(result)
+                        pbar.update(1)
+            else:
+                _set_filters(boilerplate, quality)
+                try:
+                    for task in tasks:
+                        collect(_clean_file_task(task))
+                        pbar.update(1)
+                finally:
+                    _set_filters(None, None)
+    finally:
+        # 中断时已完成的文件也记入清单，下次运行不再重复清洗
+        if manifest is not None:
+            manifest.save()
+    if boilerplate is not None:
+        print(boilerplate.report(), file=sys.stderr)
+    if quality is not None:
+        print(quality.report(), file=sys.stderr)
+    for filename, error in sorted(errors.items()):
+        print(f"清洗 {filename} 时出错: {error}", file=sys.stderr)
+    return errors
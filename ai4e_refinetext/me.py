@@ -1,20 +1,86 @@
+import json
 import os
 from tqdm import tqdm
+from .compression import compression_from_name, detect_compression, open_input, open_output, \
+    strip_compression_suffix
+
+# 复制时的缓冲区大小
+COPY_BUFFER_SIZE = 8 << 20
+
+
+def index_path(output_file):
+    # 合并文件旁的文档索引：每行一个 JSON 对象 {"source": 文件名, "offset": 字节偏移, "length": 字节长度}
+    return output_file + ".index.jsonl"
+
+
+def _copy(infile, outfile, size=None):
+    # 优先用 os.sendfile 在内核中直接复制，不经过 Python 缓冲区；不支持或需要解压、压缩（size 为 None）时退回大缓冲区复制
+    if hasattr(os, "sendfile") and size:
+        outfile.flush()
+        copied = 0
+        try:
+            while copied < size:
+                sent = os.sendfile(outfile.fileno(), infile.fileno(), copied, size - copied)
+                if sent == 0:
+                    break
+                copied += sent
+            return copied
+        except OSError:
+            if copied:
+                raise
+    written = 0
+    for chunk in iter(lambda: infile.read(COPY_BUFFER_SIZE), b""):
+        outfile.write(chunk)
+        written += len(chunk)
+    return written
+
 
 def allin(input_folder, output_file):
-    # 获取文件夹中所有 .txt 文件
-    txt_files = [file for file in os.listdir(input_folder) if file.endswith(".txt")]
+    # 获取文件夹中所有 .txt 文件（可以是 gzip / zstd / bz2 压缩的，按文件头识别），按文件名排序，保证每次合并的顺序一致
+    txt_files = sorted(file for file in os.listdir(input_folder) if strip_compression_suffix(file).endswith(".txt"))
 
-    # 创建或清空输出文件
-    with open(output_file, "w", encoding="utf-8") as outfile:
+    index = []
+    offset = 0
+    # 以二进制方式创建或清空输出文件，逐字节复制，不解码也不转换换行符；output_file 以 .gz / .zst / .bz2 结尾时压缩写出，
+    # 此时索引中的偏移是解压后的字节偏移。sendfile、缓冲区复制与压缩三条路径都写同一个二进制文件对象，
+    # 分隔符一律为 b"\n"；清洗结果由 open_output 按 "\n" 写出，合并文件在各平台上都只含 "\n"
+    compressed_output = compression_from_name(output_file) is not None
+    if compressed_output:
+        outfile = open_output(output_file, "wb")
+    else:
+        outfile = open(output_file, "wb", buffering=COPY_BUFFER_SIZE)
+    with outfile:
         # 使用 tqdm 显示进度条
         for file_name in tqdm(txt_files, desc="txt-merge", unit="file"):
             file_path = os.path.join(input_folder, file_name)
-            # 读取每个文件并写入输出文件
-            with open(file_path, "r", encoding="utf-8") as infile:
-                outfile.write(infile.read())
-                outfile.write("\n")  # 添加换行符以分隔文件内容
+            if compressed_output or detect_compression(file_path) is not None:
+                with open_input(file_path, "rb") as infile:
+                    length = _copy(infile, outfile)
+            else:
+                with open(file_path, "rb") as infile:
+                    length = _copy(infile, outfile, os.fstat(infile.fileno()).st_size)
+            outfile.write(b"\n")  # 添加换行符以分隔文件内容
+            index.append({"source": file_name, "offset": offset, "length": length})
+            offset += length + 1
+
+    # 记录每个文档在合并文件中的位置（不含分隔换行符），下游可以据此定位或分片而不必重新扫描
+    tmp = index_path(output_file) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for entry in index:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp, index_path(output_file))
 
     print(f"所有 .txt 文件已合并到 {output_file}")
+    return index
+
+
+def read_index(output_file):
+    # 读取 allin 写出的文档索引，返回 [{"source", "offset", "length"}, ...]
+    with open(index_path(output_file), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
 
 
+def read_document(merged, entry, encoding="utf-8"):
+    # 按索引条目从已打开的（二进制）合并文件中读取一个文档；压缩的合并文件用 open_input(output_file, "rb") 打开
+    merged.seek(entry["offset"])
+    return merged.read(entry["length"]).decode(encoding)
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from .clean_manifest import config_digest, file_digest
+
+STATE_NAME = '.pipeline_state.json'
+
+
+def _norm(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _overlaps(a, b):
+    # 两个路径相同或一个位于另一个目录之下
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+
+class Stage:
+    """
+    流水线中的一个阶段：执行 fn(*args, **kwargs)，读取 inputs，写出 outputs。
+
+    参数说明：
+    - name: 阶段名称
+    - fn: 阶段函数
+    - args, kwargs: 调用参数，与函数名一起计入指纹
+    - inputs: 输入路径（文件或目录）列表，也可以是返回路径列表的函数（在检查时求值，例如按后缀收集文件）
+    - outputs: 输出路径列表，格式同 inputs；阶段之间的依赖由输出与输入路径的重叠自动推导
+    """
+
+    def __init__(self, name, fn, args=(), kwargs=None, inputs=(), outputs=()):
+        self.name = name
+        self.fn = fn
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self._inputs = inputs
+        self._outputs = outputs
+
+    @staticmethod
+    def _resolve(paths):
+        paths = paths() if callable(paths) else paths
+        return sorted({_norm(p) for p in paths})
+
+    @property
+    def inputs(self):
+        return self._resolve(self._inputs)
+
+    @property
+    def outputs(self):
+        return self._resolve(self._outputs)
+
+    def params(self):
+        return {'fn': f"{getattr(self.fn, '__module__', '')}.{getattr(self.fn, '__qualname__', repr(self.fn))}",
+                'args': self.args, 'kwargs': self.kwargs}
+
+
+class Pipeline:
+    """
+    以 DAG 组织的流水线：每个阶段的指纹由函数、参数与全部输入的内容摘要组成，运行成功后连同输出摘要记入状态文件。
+    再次运行时，指纹未变且输出未被改动的阶段直接跳过；上游重新执行后输出不变时，下游同样跳过。
+    某个阶段失败时已完成阶段的状态已经保存，修复后重新运行即从第一个过期的阶段继续。
+
+    阶段是否成功只看阶段函数是否抛出异常（以及输出是否存在）：只打印或返回错误的函数需要先包装成出错时抛出异常，
+    否则失败的阶段会保留旧的输出并被记为已是最新。
+
+    文件摘要按 (大小, 修改时间) 缓存在状态文件中，未变化的文件不重复读取；目录的摘要覆盖其中全部非隐藏文件
+    （以 . 开头的文件与目录，例如清洗清单，不计入）。
+
+    参数说明：
+    - state_file: 状态文件路径
+    """
+
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.stages = []
+        self.state = {'stages': {}, 'digests': {}}
+        if os.path.exists(state_file):
+            try:
+                with open(state_file, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError):
+                # 状态文件损坏时当作首次运行
+                pass
+
+    def add(self, name, fn, args=(), kwargs=None, inputs=(), outputs=()):
+        """
+        添加一个阶段，参数见 Stage；返回该阶段。
+        """
+        if any(stage.name == name for stage in self.stages):
+            raise ValueError(f"阶段名称重复: {name}")
+        stage = Stage(name, fn, args, kwargs, inputs, outputs)
+        self.stages.append(stage)
+        return stage
+
+    def dependencies(self):
+        """
+        返回 {阶段名: 依赖的上游阶段名集合}：阶段的输入与另一阶段的输出重叠时依赖该阶段。
+        """
+        resolved = [(stage, stage.inputs, stage.outputs) for stage in self.stages]
+        deps = {}
+        for stage, inputs, _ in resolved:
+            deps[stage.name] = {other.name for other, _, outputs in resolved
+                                if other is not stage and any(_overlaps(i, o) for i in inputs for o in outputs)}
+        return deps
+
+    def order(self):
+        """
+        按依赖关系排序的阶段列表，无依赖约束时保持添加顺序；存在环时报错。
+        """
+        deps = self.dependencies()
+        done, ordered = set(), []
+        while len(ordered) < len(self.stages):
+            ready = [s for s in self.stages if s.name not in done and deps[s.name] <= done]
+            if not ready:
+                cycle = sorted(s.name for s in self.stages if s.name not in done)
+                raise ValueError(f"阶段之间存在循环依赖: {cycle}")
+            ordered.append(ready[0])
+            done.add(ready[0].name)
+        return ordered
+
+    def _file_digest(self, path):
+        st = os.stat(path)
+        cached = self.state['digests'].get(path)
+        if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_digest(path)
+        self.state['digests'][path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def path_digest(self, path):
+        """
+        文件或目录内容的摘要，不存在时为 None。
+        """
+        if os.path.isfile(path):
+            return self._file_digest(path)
+        if not os.path.isdir(path):
+            return None
+        h = hashlib.blake2b(digest_size=16)
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for name in sorted(files):
+                if name.startswith('.'):
+                    continue
+                file_path = os.path.join(root, name)
+                h.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+                h.update(self._file_digest(file_path).encode('ascii') + b'\0')
+        return h.hexdigest()
+
+    def fingerprint(self, stage):
+        return config_digest({'params': stage.params(),
+                              'inputs': {p: self.path_digest(p) for p in stage.inputs}})
+
+    def _outputs_digest(self, stage):
+        return {p: self.path_digest(p) for p in stage.outputs}
+
+    def stale_reason(self, stage, upstream_running=()):
+        """
+        返回阶段需要执行的原因，已是最新时返回 None。
+        """
+        if upstream_running:
+            return f"上游阶段 {', '.join(sorted(upstream_running))} 将重新执行"
+        record = self.state['stages'].get(stage.name)
+        if record is None:
+            return "没有成功运行的记录"
+        if record['fingerprint'] != self.fingerprint(stage):
+            return "输入或参数已变化"
+        outputs = self._outputs_digest(stage)
+        if any(digest is None for digest in outputs.values()):
+            return "输出缺失"
+        if outputs != record['outputs']:
+            return "输出已被改动"
+        return None
+
+    def save(self):
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.state_file)
+
+    def run(self, dry_run=False, force=()):
+        """
+        按依赖顺序执行过期的阶段，返回 [(阶段名, 状态, 原因), ...]，状态为 'skipped'、'ran' 或（dry_run 时）'would_run'。
+
+        参数说明：
+        - dry_run: 只打印将要执行的阶段及原因，不执行也不修改状态
+        - force: 强制执行的阶段名称，其下游阶段随之重新检查
+        """
+        force = set(force)
+        deps = self.dependencies()
+        pending = set()
+        plan = []
+        for stage in self.order():
+            if stage.name in force:
+                reason = "强制执行"
+            else:
+                reason = self.stale_reason(stage, deps[stage.name] & pending if dry_run else ())
+            if reason is None:
+                print(f"[{stage.name}] 已是最新，跳过。", file=sys.stderr)
+                plan.append((stage.name, 'skipped', None))
+                continue
+            if dry_run:
+                print(f"[{stage.name}] 将执行：{reason}", file=sys.stderr)
+                pending.add(stage.name)
+                plan.append((stage.name, 'would_run', reason))
+                continue
+            print(f"[{stage.name}] 执行：{reason}", file=sys.stderr)
+            fingerprint = self.fingerprint(stage)
+            start = time.time()
+            try:
+                stage.fn(*stage.args, **stage.kwargs)
+                outputs = self._outputs_digest(stage)
+                missing = [p for p, digest in outputs.items() if digest is None]
+                if missing:
+                    raise RuntimeError(f"阶段 {stage.name} 没有生成输出: {missing}")
+            except BaseException:
+                # 失败的阶段不记录，下次运行从这里继续；已完成阶段的状态与文件摘要缓存照常保存
+                self.state['stages'].pop(stage.name, None)
+                self.save()
+                print(f"[{stage.name}] 失败，修复后重新运行将从该阶段继续。", file=sys.stderr)
+                raise
+            self.state['stages'][stage.name] = {'fingerprint': fingerprint, 'outputs': outputs,
+                                                'seconds': round(time.time() - start, 3),
+                                                'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+            self.save()
+            plan.append((stage.name, 'ran', reason))
+        if not dry_run:
+            self.save()
+        return plan
@@ -0,0 +1,250 @@
+import hashlib
+import re
+import unicodedata
+import numpy as np
+from .embedding_store import EmbeddingStore
+
+_NON_WORD = re.compile(r"[\W_]+")
+# 精确键中保留数字之间的小数点与千分位逗号、数字前的正负号，其余空白、标点与符号照常去掉
+_KEY_NON_WORD = re.compile(r"(?!(?<=\d)[.,](?=\d))(?![+\-\u2212](?=\d))[\W_]")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize_text(text):
+    """
+    归一化文本：NFKC 全半角统一、转小写，并去掉空白、标点与符号。
+    OCR 结果中仅空格、标点或大小写不同的行归一化后相同。
+    """
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def key_text(text):
+    """
+    精确去重使用的归一化：与 normalize_text 相同，但保留数字中的小数点、千分位逗号与正负号，
+    1.5K 与 15K、-3 与 3 不会被当成同一行。
+    """
+    return _KEY_NON_WORD.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def text_hash(text, normalize=True):
+    """
+    返回文本（默认先按 key_text 归一化）的 16 字节 blake2b 摘要。
+    """
+    if normalize:
+        text = key_text(text)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class SortedKeyIndex:
+    """
+    只追加的 uint64 键索引（每个键可附带若干 int64 值），代替 Python 集合与字典，单条约 16 字节（只存键时 8 字节）。
+    新键先放在内存中的小批次里，积累到 batch_size 条后排序成一个紧凑的 numpy 段；段按大小逐级合并
+    （相邻两段大小相近时合并），段数为 O(log n)，查询在每个段上二分查找。
+
+    参数说明：
+    - with_values: 是否为每个键保存值；为 False 时只判断键是否存在
+    - batch_size: 内存中小批次的最大条数
+    """
+
+    def __init__(self, with_values=True, batch_size=65536):
+        self.with_values = with_values
+        self.batch_size = batch_size
+        self._pending = {}
+        self._n_pending = 0
+        self._keys = []
+        self._values = []
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._keys) + self._n_pending
+
+    def __contains__(self, key):
+        if key in self._pending:
+            return True
+        key = np.uint64(key)
+        for keys in self._keys:
+            i = np.searchsorted(keys, key)
+            if i < len(keys) and keys[i] == key:
+                return True
+        return False
+
+    def get(self, key):
+        """
+        返回键对应的全部值（按加入顺序），不存在时为空列表。
+        """
+        values = []
+        np_key = np.uint64(key)
+        for keys, segment in zip(self._keys, self._values):
+            lo, hi = np.searchsorted(keys, np_key, 'left'), np.searchsorted(keys, np_key, 'right')
+            if hi > lo:
+                values.extend(segment[lo:hi].tolist())
+        values.extend(self._pending.get(key, ()))
+        return values
+
+    def add(self, key, value=0):
+        self._pending.setdefault(key, []).append(value)
+        self._n_pending += 1
+        if self._n_pending >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        keys = np.fromiter((k for k, vs in self._pending.items() for _ in vs), dtype=np.uint64, count=self._n_pending)
+        values = np.fromiter((v for vs in self._pending.values() for v in vs), dtype=np.int64, count=self._n_pending) \
+            if self.with_values else None
+        self._pending.clear()
+        self._n_pending = 0
+        order = np.argsort(keys, kind='stable')
+        self._keys.append(keys[order])
+        self._values.append(values[order] if values is not None else None)
+        # 较新的段不小于前一段的一半时合并，保持段的大小大致按 2 的幂递减
+        while len(self._keys) > 1 and len(self._keys[-2]) <= 2 * len(self._keys[-1]):
+            keys = np.concatenate(self._keys[-2:])
+            order = np.argsort(keys, kind='stable')
+            values = np.concatenate(self._values[-2:])[order] if self.with_values else None
+            self._keys[-2:] = [keys[order]]
+            self._values[-2:] = [values]
+
+
+class ExactHashFilter:
+    """
+    精确哈希过滤：归一化后内容完全相同的行只保留第一次出现的。
+    已见过的行只以 8 字节哈希保存在 SortedKeyIndex 中（约 8 字节/行）；十亿行量级时哈希碰撞的期望次数约为 0.03。
+
+    参数说明：
+    - normalize: 是否先归一化再计算哈希；为 False 时只去除逐字节相同的行
+    """
+
+    name = "exact"
+
+    def __init__(self, normalize=True):
+        self.normalize = normalize
+        self.removed = 0
+        self._seen = SortedKeyIndex(with_values=False)
+
+    def accept(self, text):
+        key = int.from_bytes(text_hash(text, self.normalize)[:8], 'little')
+        if key in self._seen:
+            self.removed += 1
+            return False
+        self._seen.add(key)
+        return True
+
+
+def _optimal_bands(threshold, num_perm):
+    """
+    选择 LSH 的 (band 数, 每 band 行数)，使阈值两侧的漏检与误检概率积分之和最小。
+    """
+    grid = np.linspace(0.0, 1.0, 201)
+    step = grid[1] - grid[0]
+    below = grid < threshold
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        prob = 1.0 - (1.0 - grid ** rows) ** bands
+        # 误检：阈值以下仍被判为候选；漏检：阈值以上未成为候选
+        error = (prob[below].sum() + (1.0 - prob[~below]).sum()) * step
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHashLSHFilter:
+    """
+    MinHash + LSH 近似重复过滤：以归一化文本的字符 n-gram 为集合元素（适合不分词的中文），
+    估计 Jaccard 相似度不低于阈值的行只保留第一次出现的。
+    每个保留行占用 num_perm × 4 字节的签名（signature_path 提供时放在磁盘上的 np.memmap 中），
+    以及每个 band 一个 8 字节桶键与 8 字节编号（SortedKeyIndex），没有逐行的 Python 对象。
+
+    参数说明：
+    - threshold: Jaccard 相似度阈值
+    - num_perm: MinHash 签名长度
+    - ngram_size: 字符 n-gram 长度
+    - seed: 随机种子
+    - signature_path: 签名矩阵的磁盘存储路径，为 None 时存放在内存中
+    """
+
+    name = "minhash"
+
+    def __init__(self, threshold=0.8, num_perm=128, ngram_size=5, seed=1, signature_path=None):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.ngram_size = ngram_size
+        self.removed = 0
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)[:, None]
+        self.bands, self.rows = _optimal_bands(threshold, num_perm)
+        # 每个 band 的签名片段经各自的随机乘数折叠成一个 uint64 桶键；不同 band 的键互不相同，共用一个索引
+        self._band_mult = rng.integers(1, 1 << 63, (self.bands, self.rows), dtype=np.uint64) | np.uint64(1)
+        self._band_salt = rng.integers(0, 1 << 63, self.bands, dtype=np.uint64)
+        self._buckets = SortedKeyIndex()
+        # 已保留行的签名，用于核验 LSH 候选，排除误检（包括桶键碰撞）
+        self._signatures = EmbeddingStore(num_perm, dtype=np.uint32, path=signature_path)
+
+    def _shingle_hashes(self, text):
+        codes = np.frombuffer(normalize_text(text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        n = self.ngram_size
+        if len(codes) < n:
+            n = max(len(codes), 1)
+            if len(codes) == 0:
+                codes = np.zeros(1, dtype=np.uint64)
+        # 多项式滚动哈希，一次向量运算得到全部 n-gram 的哈希（溢出按 2^64 取模）
+        hashes = np.zeros(len(codes) - n + 1, dtype=np.uint64)
+        for k in range(n):
+            hashes = hashes * np.uint64(1000003) + codes[k:len(codes) - n + 1 + k]
+        return np.unique((hashes ^ (hashes >> np.uint64(32))) & _MAX_HASH)
+
+    def signature(self, text):
+        hashes = self._shingle_hashes(text)[None, :]
+        permuted = ((self._a * hashes + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def band_keys(self, sig):
+        bands = sig[:self.bands * self.rows].reshape(self.bands, self.rows).astype(np.uint64)
+        return ((bands * self._band_mult).sum(axis=1) ^ self._band_salt).tolist()
+
+    def accept(self, text):
+        sig = self.signature(text)
+        keys = self.band_keys(sig)
+        candidates = set()
+        for key in keys:
+            candidates.update(self._buckets.get(key))
+        if candidates:
+            stored = self._signatures.view()[sorted(candidates)]
+            if np.max(np.mean(stored == sig, axis=1)) >= self.threshold:
+                self.removed += 1
+                return False
+        sig_id = self._signatures.append(sig)
+        for key in keys:
+            self._buckets.add(key, sig_id)
+        return True
+
+
+class PrefilterChain:
+    """
+    按顺序串联多个廉价过滤阶段，只有全部通过的行才进入后续的向量编码。
+    """
+
+    def __init__(self, filters):
+        self.filters = list(filters)
+
+    def accept(self, text):
+        return all(f.accept(text) for f in self.filters)
+
+    def report(self):
+        """
+        返回 {阶段名: 删除行数}。
+        """
+        return {f.name: f.removed for f in self.filters}
+
+
+def build_prefilter(exact_dedup=False, minhash_threshold=None, minhash_params=None):
+    """
+    根据参数构造前置过滤链；两个阶段默认关闭（都关闭时返回 None），开启后会删除语义去重本身可能保留的行，输出随之改变。
+    """
+    filters = []
+    if exact_dedup:
+        filters.append(ExactHashFilter())
+    if minhash_threshold is not None:
+        filters.append(MinHashLSHFilter(threshold=minhash_threshold, **(minhash_params or {})))
+    return PrefilterChain(filters) if filters else None
@@ -0,0 +1,194 @@
+import numpy as np
+
+# 各信号的直方图分箱：比例类信号在 [0, 1] 上等宽分箱，长度类信号按对数分箱
+RATIO_SIGNALS = ('cjk_ratio', 'latin_ratio', 'digit_ratio', 'punct_ratio', 'other_ratio', 'letter_ratio',
+                 'dup_ngram_ratio')
+LENGTH_SIGNALS = ('mean_line_length', 'length')
+SIGNALS = RATIO_SIGNALS + LENGTH_SIGNALS
+
+# 默认接受规则：{信号: (下限, 上限)}，None 表示不限
+DEFAULT_BOUNDS = {
+    'letter_ratio': (0.6, None),
+    'digit_ratio': (None, 0.3),
+    'punct_ratio': (None, 0.3),
+    'other_ratio': (None, 0.2),
+    'dup_ngram_ratio': (None, 0.4),
+    'mean_line_length': (8, None),
+}
+
+_ASCII_PUNCT = np.zeros(128, dtype=bool)
+_ASCII_PUNCT[[ord(c) for c in "!\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~"]] = True
+
+
+def _char_classes(codes):
+    # 按码位分类：中文、拉丁字母、数字、标点（ASCII 与全角/中文标点）、空白，其余为其它符号
+    cjk = (codes >= 0x4E00) & (codes <= 0x9FA5)
+    latin = ((codes >= 0x41) & (codes <= 0x5A)) | ((codes >= 0x61) & (codes <= 0x7A))
+    digit = (codes >= 0x30) & (codes <= 0x39)
+    punct = np.zeros(len(codes), dtype=bool)
+    ascii_mask = codes < 128
+    punct[ascii_mask] = _ASCII_PUNCT[codes[ascii_mask]]
+    punct |= ((codes >= 0x3000) & (codes <= 0x303F)) | ((codes >= 0xFF00) & (codes <= 0xFF0F)) \
+        | ((codes >= 0xFF1A) & (codes <= 0xFF20))
+    space = (codes == 0x20) | (codes == 0x09) | (codes == 0x0A) | (codes == 0x0D) | (codes == 0x3000)
+    punct &= ~space
+    return cjk, latin, digit, punct, space
+
+
+def _dup_ngram_ratio(codes, starts, ends, ngram_size):
+    # 每段文本中与本段更早位置重复的字符 n-gram 占全部 n-gram 的比例（批量计算，不逐段循环）
+    n = len(codes)
+    ratio = np.zeros(len(starts), dtype=np.float64)
+    if n < ngram_size:
+        return ratio
+    h = np.zeros(n - ngram_size + 1, dtype=np.uint64)
+    for k in range(ngram_size):
+        h = h * np.uint64(1000003) + codes[k:n - ngram_size + 1 + k].astype(np.uint64)
+    segment = np.repeat(np.arange(len(starts)), ends - starts)
+    pos = np.arange(n)
+    # 只保留不跨越段边界的 n-gram
+    valid = pos[:len(h)] + ngram_size <= np.repeat(ends, ends - starts)[:len(h)]
+    seg, h = segment[:len(h)][valid], h[valid]
+    totals = np.bincount(seg, minlength=len(starts))
+    order = np.lexsort((h, seg))
+    seg, h = seg[order], h[order]
+    dup = np.zeros(len(h), dtype=bool)
+    dup[1:] = (seg[1:] == seg[:-1]) & (h[1:] == h[:-1])
+    dups = np.bincount(seg[dup], minlength=len(starts))
+    np.divide(dups, totals, out=ratio, where=totals > 0)
+    return ratio
+
+
+def quality_signals(texts, line_counts=None, ngram_size=5):
+    """
+    批量计算每段文本的质量信号，返回 {信号名: np.ndarray}。比例类信号以非空白字符数为分母。
+
+    参数说明：
+    - texts: 文本列表（例如章节正文）
+    - line_counts: 每段文本在原文中的行数，用于计算平均行长；为 None 时按文本中的换行计数
+    - ngram_size: 重复率使用的字符 n-gram 长度
+    """
+    encoded = [np.frombuffer(t.encode("utf-32-le"), dtype=np.uint32) for t in texts]
+    lengths = np.array([len(c) for c in encoded], dtype=np.int64)
+    codes = np.concatenate(encoded) if encoded else np.empty(0, dtype=np.uint32)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    if line_counts is None:
+        line_counts = [t.count("\n") + (not t.endswith("\n")) for t in texts]
+    line_counts = np.maximum(np.asarray(line_counts, dtype=np.float64), 1)
+
+    cjk, latin, digit, punct, space = _char_classes(codes)
+    nonempty = lengths > 0
+
+    def count(mask):
+        # 按段求和；reduceat 只用非空段的起点（严格递增），空段计为 0
+        counts = np.zeros(len(texts), dtype=np.int64)
+        if nonempty.any():
+            counts[nonempty] = np.add.reduceat(mask.astype(np.int64), starts[nonempty])
+        return counts
+
+    chars = np.maximum(lengths - count(space), 1).astype(np.float64)
+    signals = {
+        'cjk_ratio': count(cjk) / chars,
+        'latin_ratio': count(latin) / chars,
+        'digit_ratio': count(digit) / chars,
+        'punct_ratio': count(punct) / chars,
+    }
+    signals['other_ratio'] = np.clip(1 - signals['cjk_ratio'] - signals['latin_ratio'] - signals['digit_ratio']
+                                     - signals['punct_ratio'], 0, 1)
+    signals['letter_ratio'] = signals['cjk_ratio'] + signals['latin_ratio']
+    signals['dup_ngram_ratio'] = _dup_ngram_ratio(codes, starts, ends, ngram_size)
+    signals['mean_line_length'] = lengths / line_counts
+    signals['length'] = lengths.astype(np.float64)
+    return signals
+
+
+class QualityFilter:
+    """
+    启发式质量过滤：在语义去重之前剔除 OCR 乱码、符号堆砌、被压平成数字的表格和高度重复的文本。
+    信号按批计算（见 quality_signals），并为每个信号累计直方图，便于据分布调整阈值。
+
+    参数说明：
+    - bounds: 接受规则 {信号: (下限, 上限)}，全部满足才接受；默认 DEFAULT_BOUNDS
+    - accept_fn: 自定义接受规则 accept_fn(signals) -> 布尔掩码，提供时忽略 bounds
+    - ngram_size: 重复率使用的字符 n-gram 长度
+    - bins: 比例类信号的直方图分箱数
+    """
+
+    def __init__(self, bounds=None, accept_fn=None, ngram_size=5, bins=20):
+        self.bounds = dict(DEFAULT_BOUNDS if bounds is None else bounds)
+        self.accept_fn = accept_fn
+        self.ngram_size = ngram_size
+        self.edges = {name: np.linspace(0, 1, bins + 1) for name in RATIO_SIGNALS}
+        self.edges.update({name: np.concatenate(([0], np.geomspace(1, 1e6, 13))) for name in LENGTH_SIGNALS})
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hist = {name: np.zeros(len(edges) - 1, dtype=np.int64) for name, edges in self.edges.items()}
+        self.seen = 0
+        self.accepted = 0
+
+    def accept_mask(self, texts, line_counts=None):
+        """
+        返回一批文本的接受掩码，并累计直方图与计数。
+        """
+        if not len(texts):
+            return np.zeros(0, dtype=bool)
+        signals = quality_signals(texts, line_counts, self.ngram_size)
+        if self.accept_fn is not None:
+            mask = np.asarray(self.accept_fn(signals), dtype=bool)
+        else:
+            mask = np.ones(len(texts), dtype=bool)
+            for name, (low, high) in self.bounds.items():
+                if low is not None:
+                    mask &= signals[name] >= low
+                if high is not None:
+                    mask &= signals[name] <= high
+        for name, edges in self.edges.items():
+            self.hist[name] += np.histogram(np.clip(signals[name], edges[0], edges[-1]), bins=edges)[0]
+        self.seen += len(texts)
+        self.accepted += int(mask.sum())
+        return mask
+
+    def filter(self, texts, line_counts=None):
+        """
+        返回通过过滤的文本列表。
+        """
+        mask = self.accept_mask(texts, line_counts)
+        return [t for t, keep in zip(texts, mask) if keep]
+
+    def config(self):
+        """
+        返回接受规则的可序列化描述；自定义 accept_fn 以其限定名表示。
+        """
+        accept_fn = self.accept_fn
+        if accept_fn is not None:
+            accept_fn = f"{getattr(accept_fn, '__module__', '')}.{getattr(accept_fn, '__qualname__', repr(accept_fn))}"
+        return {'bounds': self.bounds, 'accept_fn': accept_fn, 'ngram_size': self.ngram_size}
+
+    def get_stats(self):
+        return {'hist': {name: h.copy() for name, h in self.hist.items()}, 'seen': self.seen,
+                'accepted': self.accepted}
+
+    def merge_stats(self, stats):
+        """
+        合并其它进程返回的统计（get_stats 的结果）。
+        """
+        for name, h in stats['hist'].items():
+            self.hist[name] += h
+        self.seen += stats['seen']
+        self.accepted += stats['accepted']
+
+    def report(self, width=40):
+        """
+        返回文本形式的统计：接受比例与各信号的直方图。
+        """
+        lines = [f"质量过滤：共 {self.seen} 段，接受 {self.accepted} 段，删除 {self.seen - self.accepted} 段。"]
+        for name, edges in self.edges.items():
+            h = self.hist[name]
+            peak = max(int(h.max()), 1)
+            lines.append(f"  {name}:")
+            for lo, hi, n in zip(edges[:-1], edges[1:], h):
+                if n:
+                    lines.append(f"    [{lo:>9.3g}, {hi:>9.3g}) {n:>8d} {'#' * max(1, int(n / peak * width))}")
+        return "\n".join(lines)
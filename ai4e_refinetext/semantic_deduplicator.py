@@ -1,104 +1,410 @@
+import copy
+import os
 import sys
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
+from .compression import open_input, open_output
+from .corpus_index import CorpusIndex
+from .dedup_pipeline import DedupPipeline
+from .embedders import SentenceTransformerEmbedder
+from .embedding_cache import EmbeddingCache, cache_key
+from .embedding_store import EmbeddingStore
+from .prefilter import build_prefilter
+from .similarity_index import build_index
+from .threshold_sweep import ThresholdSweep, neighbour_graph
+
+
+class Deduplicator:
+    """
+    可复用的语义去重器：持有已加载的嵌入模型、相似度索引、前置过滤与嵌入缓存，
+    可以依次处理多个文件或任意文本可迭代对象，所有输入共用同一个索引（跨分片去重）。
+    出错时直接抛出异常。
+
+    参数说明：
+    - model_name: SentenceTransformer可加载的模型名称（未提供 embedder 时使用）
+    - similarity_threshold: 相似度阈值（0~1之间的余弦相似度）
+    - batch_size: 批处理大小，每次计算多少行的嵌入
+    - embedder: 嵌入后端实例，需提供 name、dim 与 encode(lines)；例如 embedders.HashingEmbedder()
+      可在不下载模型权重的情况下做快速粗去重。为 None 时加载 Sentence-BERT
+    - index_type: 相似度索引类型，'flat'（精确）、'ivf' 或 'hnsw'（近似，适合千万级语料）
+    - index_params: 传给索引构造函数的额外参数，例如 {'nlist': 1024, 'nprobe': 16}
+    - store_path: 已保留向量的磁盘存储文件路径（np.memmap），语料大于内存时使用；为 None 时存放在内存中
+    - exact_dedup: 是否在编码前用归一化精确哈希去掉重复的行（只差空白、标点或大小写的行视为重复），默认关闭
+    - minhash_threshold: 编码前 MinHash-LSH 近似去重的 Jaccard 阈值，为 None（默认）时关闭该阶段。
+      两个前置过滤阶段都会删除语义去重本身可能保留的行，开启后输出与只做语义去重不同
+    - minhash_params: 传给 MinHashLSHFilter 的额外参数，例如 {'ngram_size': 5, 'num_perm': 128}
+    - cache_dir: 嵌入缓存目录，重跑（调整阈值、追加文件）时只编码缓存中没有的行；为 None 时不使用缓存
+    - cache_max_entries: 嵌入缓存条目上限，超出时按最近最少使用淘汰
+    - index_dir: 持久化语料索引目录。提供时先加载历次运行保留下来的索引，新行同时与已发布语料比较，
+      commit() 时把保留的行追加进索引并原子保存；此时 index_type/index_params 只在首次建索引时生效，
+      store_path 被忽略
+    - pipeline: 处理文件时是否以流水线方式重叠执行读取、编码、检索与写出（结果与串行完全一致）
+    - encode_workers: 流水线中并行编码的线程数
+    - queue_size: 流水线各阶段之间队列的最大批次数
+    - token_budget: 编码时按 token 长度分桶组批，每个编码批次填充后的 token 总数上限；为 None 时按原顺序整批编码
+    - max_encode_batch: 分桶组批时每个编码批次的最大行数
+    - quantization: 已保留向量的量化方式，'int8' 或 'binary'；内存中只保存量化码，
+      阈值附近的候选再用磁盘上的全精度向量重算。为 None 时不量化。仅能与 index_type='flat' 一起使用
+    - rescore_margin: 量化模式下需要全精度重算的近似相似度区间半宽（阈值 ± margin），默认按量化方式选取
+    - audit_rate: 量化模式下抽查的查询比例，用于报告与全精度判定的一致率
+    """
+
+    def __init__(self, model_name='sentence-transformers/all-MiniLM-L6-v2', similarity_threshold=0.9,
+                 batch_size=1024, embedder=None, index_type='flat', index_params=None, store_path=None,
+                 exact_dedup=False, minhash_threshold=None, minhash_params=None,
+                 cache_dir=None, cache_max_entries=1_000_000, index_dir=None,
+                 pipeline=True, encode_workers=1, queue_size=4,
+                 token_budget=16384, max_encode_batch=256,
+                 quantization=None, rescore_margin=None, audit_rate=0.0):
+        self.similarity_threshold = similarity_threshold
+        self.batch_size = batch_size
+        self.pipeline = pipeline
+        self.encode_workers = encode_workers
+        self.queue_size = queue_size
+        # 加载嵌入模型，只加载一次
+        self.embedder = embedder or SentenceTransformerEmbedder(model_name, token_budget=token_budget,
+                                                                max_batch_size=max_encode_batch)
+
+        # 用于保存已保留行的向量，支持增量插入与 top-1 查询
+        index_params = dict(index_params or {})
+        if store_path is not None:
+            index_params['store_path'] = store_path
+        if quantization is not None:
+            if index_type != 'flat':
+                raise ValueError(f"量化模式只支持 index_type='flat'，当前为 {index_type}")
+            index_type = 'quantized'
+            index_params.update(mode=quantization, rescore_margin=rescore_margin, audit_rate=audit_rate)
+        dim = self.embedder.dim
+        self.corpus_index = None
+        if index_dir is not None:
+            index_params.pop('store_path', None)
+            self.corpus_index = CorpusIndex(index_dir, self.embedder.name, dim, index_type, index_params)
+            self.index = self.corpus_index.index
+        else:
+            self.index = build_index(index_type, dim, **index_params)
+        if hasattr(self.index, 'threshold'):
+            self.index.threshold = similarity_threshold
+        self.cache = EmbeddingCache(cache_dir, self.embedder.name, dim,
+                                    max_entries=cache_max_entries) if cache_dir else None
+        # 编码前的廉价过滤阶段，只有通过的行才进入嵌入模型
+        self.prefilter = build_prefilter(exact_dedup, minhash_threshold, minhash_params)
+        self.stats = {'lines': 0, 'kept': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def iter_unique(self, lines):
+        """
+        对任意文本可迭代对象去重，按原顺序逐个产出保留的行（已去除首尾空白，跳过空行）。
+        """
+        for batch in read_batches(lines, self.batch_size, self.prefilter, self.stats):
+            kept_lines, _ = process_batch(batch, self.embedder, self.index, self.similarity_threshold, self.cache)
+            self.stats['kept'] += len(kept_lines)
+            yield from kept_lines
+
+    def iter_flags(self, items):
+        """
+        对 (标记, 文本) 序列去重，按原顺序逐个产出 (标记, 文本, 是否保留)；文本已去除首尾空白，空行不产出。
+        保留的结果与对同样文本调用 iter_unique 完全一致，标记原样带回，供调用方把判定对应回章节、来源等结构。
+        """
+        pending = []
+        batch = []
+
+        def flush():
+            mask = keep_mask(encode_batch(batch, self.embedder, self.cache), self.index, self.similarity_threshold) \
+                if batch else []
+            self.stats['kept'] += int(np.count_nonzero(mask))
+            decisions = iter(mask)
+            for tag, text, accepted in pending:
+                yield tag, text, bool(next(decisions)) if accepted else False
+            pending.clear()
+            batch.clear()
+
+        for tag, line in items:
+            text = line.strip()
+            if not text:
+                continue
+            self.stats['lines'] += 1
+            # 未通过前置过滤的行不进入嵌入模型，直接判为删除
+            accepted = self.prefilter is None or self.prefilter.accept(text)
+            pending.append((tag, text, accepted))
+            if accepted:
+                batch.append(text)
+                if len(batch) >= self.batch_size:
+                    yield from flush()
+        yield from flush()
+
+    def deduplicate_file(self, input_file, output_file, encoding='utf-8'):
+        """
+        对一个文本文件去重并写出，返回 (处理行数, 保留行数)。
+        输入可以是 gzip / zstd / bz2 压缩文件（按文件头识别），输出文件名以 .gz / .zst / .bz2 结尾时边写边压缩。
+        pipeline 为 True 时读取、编码、检索、写出四个阶段重叠执行，结果与串行一致。
+        """
+        stats = {'lines': 0, 'kept': 0}
+        with open_input(input_file, 'r', encoding=encoding) as fin, \
+                open_output(output_file, 'wb') as fout, \
+                tqdm(desc="Processing", unit="line") as pbar:
+            batches = read_batches(fin, self.batch_size, self.prefilter, stats)
+
+            def write(kept_lines):
+                stats['kept'] += write_lines(kept_lines, fout, encoding)
+
+            if self.pipeline:
+                runner = DedupPipeline(batches, lambda batch: encode_batch(batch, self.embedder, self.cache),
+                                       lambda batch, embs: select_unique(batch, embs, self.index,
+                                                                         self.similarity_threshold)[0],
+                                       write, encode_workers=self.encode_workers, queue_size=self.queue_size)
+
+                def on_batch(batch):
+                    pbar.update(len(batch))
+                    pbar.set_postfix(runner.queue_depths())
+
+                runner.run(on_batch)
+            else:
+                for batch in batches:
+                    kept_lines, _ = process_batch(batch, self.embedder, self.index, self.similarity_threshold,
+                                                  self.cache)
+                    write(kept_lines)
+                    pbar.update(len(batch))
+
+        self.stats['lines'] += stats['lines']
+        self.stats['kept'] += stats['kept']
+        print(f"处理完成！共处理 {stats['lines']} 行，最终输出 {stats['kept']} 行。", file=sys.stderr)
+        return stats['lines'], stats['kept']
+
+    def sweep(self, input_file, thresholds, encoding='utf-8', store_path=None):
+        """
+        阈值扫描：对输入文件只编码一次（命中嵌入缓存的行不再编码），返回可在多个阈值下评估、写出的 ThresholdSweep。
+        在前置过滤状态的副本上运行，不修改当前索引；已有索引中的向量视为已发布语料参与比较，
+        因此结果与随后以相同阈值调用 deduplicate_file 一致。
+        store_path 为嵌入的磁盘存储路径，为 None 时存放在内存中。
+        """
+        prefilter = copy.deepcopy(self.prefilter)
+        lines = []
+        embs = EmbeddingStore(self.embedder.dim, path=store_path)
+        base_scores = []
+        with open_input(input_file, 'r', encoding=encoding) as fin:
+            for batch in tqdm(read_batches(fin, self.batch_size, prefilter), desc="Encoding", unit="batch"):
+                batch_embs = encode_batch(batch, self.embedder, self.cache)
+                lines.extend(batch)
+                embs.append(batch_embs)
+                base_scores.append(self.index.search(batch_embs)[0])
+        if self.cache is not None:
+            self.cache.flush()
+        base_scores = np.concatenate(base_scores) if base_scores else None
+        return ThresholdSweep(lines, embs.view(), min(thresholds), base_scores)
+
+    def report(self):
+        """
+        打印前置过滤、嵌入缓存与量化检索的统计信息。
+        """
+        if self.cache is not None:
+            print(f"嵌入缓存：命中 {self.cache.hits} 行，新编码 {self.cache.misses} 行。", file=sys.stderr)
+        if self.prefilter is not None:
+            removed = "，".join(f"{name} 阶段删除 {n} 行" for name, n in self.prefilter.report().items())
+            print(f"编码前过滤：{removed}。", file=sys.stderr)
+        if hasattr(self.index, 'report'):
+            print(self.index.report(), file=sys.stderr)
+
+    def commit(self, **run_info):
+        """
+        写回嵌入缓存；使用持久化语料索引时把本次保留的行原子保存进索引。
+        """
+        if self.cache is not None:
+            self.cache.flush()
+        if self.corpus_index is not None:
+            run_info.setdefault('lines', self.stats['lines'])
+            run_info.setdefault('kept', self.stats['kept'])
+            self.corpus_index.commit(similarity_threshold=self.similarity_threshold, **run_info)
+            print(f"语料索引已保存：共 {len(self.corpus_index)} 条。", file=sys.stderr)
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.flush()
+        if self.corpus_index is not None:
+            self.corpus_index.close()
+            self.corpus_index = None
 
 
 def semantic_deduplicate(input_file, output_file, model_name='sentence-transformers/all-MiniLM-L6-v2',
-                         similarity_threshold=0.9, batch_size=1024, encoding='utf-8'):
+                         similarity_threshold=0.9, batch_size=1024, encoding='utf-8', **options):
     """
     使用Sentence-BERT模型对文本进行语义去重的基础示例。
 
     参数说明：
-    - input_file: 输入文本文件，每行一条文本记录
-    - output_file: 输出去重后的文本文件
+    - input_file: 输入文本文件，每行一条文本记录；可以是 gzip / zstd / bz2 压缩文件
+    - output_file: 输出去重后的文本文件；以 .gz / .zst / .bz2 结尾时压缩写出
     - model_name: SentenceTransformer可加载的模型名称
     - similarity_threshold: 相似度阈值（0~1之间的余弦相似度）
     - batch_size: 批处理大小，每次计算多少行的嵌入
     - encoding: 文件编码
+    - options: 其余参数见 Deduplicator（索引类型、前置过滤、缓存、持久化索引、流水线、量化等）
+
+    返回 (处理行数, 保留行数)。模型加载失败、参数不合法（如量化与非 flat 索引同用、持久化索引的模型不一致、
+    索引被其他任务锁定）等错误直接抛出，不会被当作成功。
+    """
+    # 加载Sentence-BERT模型
+    with Deduplicator(model_name, similarity_threshold, batch_size, **options) as dedup:
+        counts = dedup.deduplicate_file(input_file, output_file, encoding)
+        dedup.report()
+        dedup.commit(input_file=os.path.abspath(input_file))
+    return counts
+
+
+def sweep_thresholds(input_file, thresholds=(0.8, 0.85, 0.9, 0.95), output_file=None, output_threshold=None,
+                     model_name='sentence-transformers/all-MiniLM-L6-v2', batch_size=1024, encoding='utf-8',
+                     n_samples=3, **options):
+    """
+    阈值扫描：一次编码评估多个相似度阈值，代替以不同阈值多次完整运行去重。
+
+    参数说明：
+    - input_file: 输入文本文件，每行一条文本记录
+    - thresholds: 需要评估的相似度阈值列表
+    - output_file: 选定阈值后的输出文件，为 None 时只打印报告
+    - output_threshold: 写出 output_file 时使用的阈值，不能低于 thresholds 中的最小值
+    - model_name: SentenceTransformer可加载的模型名称
+    - batch_size: 批处理大小，每次计算多少行的嵌入
+    - encoding: 文件编码
+    - n_samples: 每个阈值打印的删除样例数
+    - options: 其余参数见 Deduplicator；建议提供 cache_dir，之后以选定阈值正式运行时无需重新编码
+    返回每个阈值的统计列表，见 ThresholdSweep.report。
     """
-    try:
-        # 加载Sentence-BERT模型
-        model = SentenceTransformer(model_name)
-    except Exception as e:
-        print(f"加载模型时出错: {e}", file=sys.stderr)
-        return
+    if output_file is not None and output_threshold is None:
+        raise ValueError("写出结果时需要指定 output_threshold")
+    thresholds = sorted(set(thresholds) | ({output_threshold} if output_threshold is not None else set()))
+    with Deduplicator(model_name, thresholds[0], batch_size, **options) as dedup:
+        sweep = dedup.sweep(input_file, thresholds, encoding)
+    rows = sweep.report(thresholds, n_samples)
+    if output_file is not None:
+        kept = sweep.write(output_file, output_threshold, encoding)
+        print(f"已按阈值 {output_threshold} 写出 {kept} 行到 {output_file}", file=sys.stderr)
+    return rows
 
-    # 用于保存已保留行的向量
-    retained_embeddings = []
-    retained_texts = []
 
-    with open(input_file, 'r', encoding=encoding) as fin, \
-            open(output_file, 'w', encoding=encoding) as fout:
+def read_batches(fin, batch_size, prefilter=None, stats=None):
+    """
+    逐行读取文本，跳过空行与未通过前置过滤的行，按 batch_size 组批产出。
+    stats['lines'] 累计读到的非空行数。
+    """
+    buffer_lines = []
+    for line in fin:
+        text = line.strip()
+        if not text:
+            continue
+        if stats is not None:
+            stats['lines'] += 1
+        if prefilter is not None and not prefilter.accept(text):
+            continue
+        buffer_lines.append(text)
+        # 批处理，当积累到一定数量时才计算嵌入
+        if len(buffer_lines) >= batch_size:
+            yield buffer_lines
+            buffer_lines = []
+    # 处理剩余行
+    if buffer_lines:
+        yield buffer_lines
 
-        buffer_lines = []
-        line_count = 0
-        unique_count = 0
 
-        for line in tqdm(fin, desc="Processing", unit="line"):
-            text = line.strip()
-            if not text:
-                continue
-            buffer_lines.append(text)
-
-            # 批处理，当积累到一定数量时才计算嵌入
-            if len(buffer_lines) >= batch_size:
-                unique_lines = process_batch(buffer_lines, model, retained_embeddings, retained_texts,
-                                             similarity_threshold)
-                # 将去重后保留的行写入文件，并更新retained_embeddings
-                for t, emb in unique_lines:
-                    fout.write(t + "\n")
-                    retained_embeddings.append(emb)
-                    retained_texts.append(t)
-                unique_count += len(unique_lines)
-                line_count += len(buffer_lines)
-                buffer_lines = []
-
-        # 处理剩余行
-        if buffer_lines:
-            unique_lines = process_batch(buffer_lines, model, retained_embeddings, retained_texts, similarity_threshold)
-            for t, emb in unique_lines:
-                fout.write(t + "\n")
-                retained_embeddings.append(emb)
-                retained_texts.append(t)
-            unique_count += len(unique_lines)
-            line_count += len(buffer_lines)
-
-        print(f"处理完成！共处理 {line_count} 行，最终输出 {unique_count} 行。", file=sys.stderr)
-
-
-def process_batch(lines, model, retained_embeddings, retained_texts, similarity_threshold):
-    """
-    对一批文本行进行嵌入计算，然后对每行查找与已保留文本的最高相似度，决定是否保留。
-    返回 (text, embedding) 的列表。
+def write_lines(kept_lines, fout, encoding='utf-8'):
+    """
+    将保留的行写入二进制输出文件，返回写出行数。已保留的文本不在内存中保存。
+    """
+    if not kept_lines:
+        return 0
+    fout.write("".join(t + "\n" for t in kept_lines).encode(encoding))
+    return len(kept_lines)
+
+
+def process_batch(lines, embedder, index, similarity_threshold, cache=None):
+    """
+    对一批文本行进行嵌入计算，并同时与已保留文本、本批中更早的文本比较相似度，决定是否保留；
+    保留的行加入索引。返回 (保留的文本列表, 对应的嵌入矩阵)。
     """
     if len(lines) == 0:
-        return []
-
-    embs = model.encode(lines, convert_to_numpy=True)
-    # 归一化，使向量长度为1
-    embs = embs / np.linalg.norm(embs, axis=1, keepdims=True)
-
-    results = []
-    # 若尚无已保留文本，全部保留
-    if len(retained_embeddings) == 0:
-        for i, line in enumerate(lines):
-            results.append((line, embs[i]))
-        return results
-
-    # 将已保留的嵌入合并为矩阵
-    retained_matrix = np.vstack(retained_embeddings) if len(retained_embeddings) > 0 else None
-    for i, line in enumerate(lines):
-        emb = embs[i]
-        # 计算与已保留嵌入的相似度（点积即为余弦相似度，因为已归一化）
-        scores = np.dot(retained_matrix, emb)
-        max_score = np.max(scores) if len(scores) > 0 else 0
-        if max_score < similarity_threshold:
-            # 没有相似度超过阈值，保留该文本
-            results.append((line, emb))
-        # 否则不保留
-
-    return results
+        return [], None
+    return select_unique(lines, encode_batch(lines, embedder, cache), index, similarity_threshold)
+
+
+def encode_batch(lines, embedder, cache=None):
+    """
+    计算一批文本的嵌入并归一化，使向量长度为1。
+    """
+    embs = encode_lines(lines, embedder, cache)
+    return embs / np.linalg.norm(embs, axis=1, keepdims=True)
+
+
+def select_unique(lines, embs, index, similarity_threshold):
+    """
+    按去重内核选出保留的行并加入索引，返回 (保留的文本列表, 对应的嵌入矩阵)。
+    """
+    kept = np.flatnonzero(keep_mask(embs, index, similarity_threshold))
+    return [lines[i] for i in kept], embs[kept]
+
+
+def keep_mask(embs, index, similarity_threshold):
+    """
+    按去重内核计算一批向量的保留掩码，并把保留的向量加入索引。
+    """
+    mask = dedup_batch_mask(embs, index, similarity_threshold)
+    if mask.any():
+        index.add(embs[mask])
+    return mask
+
+
+def encode_lines(lines, embedder, cache=None):
+    """
+    计算一批文本的嵌入；提供缓存时先查缓存，只编码未命中的行并写回缓存。
+    """
+    if cache is None:
+        return embedder.encode(lines)
+    keys = np.fromiter((cache_key(t, cache.model_name) for t in lines), dtype=np.uint64, count=len(lines))
+    found, embs = cache.get_many(keys)
+    missing = np.flatnonzero(~found)
+    if len(missing):
+        embs[missing] = embedder.encode([lines[i] for i in missing])
+        cache.put_many(keys[missing], embs[missing])
+    return embs
+
+
+def dedup_batch_mask(embs, index, similarity_threshold, block_size=1024):
+    """
+    批内去重内核：用矩阵乘法计算 批×已保留 与 批×批 的相似度，再按原顺序贪心抑制。
+    第 i 行被保留，当且仅当它与所有已保留文本、以及本批中排在它之前且被保留的行的相似度都低于阈值，
+    与逐行顺序处理的结果完全一致。返回布尔保留掩码。
+    批×批 按 block_size × block_size 分块计算，只保留达到阈值的相似对（稀疏邻接表），
+    临时内存为 O(block_size² + 相似对数)，不随批大小平方增长。
+    """
+    # 批×已保留：点积即为余弦相似度（已归一化）；索引为空时为 -inf
+    retained_scores, _ = index.search(embs)
+    candidates = retained_scores < similarity_threshold
+
+    # 批×批：每行与排在它之前、相似度达到阈值的行
+    indptr, neighbours, _ = neighbour_graph(embs, similarity_threshold, block_size)
+    rows = np.repeat(np.arange(len(embs)), np.diff(indptr))
+    return greedy_suppress(rows, neighbours, candidates)
+
+
+def greedy_suppress(rows, neighbours, candidates):
+    """
+    按顺序的贪心抑制：(rows[k], neighbours[k]) 表示 neighbours[k] < rows[k] 且两者相似。
+    每轮按邻接表一次性统计所有未决行：已有更早的保留邻居则删除，
+    更早的邻居全部已判定且都未保留则保留。每轮至少判定排在最前的未决行，结果与顺序扫描相同。
+    """
+    n = len(candidates)
+    # 不是候选的行不会被保留，也不会抑制其他行，与之相连的相似对可以丢弃
+    related = candidates[rows] & candidates[neighbours]
+    rows, neighbours = rows[related], neighbours[related]
+    keep = np.zeros(n, dtype=bool)
+    undecided = candidates.copy()
+    while undecided.any():
+        has_kept = np.bincount(rows, weights=keep[neighbours], minlength=n) > 0
+        has_open = np.bincount(rows, weights=(keep | undecided)[neighbours], minlength=n) > 0
+        keep[undecided & ~has_open] = True
+        undecided &= has_open & ~has_kept
+    return keep
 
 
 if __name__ == '__main__':
@@ -0,0 +1,190 @@
+import json
+import math
+import os
+import shutil
+import sys
+import zipfile
+import numpy as np
+from tqdm import tqdm
+from .compression import open_compressed, open_input, strip_compression_suffix
+from .jsonl_shards import JsonlShardWriter, manifest_path
+
+# 写桶时每个桶文件的写缓冲区上限与下限；实际大小为内存预算除以同时打开的桶数，全部缓冲区合计不超过 bucket_bytes
+BUCKET_BUFFER_SIZE = 1 << 20
+MIN_BUCKET_BUFFER_SIZE = 4096
+# 同时打开的桶文件数上限；桶超出内存预算时第二遍会再次拆分，不依赖桶数估计准确
+MAX_BUCKETS = 512
+# 第一遍每次成批抽样、分桶的记录数
+CHUNK_RECORDS = 8192
+# 第二遍拆分超大桶的最大层数（单条记录超过内存预算时无法再拆小）
+MAX_SPLIT_DEPTH = 4
+
+
+def _is_jsonl(name):
+    return strip_compression_suffix(name).endswith('.jsonl')
+
+
+def _lines(f):
+    for line in f:
+        if line.strip():
+            yield line if line.endswith(b"\n") else line + b"\n"
+
+
+def iter_corpus_lines(folder, prefix='part'):
+    """
+    逐行读取一个语料目录，产出 (来源, 以换行结尾的 JSONL 字节)，不解析 JSON，也不整体读入任何分片：
+
+    - 有 txt_to_jsonl 分片清单时按清单读取，来源为清单中记录的原始 txt 文件名
+    - 否则读取目录下的 .jsonl（可以是 gzip / zstd / bz2 压缩的，按文件头识别）文件与代码语料打包的 .zip（其中的 .jsonl 成员），来源为文件名
+    """
+    path = manifest_path(folder, prefix)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        for shard in manifest['shards']:
+            runs = iter(shard['sources'])
+            source, left = None, 0
+            with open_compressed(os.path.join(folder, shard['file']), manifest['compression']) as f:
+                for line in _lines(f):
+                    while left <= 0:
+                        source, left = next(runs, (None, math.inf))
+                    left -= 1
+                    yield source, line
+        return
+    for name in sorted(os.listdir(folder)):
+        file_path = os.path.join(folder, name)
+        if name.endswith('.zip'):
+            with zipfile.ZipFile(file_path) as zf:
+                for member in zf.infolist():
+                    if member.filename.endswith('.jsonl'):
+                        with zf.open(member) as f:
+                            for line in _lines(f):
+                                yield name, line
+        elif _is_jsonl(name):
+            with open_input(file_path, 'rb') as f:
+                for line in _lines(f):
+                    yield name, line
+
+
+def _estimate_bytes(folder, prefix='part'):
+    # 估计语料的未压缩字节数，只用于决定第一遍的桶数
+    path = manifest_path(folder, prefix)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return sum(shard['bytes'] for shard in json.load(f)['shards'])
+    total = 0
+    for name in os.listdir(folder):
+        if name.endswith('.zip') or _is_jsonl(name):
+            size = os.path.getsize(os.path.join(folder, name))
+            total += size if name.endswith('.jsonl') else size * 4
+    return total
+
+
+def _buffer_size(bucket_bytes, n_buckets):
+    return max(MIN_BUCKET_BUFFER_SIZE, min(BUCKET_BUFFER_SIZE, bucket_bytes // n_buckets))
+
+
+def _scatter(lines_with_weights, n_buckets, bucket_paths, rng, counts=None, buffer_size=BUCKET_BUFFER_SIZE):
+    # 按权重抽样（整数部分复制，小数部分按概率再取一份）并把每份随机写入一个桶，返回写出的记录数
+    files = [open(p, 'ab', buffering=buffer_size) for p in bucket_paths]
+    written = 0
+    try:
+        chunk = []
+
+        def flush():
+            nonlocal written
+            weights = np.array([w for _, _, w in chunk], dtype=np.float64)
+            copies = np.floor(weights).astype(np.int64) + (rng.random(len(chunk)) < weights % 1)
+            buckets = rng.integers(n_buckets, size=int(copies.sum()))
+            k = 0
+            for (source, line, _), n in zip(chunk, copies):
+                for _ in range(n):
+                    files[buckets[k]].write(line)
+                    k += 1
+                if counts is not None and n:
+                    counts[source] = counts.get(source, 0) + int(n)
+            written += k
+            chunk.clear()
+
+        for item in lines_with_weights:
+            chunk.append(item)
+            if len(chunk) >= CHUNK_RECORDS:
+                flush()
+        if chunk:
+            flush()
+    finally:
+        for f in files:
+            f.close()
+    return written
+
+
+def _emit_bucket(path, writer, seed, key, bucket_bytes, tmp_folder):
+    # 第二遍：桶不超过内存预算时整体读入、打乱后写出；超出时（数据倾斜或估计偏小）再拆成若干子桶递归处理
+    size = os.path.getsize(path)
+    rng = np.random.default_rng([seed, *key])
+    if size > bucket_bytes and len(key) <= MAX_SPLIT_DEPTH:
+        n_sub = min(MAX_BUCKETS, math.ceil(size / bucket_bytes) * 2)
+        sub_paths = [os.path.join(tmp_folder, f"{'-'.join(map(str, key))}-{i}.jsonl") for i in range(n_sub)]
+        with open(path, 'rb') as f:
+            _scatter(((None, line, 1.0) for line in f), n_sub, sub_paths, rng,
+                     buffer_size=_buffer_size(bucket_bytes, n_sub))
+        os.remove(path)
+        for i, sub_path in enumerate(sub_paths):
+            _emit_bucket(sub_path, writer, seed, (*key, i), bucket_bytes, tmp_folder)
+        return
+    with open(path, 'rb') as f:
+        lines = f.readlines()
+    os.remove(path)
+    for i in rng.permutation(len(lines)):
+        writer.write_line(lines[i])
+
+
+def shuffle_jsonl_shards(inputs, output_folder, seed=0, weights=None, bucket_bytes=256 << 20, prefix='part',
+                         output_prefix='part', max_bytes=256 << 20, max_records=None, compression='gzip'):
+    """
+    外存全局打乱与按来源混合：两遍分桶打乱，内存占用以 bucket_bytes 为上限，与语料大小无关。
+
+    - 第一遍流式读取全部输入，按来源权重抽样后把每条记录随机追加到一个临时桶文件（顺序读写，磁盘速度）
+    - 第二遍逐个桶读入内存、随机排列后写出；桶之间本身已是随机划分，拼接起来即为全局均匀的随机排列
+    同一 seed、输入与参数得到完全相同的输出。输出为 JsonlShardWriter 分片，清单的 info 中记录 seed、权重与各来源的记录数。
+    返回 {来源: 抽样后的记录数}。
+
+    参数说明：
+    - inputs: 语料目录或目录列表，读取方式见 iter_corpus_lines
+    - output_folder: 输出目录
+    - seed: 随机种子
+    - weights: {来源文件名或输入目录: 抽样权重}，来源优先；默认 1。权重 2 表示每条记录出现两次，
+      0.5 表示以一半概率保留，0 表示剔除
+    - bucket_bytes: 第二遍单个桶的内存预算（字节）
+    - prefix: 输入分片清单的文件名前缀
+    - output_prefix, max_bytes, max_records, compression: 输出分片的参数，见 JsonlShardWriter
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    weights = dict(weights or {})
+    tmp_folder = os.path.join(output_folder, '.shuffle_tmp')
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    try:
+        expected = sum(_estimate_bytes(folder, prefix) for folder in inputs) * max([1.0, *weights.values()])
+        n_buckets = int(min(MAX_BUCKETS, max(1, math.ceil(expected / bucket_bytes))))
+        bucket_paths = [os.path.join(tmp_folder, f"{i}.jsonl") for i in range(n_buckets)]
+
+        def weighted():
+            for folder in inputs:
+                default = weights.get(folder, weights.get(os.path.basename(os.path.normpath(folder)), 1.0))
+                for source, line in iter_corpus_lines(folder, prefix):
+                    yield source, line, weights.get(source, default)
+
+        counts = {}
+        rng = np.random.default_rng([seed, 0])
+        total = _scatter(tqdm(weighted(), desc="Shuffle-scatter", unit="rec"), n_buckets, bucket_paths, rng,
+                         counts, _buffer_size(bucket_bytes, n_buckets))
+        with JsonlShardWriter(output_folder, output_prefix, max_bytes, max_records, compression) as writer:
+            writer.info = {'seed': seed, 'weights': weights, 'source_records': counts}
+            for i, path in enumerate(tqdm(bucket_paths, desc="Shuffle-gather")):
+                _emit_bucket(path, writer, seed, (1, i), bucket_bytes, tmp_folder)
+    finally:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+    print(f"打乱完成：{total} 条记录，{len(writer.shards)} 个分片。", file=sys.stderr)
+    return counts
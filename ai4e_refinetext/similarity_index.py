@@ -0,0 +1,631 @@
+import heapq
+import json
+import math
+import os
+import tempfile
+import weakref
+import numpy as np
+from .embedding_store import EmbeddingStore
+
+
+class FlatIndex:
+    """
+    精确暴力检索：分块矩阵乘法计算与全部已入库向量的相似度。
+
+    参数说明：
+    - dim: 向量维度
+    - block_size: 每次参与矩阵乘法的入库向量行数，用于限制临时内存
+    - store_path: 向量存储文件路径，提供时用 np.memmap 存放在磁盘上
+    """
+
+    def __init__(self, dim, block_size=65536, store_path=None):
+        self.dim = dim
+        self.block_size = block_size
+        self._vectors = EmbeddingStore(dim, path=store_path)
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def add(self, vectors):
+        self._vectors.append(vectors)
+
+    def search(self, queries):
+        """
+        返回每个查询向量的 top-1 (相似度, 编号)，索引为空时相似度为 -inf、编号为 -1。
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        return _exact_search(queries, self._vectors.view(), self.block_size)
+
+    def get_delta(self):
+        """
+        返回自上次 clear_delta() 以来除向量外的索引状态变化（numpy 数组字典），用于增量持久化；
+        大小与新增的数据成正比。对空索引依次 apply_delta 历次的变化即可重建索引。
+        """
+        return {}
+
+    def apply_delta(self, delta):
+        pass
+
+    def clear_delta(self):
+        """
+        变化已持久化后调用，之后的 get_delta() 只包含新的变化。
+        """
+
+
+def _exact_search(queries, stored, block_size=65536):
+    best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+    best_ids = np.full(len(queries), -1, dtype=np.int64)
+    for start in range(0, len(stored), block_size):
+        block = stored[start:start + block_size]
+        scores = queries @ block.T
+        idx = np.argmax(scores, axis=1)
+        top = scores[np.arange(len(queries)), idx]
+        better = top > best_scores
+        best_scores[better] = top[better]
+        best_ids[better] = idx[better] + start
+    return best_scores, best_ids
+
+
+class IVFIndex:
+    """
+    倒排文件（IVF）检索：先用球面 k-means 将向量划分到 nlist 个桶，查询时只扫描最近的 nprobe 个桶。
+
+    入库数量达到 train_size 之前退化为精确检索；达到后一次性训练聚类中心并把已有向量分桶。
+
+    参数说明：
+    - dim: 向量维度
+    - nlist: 聚类中心（桶）数量
+    - nprobe: 每次查询扫描的桶数
+    - train_size: 触发训练所需的向量数，默认 nlist * 39
+    - n_iter: k-means 迭代次数
+    - seed: 随机种子
+    - store_path: 向量存储文件路径，提供时用 np.memmap 存放在磁盘上；各桶只在内存中保存向量编号
+    """
+
+    def __init__(self, dim, nlist=256, nprobe=8, train_size=None, n_iter=10, seed=0, store_path=None):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = min(nprobe, nlist)
+        self.train_size = train_size or nlist * 39
+        self.n_iter = n_iter
+        self._rng = np.random.default_rng(seed)
+        self._vectors = EmbeddingStore(dim, path=store_path)
+        self._centroids = None
+        self._list_ids = []
+        # 上次持久化时各桶的长度与是否已保存聚类中心，get_delta 只输出其后追加的编号
+        self._saved_sizes = np.zeros(nlist, dtype=np.int64)
+        self._centroids_saved = False
+
+    def __len__(self):
+        return len(self._vectors)
+
+    @property
+    def is_trained(self):
+        return self._centroids is not None
+
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        start = self._vectors.append(vectors)
+        if not self.is_trained:
+            if len(self._vectors) >= self.train_size:
+                self._train(self._vectors.view())
+            return
+        self._assign(vectors, np.arange(start, start + len(vectors), dtype=np.int64))
+
+    def _train(self, vectors):
+        init = self._rng.choice(len(vectors), self.nlist, replace=False)
+        centroids = vectors[init].copy()
+        for _ in range(self.n_iter):
+            labels = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # 空桶保留原中心
+            empty = norms[:, 0] == 0
+            sums[empty] = centroids[empty]
+            norms[empty] = 1.0
+            centroids = sums / norms
+        self._centroids = centroids.astype(np.float32)
+        self._list_ids = [EmbeddingStore(1, dtype=np.int64, initial_capacity=16) for _ in range(self.nlist)]
+        self._assign(vectors, np.arange(len(vectors), dtype=np.int64))
+
+    def _assign(self, vectors, ids):
+        labels = np.argmax(vectors @ self._centroids.T, axis=1)
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(self.nlist + 1))
+        for lst in range(self.nlist):
+            members = order[bounds[lst]:bounds[lst + 1]]
+            if len(members):
+                self._list_ids[lst].append(ids[members])
+
+    def get_delta(self):
+        if not self.is_trained:
+            return {}
+        # 各桶自上次保存后追加的编号按 CSR 格式拼接；聚类中心只在训练后第一次保存
+        new_ids = [ids.view()[int(saved):, 0] for ids, saved in zip(self._list_ids, self._saved_sizes)]
+        delta = {
+            'list_offsets': np.concatenate(([0], np.cumsum([len(ids) for ids in new_ids]))).astype(np.int64),
+            'list_ids': np.concatenate(new_ids),
+        }
+        if not self._centroids_saved:
+            delta['centroids'] = self._centroids
+        return delta
+
+    def apply_delta(self, delta):
+        if 'centroids' in delta and not self.is_trained:
+            self._centroids = np.asarray(delta['centroids'], dtype=np.float32)
+            self._list_ids = [EmbeddingStore(1, dtype=np.int64, initial_capacity=16) for _ in range(self.nlist)]
+        if 'list_offsets' not in delta:
+            return
+        offsets, ids = delta['list_offsets'], delta['list_ids']
+        for lst in range(self.nlist):
+            if offsets[lst + 1] > offsets[lst]:
+                self._list_ids[lst].append(ids[offsets[lst]:offsets[lst + 1]])
+        self.clear_delta()
+
+    def clear_delta(self):
+        if self.is_trained:
+            self._saved_sizes = np.array([len(ids) for ids in self._list_ids], dtype=np.int64)
+            self._centroids_saved = True
+
+    def search(self, queries):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if not self.is_trained:
+            return _exact_search(queries, self._vectors.view())
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+        # 每个查询选出最近的 nprobe 个桶，再按桶聚合查询，一个桶一次矩阵乘法
+        probes = np.argpartition(-(queries @ self._centroids.T), self.nprobe - 1, axis=1)[:, :self.nprobe]
+        query_idx = np.repeat(np.arange(len(queries)), self.nprobe)
+        list_idx = probes.ravel()
+        order = np.argsort(list_idx, kind='stable')
+        bounds = np.searchsorted(list_idx[order], np.arange(self.nlist + 1))
+        data = self._vectors.view()
+        for lst in range(self.nlist):
+            if bounds[lst] == bounds[lst + 1] or len(self._list_ids[lst]) == 0:
+                continue
+            q = query_idx[order[bounds[lst]:bounds[lst + 1]]]
+            ids = self._list_ids[lst].view()[:, 0]
+            scores = queries[q] @ data[ids].T
+            idx = np.argmax(scores, axis=1)
+            top = scores[np.arange(len(q)), idx]
+            better = top > best_scores[q]
+            best_scores[q[better]] = top[better]
+            best_ids[q[better]] = ids[idx[better]]
+        return best_scores, best_ids
+
+
+class HNSWIndex:
+    """
+    HNSW 风格的分层近邻图检索，支持逐条增量插入。
+
+    参数说明：
+    - dim: 向量维度
+    - M: 每个节点在上层保留的邻居数（第 0 层为 2*M）
+    - ef_construction: 插入时的候选队列长度
+    - ef_search: 查询时的候选队列长度
+    - seed: 随机种子（决定节点层数）
+    - store_path: 向量存储文件路径，提供时用 np.memmap 存放在磁盘上；邻接图保存在内存中
+    """
+
+    def __init__(self, dim, M=16, ef_construction=100, ef_search=64, seed=0, store_path=None):
+        self.dim = dim
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._level_mult = 1.0 / math.log(M)
+        self._rng = np.random.default_rng(seed)
+        self._vectors = EmbeddingStore(dim, path=store_path)
+        # _graph[level][node] -> 邻居编号列表
+        self._graph = []
+        self._entry = -1
+        self._max_level = -1
+        # _dirty[level]: 上次持久化后新增或邻居表被改动的节点，get_delta 只输出这些节点的邻居表
+        self._dirty = []
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        for vec in vectors:
+            self._insert(vec)
+
+    def _search_layer(self, query, entry_points, ef, level):
+        data = self._vectors.view()
+        links = self._graph[level]
+        visited = set(entry_points)
+        sims = data[entry_points] @ query
+        candidates = [(-s, n) for s, n in zip(sims.tolist(), entry_points)]
+        heapq.heapify(candidates)
+        results = [(s, n) for s, n in zip(sims.tolist(), entry_points)]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+            fresh = [n for n in links.get(node, ()) if n not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            for sim, n in zip((data[fresh] @ query).tolist(), fresh):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, n))
+                    heapq.heappush(results, (sim, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted(results, reverse=True)
+
+    def _greedy_descend(self, query, top_level):
+        entry = [self._entry]
+        for level in range(self._max_level, top_level, -1):
+            entry = [self._search_layer(query, entry, 1, level)[0][1]]
+        return entry
+
+    def _insert(self, vec):
+        node = len(self._vectors)
+        self._vectors.append(vec)
+        level = int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+        while len(self._graph) <= level:
+            self._graph.append({})
+            self._dirty.append(set())
+        for lvl in range(level + 1):
+            self._graph[lvl][node] = []
+            self._dirty[lvl].add(node)
+        if self._entry < 0:
+            self._entry, self._max_level = node, level
+            return
+        entry = self._greedy_descend(vec, level)
+        data = self._vectors.view()
+        for lvl in range(min(level, self._max_level), -1, -1):
+            found = self._search_layer(vec, entry, self.ef_construction, lvl)
+            max_links = self.M0 if lvl == 0 else self.M
+            neighbours = [n for _, n in found[:self.M]]
+            self._graph[lvl][node] = neighbours
+            for n in neighbours:
+                links = self._graph[lvl][n]
+                links.append(node)
+                self._dirty[lvl].add(n)
+                if len(links) > max_links:
+                    # 超出上限时只保留与该节点最相似的邻居
+                    sims = data[links] @ data[n]
+                    keep = np.argsort(-sims)[:max_links]
+                    self._graph[lvl][n] = [links[i] for i in keep]
+            entry = [n for _, n in found]
+        if level > self._max_level:
+            self._entry, self._max_level = node, level
+
+    def get_delta(self):
+        # 每层只保存新增节点与邻居表被改动节点的完整邻居表，按 CSR 格式：nodes 为节点，offsets/links 为其邻居
+        if self._entry < 0:
+            return {}
+        delta = {
+            'entry': np.int64(self._entry),
+            'max_level': np.int64(self._max_level),
+            'rng_state': np.array(json.dumps(self._rng.bit_generator.state)),
+        }
+        for level, dirty in enumerate(self._dirty):
+            links = self._graph[level]
+            nodes = sorted(dirty)
+            sizes = [len(links[n]) for n in nodes]
+            delta[f'nodes_{level}'] = np.array(nodes, dtype=np.int64)
+            delta[f'offsets_{level}'] = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+            delta[f'links_{level}'] = np.fromiter((x for n in nodes for x in links[n]),
+                                                  dtype=np.int64, count=int(sum(sizes)))
+        return delta
+
+    def apply_delta(self, delta):
+        if 'entry' not in delta:
+            return
+        self._entry = int(delta['entry'])
+        self._max_level = int(delta['max_level'])
+        self._rng.bit_generator.state = json.loads(str(delta['rng_state']))
+        level = 0
+        while f'nodes_{level}' in delta:
+            if len(self._graph) <= level:
+                self._graph.append({})
+                self._dirty.append(set())
+            nodes, offsets = delta[f'nodes_{level}'].tolist(), delta[f'offsets_{level}']
+            links = delta[f'links_{level}'].tolist()
+            self._graph[level].update((n, links[offsets[i]:offsets[i + 1]]) for i, n in enumerate(nodes))
+            level += 1
+        self.clear_delta()
+
+    def clear_delta(self):
+        for dirty in self._dirty:
+            dirty.clear()
+
+    def search(self, queries):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+        if self._entry < 0:
+            return best_scores, best_ids
+        for i, query in enumerate(queries):
+            entry = self._greedy_descend(query, 0)
+            sim, node = self._search_layer(query, entry, self.ef_search, 0)[0]
+            best_scores[i], best_ids[i] = sim, node
+        return best_scores, best_ids
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(words):
+    # numpy >= 2.0 提供 bitwise_count（硬件 popcnt 指令）；更早的版本按字节查 256 项表
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    return _POPCOUNT_TABLE[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def _as_words(codes):
+    # 打包的位码 (n, 字节数) 补齐到 8 字节的整数倍后按 uint64 查看，补齐的位全为 0，不影响汉明距离
+    codes = np.ascontiguousarray(codes)
+    pad = -codes.shape[1] % 8
+    if pad:
+        codes = np.pad(codes, ((0, 0), (0, pad)))
+    return codes.view(np.uint64)
+
+
+def _hamming(query_words, code_words, tile=4096, query_tile=32):
+    """
+    uint64 位码之间的汉明距离矩阵 (查询数, 码数)，int16。直接在打包的码上做 XOR + popcount，
+    按 query_tile × tile 分块，临时数组约 1 MB，留在 CPU 缓存中。
+    """
+    dist = np.zeros((len(query_words), len(code_words)), dtype=np.int16)
+    columns = np.ascontiguousarray(code_words.T)
+    buffer = np.empty((query_tile, tile), dtype=np.uint64)
+    for c0 in range(0, len(code_words), tile):
+        cols = columns[:, c0:c0 + tile]
+        for q0 in range(0, len(query_words), query_tile):
+            queries = query_words[q0:q0 + query_tile]
+            out = dist[q0:q0 + query_tile, c0:c0 + tile]
+            tmp = buffer[:len(queries), :cols.shape[1]]
+            for w in range(queries.shape[1]):
+                np.bitwise_xor(queries[:, w, None], cols[w], out=tmp)
+                out += _popcount(tmp)
+    return dist
+
+
+class QuantizedIndex:
+    """
+    量化暴力检索：内存中只保存 int8 或 1 bit 符号码，用量化码计算候选相似度；
+    只有近似相似度落在阈值附近（threshold ± rescore_margin）的查询，才从磁盘上的全精度向量中取出
+    近似相似度不低于 threshold - rescore_margin 的候选精确重算。384 维向量每条由 1.5 KB 降到 384 字节（int8）或 48 字节（binary）。
+    binary 模式直接在打包的码上做 XOR + popcount 计算汉明距离，不展开成浮点矩阵。
+
+    binary 模式默认的重算区间按 SimHash 估计的标准误差随阈值与码长确定：汉明比例 p = arccos(阈值)/π
+    是 n_bits 次独立试验的均值，换算到余弦的标准差为 π·sin(πp)·sqrt(p(1-p)/n_bits)，区间取 RESCORE_SIGMAS 倍。
+    384 位、阈值 0.9 时约为 ±0.074；固定的 ±0.15 会让近似相似度 0.75 以上的查询全部重算，近似重复多的语料中大部分查询都要回盘。
+    在 5 万条 384 维聚类向量上实测（benchmark.benchmark_rescore_margin），默认区间的判重召回率不低于 99.93%、没有误删，
+    查询与入库向量相似度约 0.98 时重算比例由 100% 降到 0.15%；可用该函数或 audit_rate 在自己的数据上核对。
+
+    参数说明：
+    - dim: 向量维度
+    - mode: 'int8'（逐维量化到 [-127, 127]）或 'binary'（随机超平面投影后取符号，即 SimHash）
+    - threshold: 去重使用的相似度阈值，决定哪些查询需要重算
+    - rescore_margin: 重算区间的半宽；为 None 时 int8 为 0.02，binary 按上述标准误差计算
+    - audit_rate: 抽查比例，被抽中的查询额外做一次全精度精确检索，用于统计与全精度判定的一致率
+    - n_bits: binary 模式的码长，默认等于 dim
+    - block_size: 每次参与计算的入库向量行数
+    - seed: 随机种子（投影矩阵与抽查）
+    - store_path: 全精度向量的磁盘存储路径，为 None 时使用临时文件
+    """
+
+    MODES = ('int8', 'binary')
+    INT8_MARGIN = 0.02
+    RESCORE_SIGMAS = 3.0
+
+    def __init__(self, dim, mode='int8', threshold=0.9, rescore_margin=None, audit_rate=0.0,
+                 n_bits=None, block_size=16384, seed=0, store_path=None):
+        if mode not in self.MODES:
+            raise ValueError(f"未知的量化方式: {mode}，可选 {list(self.MODES)}")
+        self.dim = dim
+        self.mode = mode
+        self.threshold = threshold
+        self.rescore_margin = rescore_margin
+        self.audit_rate = audit_rate
+        self.block_size = block_size
+        self._rng = np.random.default_rng(seed)
+        if store_path is None:
+            fd, store_path = tempfile.mkstemp(suffix='.f32')
+            os.close(fd)
+            weakref.finalize(self, _remove_quietly, store_path)
+        # 全精度向量只在磁盘上，仅用于重算与抽查
+        self._vectors = EmbeddingStore(dim, path=store_path)
+        if mode == 'int8':
+            self._codes = EmbeddingStore(dim, dtype=np.int8)
+        else:
+            self.n_bits = n_bits or dim
+            self._projection = self._rng.standard_normal((dim, self.n_bits)).astype(np.float32)
+            self._codes = EmbeddingStore((self.n_bits + 7) // 8, dtype=np.uint8)
+        self.stats = {'queries': 0, 'rescored': 0, 'flipped': 0, 'audited': 0, 'agreed': 0}
+        # 上次持久化时的量化码条数，get_delta 只输出其后追加的量化码
+        self._saved_codes = 0
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def margin(self):
+        """
+        当前阈值下重算区间的半宽。
+        """
+        if self.rescore_margin is not None:
+            return self.rescore_margin
+        if self.mode == 'int8':
+            return self.INT8_MARGIN
+        p = math.acos(min(max(self.threshold, -1.0), 1.0)) / math.pi
+        return self.RESCORE_SIGMAS * math.pi * math.sin(math.pi * p) * math.sqrt(p * (1 - p) / self.n_bits)
+
+    def _encode(self, vectors):
+        if self.mode == 'int8':
+            return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+        return np.packbits(vectors @ self._projection > 0, axis=1)
+
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self._vectors.append(vectors)
+        self._codes.append(self._encode(vectors))
+
+    def _approx_blocks(self, queries):
+        """
+        逐块产出 (起始编号, 近似得分矩阵)，得分越大越相似，由 _similarity 换算为余弦相似度。
+        int8 的得分即全精度查询乘反量化码（非对称）；binary 的得分为负的汉明距离。
+        """
+        if self.mode == 'binary':
+            queries = _as_words(self._encode(queries))
+        codes = self._codes.view()
+        for start in range(0, len(codes), self.block_size):
+            block = codes[start:start + self.block_size]
+            if self.mode == 'int8':
+                yield start, queries @ (block.astype(np.float32) / 127).T
+            else:
+                yield start, -_hamming(queries, _as_words(block))
+
+    def _similarity(self, scores):
+        # binary：按 cos(π·汉明比例) 估计余弦相似度
+        if self.mode == 'int8':
+            return scores
+        return np.cos(np.pi * -scores / self.n_bits).astype(np.float32)
+
+    def _approx_cutoff(self, similarity):
+        # 近似相似度 >= similarity 对应的最低近似得分（binary 为负的最大汉明距离；超过 1 时没有得分能达到）
+        if self.mode == 'int8':
+            return similarity
+        if similarity > 1:
+            return 1
+        return -math.floor(math.acos(max(similarity, -1.0)) / math.pi * self.n_bits + 1e-9)
+
+    def _rescore(self, queries, rows, ids, chunk_size=8192):
+        """
+        用全精度向量重算候选对 (查询行, 入库编号)，返回每个查询的 (最高相似度, 编号)；没有候选的查询为 (-inf, -1)。
+        候选按入库编号排序后分块读取，磁盘访问大致顺序，每块只取出 chunk_size 条全精度向量。
+        """
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+        full = self._vectors.view()
+        order = np.argsort(ids, kind='stable')
+        rows, ids = rows[order], ids[order]
+        for start in range(0, len(ids), chunk_size):
+            r, i = rows[start:start + chunk_size], ids[start:start + chunk_size]
+            exact = np.einsum('pd,pd->p', full[i], queries[r])
+            # 每个查询取本块中最高的候选，再与之前各块的结果比较
+            order = np.lexsort((-exact, r))
+            first = order[np.r_[True, r[order][1:] != r[order][:-1]]]
+            better = exact[first] > best_scores[r[first]]
+            best_scores[r[first][better]] = exact[first][better]
+            best_ids[r[first][better]] = i[first][better]
+        return best_scores, best_ids
+
+    def search(self, queries):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        margin = self.margin()
+        lower, upper = self._approx_cutoff(self.threshold - margin), self._approx_cutoff(self.threshold + margin)
+        best_approx = np.full(len(queries), -np.inf, dtype=np.float32)
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+        # 扫描量化码时顺带记下近似相似度落在重算区间内的候选对，重算时不必再扫描一遍
+        cand_rows, cand_ids = [], []
+        for start, approx in self._approx_blocks(queries):
+            idx = np.argmax(approx, axis=1)
+            top = approx[np.arange(len(queries)), idx]
+            better = top > best_approx
+            best_approx[better] = top[better]
+            best_ids[better] = idx[better] + start
+            # 只有本块中有近似相似度达到下限、且目前最高值仍低于上限（可能需要重算）的查询才需要找出候选
+            rows = np.flatnonzero((top >= lower) & (best_approx < upper))
+            if len(rows):
+                r, c = np.nonzero(approx[rows] >= lower)
+                cand_rows.append(rows[r])
+                cand_ids.append(c + start)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        found = best_ids >= 0
+        best_scores[found] = self._similarity(best_approx[found])
+        self.stats['queries'] += len(queries)
+
+        # 最高近似相似度落在阈值附近的查询，用全精度向量重算区间内的全部候选：真实相似度达到阈值的入库向量，
+        # 其近似值低于区间下限的概率由区间宽度控制，不受固定候选数的限制
+        border = (best_approx >= lower) & (best_approx < upper)
+        if border.any():
+            rows, ids = np.concatenate(cand_rows), np.concatenate(cand_ids)
+            keep = border[rows]
+            exact_best, exact_ids = self._rescore(queries, rows[keep], ids[keep])
+            border = np.flatnonzero(border)
+            self.stats['rescored'] += len(border)
+            self.stats['flipped'] += int(np.sum((best_scores[border] >= self.threshold)
+                                                != (exact_best[border] >= self.threshold)))
+            best_scores[border] = exact_best[border]
+            best_ids[border] = exact_ids[border]
+
+        if self.audit_rate > 0 and len(self._vectors):
+            sample = np.flatnonzero(self._rng.random(len(queries)) < self.audit_rate)
+            if len(sample):
+                exact_scores, _ = _exact_search(queries[sample], self._vectors.view())
+                self.stats['audited'] += len(sample)
+                self.stats['agreed'] += int(np.sum((best_scores[sample] >= self.threshold)
+                                                   == (exact_scores >= self.threshold)))
+        return best_scores, best_ids
+
+    def report(self):
+        """
+        返回量化检索的统计说明：重算比例、重算翻转的判定数，以及抽查得到的与全精度判定的一致率。
+        """
+        s = self.stats
+        text = (f"{self.mode} 量化检索：查询 {s['queries']} 次，重算 {s['rescored']} 次，"
+                f"其中 {s['flipped']} 次判定被全精度重算纠正")
+        if s['audited']:
+            text += f"；抽查 {s['audited']} 次，与全精度判定一致率 {s['agreed'] / s['audited']:.4%}"
+        return text
+
+    def get_delta(self):
+        if len(self._codes) == self._saved_codes:
+            return {}
+        return {'codes': self._codes.view()[self._saved_codes:]}
+
+    def apply_delta(self, delta):
+        if 'codes' in delta:
+            self._codes.append(delta['codes'])
+        self.clear_delta()
+
+    def clear_delta(self):
+        self._saved_codes = len(self._codes)
+
+
+INDEX_TYPES = {
+    'flat': FlatIndex,
+    'ivf': IVFIndex,
+    'hnsw': HNSWIndex,
+    'quantized': QuantizedIndex,
+}
+
+
+def build_index(index_type, dim, **index_params):
+    """
+    按名称构造相似度索引：'flat'（精确）、'ivf'、'hnsw'、'quantized'（int8/binary 量化 + 阈值附近精确重算）。
+    所有索引都支持 add(vectors) 增量插入与 search(queries) 的 top-1 查询。
+    """
+    try:
+        index_cls = INDEX_TYPES[index_type]
+    except KeyError:
+        raise ValueError(f"未知的索引类型: {index_type}，可选 {sorted(INDEX_TYPES)}")
+    return index_cls(dim, **index_params)
+
+
+def restore_index(index_type, dim, vectors, deltas, **index_params):
+    """
+    用已有的向量存储（EmbeddingStore）与按顺序排列的 get_delta() 历次保存的变化重建索引。
+    """
+    index = build_index(index_type, dim, **index_params)
+    index._vectors = vectors
+    for delta in deltas:
+        index.apply_delta(delta)
+    return index
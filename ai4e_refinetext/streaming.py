@@ -0,0 +1,225 @@
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from tqdm import tqdm
+from . import markdown_cleaner
+from .compression import compression_from_name, open_output, strip_compression_suffix
+from .jsonl_shards import JsonlShardWriter
+from .me import index_path
+from .semantic_deduplicator import Deduplicator
+
+# 可以选择落盘的中间结果，与物化流水线各阶段的输出一一对应
+CHECKPOINTS = ('clean', 'merge', 'dedup')
+
+
+def list_markdown_files(input_folder, compression=None):
+    """
+    input_folder 下待清洗的 .md / .txt 文件（可以是压缩的），按清洗输出文件名排序：
+    与 allin 合并清洗结果的顺序一致，去重时先出现、因而被保留的行也与物化流水线相同。
+    """
+    files = [f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f))
+             and strip_compression_suffix(f).endswith(('.md', '.txt'))]
+    return sorted(files, key=lambda f: markdown_cleaner.cleaned_name(f, compression))
+
+
+def _clean_document_task(task):
+    # 清洗一个文档，返回 (文件名, [(标题, 正文), ...], 错误信息, 过滤统计)；出错时与物化清洗一样整篇丢弃
+    input_file_path, keywords_file = task
+    filename = os.path.basename(input_file_path)
+    engine = markdown_cleaner.engine_for(keywords_file)
+    try:
+        sections = list(markdown_cleaner.iter_file_sections(
+            input_file_path, engine, markdown_cleaner._boilerplate, markdown_cleaner._quality))
+    except Exception as e:
+        return filename, [], f"{type(e).__name__}: {e}", markdown_cleaner._take_stats(engine)
+    return filename, sections, None, markdown_cleaner._take_stats(engine)
+
+
+def iter_cleaned_documents(input_folder, files, keywords_file=None, boilerplate=None, quality=None, workers=1,
+                           errors=None, max_pending=None):
+    """
+    按 files 的顺序逐个产出清洗后的文档 (文件名, [(标题, 正文), ...])，章节只在内存中传递，不写中间文件。
+    workers > 1 时由进程池并行清洗，按顺序把结果送回，下游一边消费前面的文档，后面的文档一边在清洗；
+    已提交但尚未被下游取走的文档最多 max_pending 个（默认 2 × workers），下游较慢时不再提交新任务，
+    父进程中缓存的章节数因此有上限。出错的文件记入 errors。
+    """
+    tasks = [(os.path.join(input_folder, f), keywords_file) for f in files]
+
+    def collect(result):
+        filename, sections, error, stats = result
+        if error is not None and errors is not None:
+            errors[filename] = error
+        if 'rules' in stats:
+            markdown_cleaner.engine_for(keywords_file).hits.update(stats['rules'])
+        if 'boilerplate' in stats:
+            boilerplate.removed.update(stats['boilerplate'])
+        if 'quality' in stats:
+            quality.merge_stats(stats['quality'])
+        return filename, sections
+
+    if workers > 1 and len(tasks) > 1:
+        workers = min(workers, len(tasks))
+        max_pending = max_pending or 2 * workers
+        with multiprocessing.Pool(workers, initializer=markdown_cleaner._init_worker,
+                                  initargs=(boilerplate, quality)) as pool:
+            # 有界的提交窗口：pool.imap 会不受限制地提前清洗并在父进程中堆积结果，这里只在取走一个结果后再提交一个任务
+            pending = deque()
+            remaining = iter(tasks)
+            for task in itertools.islice(remaining, max_pending):
+                pending.append(pool.apply_async(_clean_document_task, (task,)))
+            while pending:
+                result = pending.popleft().get()
+                for task in itertools.islice(remaining, 1):
+                    pending.append(pool.apply_async(_clean_document_task, (task,)))
+                yield collect(result)
+    else:
+        markdown_cleaner._set_filters(boilerplate, quality)
+        try:
+            for task in tasks:
+                yield collect(_clean_document_task(task))
+        finally:
+            markdown_cleaner._set_filters(None, None)
+
+
+def _document_text(sections):
+    # 与 process_specific_file 写出的清洗文件逐字节一致
+    return "\n".join(f"{title}\n{text}\n" for title, text in sections)
+
+
+def checkpoint_cleaned(documents, output_folder, compression=None):
+    """
+    'clean' 检查点：把流过的文档写成 output_folder 下的 <原名>_cleaned.txt（与 process_markdown_files 的输出相同），原样转发文档。
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    for filename, sections in documents:
+        if sections:
+            output_file = os.path.join(output_folder, markdown_cleaner.cleaned_name(filename, compression))
+            with open_output(output_file + '.tmp', 'w', compression, encoding='utf-8') as f:
+                f.write(_document_text(sections))
+            os.replace(output_file + '.tmp', output_file)
+        yield filename, sections
+
+
+def checkpoint_merged(documents, output_file, compression=None):
+    """
+    'merge' 检查点：把流过的文档写成与 allin 相同的合并文件及其文档索引（output_file 以 .gz / .zst / .bz2 结尾时压缩写出），
+    原样转发文档。compression 为清洗文件的压缩方式，只影响索引中记录的来源文件名。
+    """
+    index = []
+    offset = 0
+    with open_output(output_file + '.tmp', 'wb', compression_from_name(output_file)) as f:
+        for filename, sections in documents:
+            if sections:
+                data = _document_text(sections).encode('utf-8')
+                f.write(data + b"\n")
+                index.append({"source": markdown_cleaner.cleaned_name(filename, compression), "offset": offset,
+                              "length": len(data)})
+                offset += len(data) + 1
+            yield filename, sections
+    os.replace(output_file + '.tmp', output_file)
+    with open(index_path(output_file) + '.tmp', 'w', encoding='utf-8') as f:
+        for entry in index:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(index_path(output_file) + '.tmp', index_path(output_file))
+
+
+def checkpoint_deduplicated(flags, output_file, encoding='utf-8'):
+    """
+    'dedup' 检查点：把保留的行写成与 semantic_deduplicate 相同的去重结果文件，原样转发去重判定。
+    """
+    with open_output(output_file + '.tmp', 'wb', compression_from_name(output_file)) as f:
+        for tag, text, kept in flags:
+            if kept:
+                f.write((text + "\n").encode(encoding))
+            yield tag, text, kept
+    os.replace(output_file + '.tmp', output_file)
+
+
+def iter_document_lines(documents):
+    # 把文档展开成去重的输入行 (来源文件名, 行)：每个章节的标题行与正文行，与合并文件中的非空行一一对应
+    for filename, sections in documents:
+        for title, text in sections:
+            yield filename, title
+            yield filename, text
+
+
+def iter_flag_records(flags):
+    """
+    把去重判定组装成 {"section", "content"} 记录，逐条产出 (来源文件名, 记录)。
+    组装规则与 txt_to_jsonl 解析去重结果文件相同（以 # 开头的保留行开始新章节，其后保留的行拼接为正文），
+    但直接消费内存中的判定，不再读取和切分文件；来源为章节标题所在的原始文档。
+    """
+    source, section_title, content = None, None, []
+    for tag, text, kept in flags:
+        if not kept:
+            continue
+        if text.startswith("#"):
+            if section_title:
+                yield source, {"section": section_title, "content": "".join(content).strip()}
+            source, section_title, content = tag, text.strip("#").strip(), []
+        else:
+            content.append(text)
+    if section_title:
+        yield source, {"section": section_title, "content": "".join(content).strip()}
+
+
+def stream_corpus(input_folder, output_folder, checkpoints=None, workers=1, keywords_file=None, boilerplate=None,
+                  quality=None, clean_compression=None, max_bytes=256 << 20, max_records=None, compression='gzip',
+                  prefix='part', **dedup_options):
+    """
+    流式执行 清洗 → 合并 → 语义去重 → 转 JSONL：文档与章节以记录的形式经由生成器（并行清洗时经由进程池的有序队列）
+    在阶段之间传递，每个输入文件只读取、解析一次（启用模板行过滤时另有一遍统计），章节边界由清洗阶段直接带到 JSONL，
+    不再写出再读回 cleaned_markdown、txt、deduplicate_txt 等中间结果，也不再重新切分 # 标题。
+    输出的记录与依次执行 process_markdown_files、allin、semantic_deduplicate、txt_to_jsonl 得到的记录完全一致，
+    分片清单中每条记录的来源为其所在的原始文档（物化流水线中只能记为去重结果文件）。
+    只在 checkpoints 指定的位置落盘中间结果，文件内容与物化流水线对应阶段的输出相同，可用于检查或交给其它工具。
+    返回 {文件名: 错误信息}。
+
+    参数说明：
+    - input_folder: Markdown 文件目录（pdf_converter / tiqu 的输出）
+    - output_folder: JSONL 分片的输出目录
+    - checkpoints: {检查点: 路径}，可选 'clean'（清洗结果目录）、'merge'（合并文件）与 'dedup'（去重结果文件）
+    - workers: 并行清洗的进程数，去重在当前进程中按顺序进行
+    - keywords_file, boilerplate, quality: 清洗参数，见 process_markdown_files
+    - clean_compression: 'clean' 检查点文件的压缩方式
+    - max_bytes, max_records, compression, prefix: JSONL 分片参数，见 JsonlShardWriter
+    - dedup_options: Deduplicator 的参数（model_name、similarity_threshold、batch_size、embedder 等）
+    """
+    checkpoints = dict(checkpoints or {})
+    unknown = set(checkpoints) - set(CHECKPOINTS)
+    if unknown:
+        raise ValueError(f"未知的检查点: {sorted(unknown)}，可选 {list(CHECKPOINTS)}")
+    files = list_markdown_files(input_folder, clean_compression)
+    boilerplate, quality = markdown_cleaner.prepare_filters([os.path.join(input_folder, f) for f in files],
+                                                            boilerplate, quality)
+    errors = {}
+    with Deduplicator(**dedup_options) as dedup, \
+            JsonlShardWriter(output_folder, prefix, max_bytes, max_records, compression) as writer:
+        documents = iter_cleaned_documents(input_folder, files, keywords_file, boilerplate, quality, workers, errors)
+        documents = tqdm(documents, total=len(files), desc="Streaming")
+        if 'clean' in checkpoints:
+            documents = checkpoint_cleaned(documents, checkpoints['clean'], clean_compression)
+        if 'merge' in checkpoints:
+            documents = checkpoint_merged(documents, checkpoints['merge'], clean_compression)
+        flags = dedup.iter_flags(iter_document_lines(documents))
+        if 'dedup' in checkpoints:
+            flags = checkpoint_deduplicated(flags, checkpoints['dedup'])
+        for source, record in iter_flag_records(flags):
+            writer.write(record, source)
+        for filename, error in sorted(errors.items()):
+            writer.add_error(filename, error)
+        dedup.report()
+        dedup.commit(input_folder=os.path.abspath(input_folder))
+
+    if boilerplate is not None:
+        print(boilerplate.report(), file=sys.stderr)
+    if quality is not None:
+        print(quality.report(), file=sys.stderr)
+    for filename, error in sorted(errors.items()):
+        print(f"清洗 {filename} 时出错: {error}", file=sys.stderr)
+    print(f"流式处理完成：{dedup.stats['lines']} 行中保留 {dedup.stats['kept']} 行，共写出 {writer.records} 条记录，"
+          f"{len(writer.shards)} 个分片。", file=sys.stderr)
+    return errors
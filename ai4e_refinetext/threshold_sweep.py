@@ -0,0 +1,121 @@
+import sys
+import numpy as np
+from .compression import open_output
+
+
+def neighbour_graph(embs, min_threshold, block_size=4096):
+    """
+    计算每行与排在它之前的行中相似度 >= min_threshold 的全部邻居（已归一化向量，点积即余弦相似度）。
+    按 block_size × block_size 分块做矩阵乘法以限制临时矩阵大小。
+    返回 CSR 形式的 (indptr, indices, sims)：第 i 行的邻居为 indices[indptr[i]:indptr[i + 1]]。
+    """
+    n = len(embs)
+    rows, cols, sims = [], [], []
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        queries = np.asarray(embs[start:end], dtype=np.float32)
+        for col_start in range(0, end, block_size):
+            col_end = min(col_start + block_size, end)
+            scores = queries @ np.asarray(embs[col_start:col_end], dtype=np.float32).T
+            earlier = np.arange(col_start, col_end)[None, :] < np.arange(start, end)[:, None]
+            r, c = np.nonzero((scores >= min_threshold) & earlier)
+            rows.append(r + start)
+            cols.append(c + col_start)
+            sims.append(scores[r, c])
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+    sims = np.concatenate(sims) if sims else np.empty(0, dtype=np.float32)
+    order = np.argsort(rows, kind='stable')
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n)))).astype(np.int64)
+    return indptr, cols[order].astype(np.int64), sims[order].astype(np.float32)
+
+
+class ThresholdSweep:
+    """
+    一次编码、多阈值评估的去重结果。对最小阈值建好“更早的相似邻居”稀疏图后，
+    任一不低于最小阈值的阈值 t 都可以在图上重放顺序贪心去重：
+    第 i 行被保留，当且仅当它与已有语料的最高相似度低于 t，且没有相似度 >= t 的更早保留行。
+    结果与以阈值 t 完整运行一次精确（flat）去重相同，无需重新编码。
+
+    参数说明：
+    - lines: 通过前置过滤、参与语义去重的文本行（按输入顺序）
+    - embs: 对应的归一化嵌入矩阵
+    - min_threshold: 支持评估的最小阈值
+    - base_scores: 每行与已有语料（持久化索引）的最高相似度，为 None 时视为没有已有语料
+    - block_size: 建图时的分块大小
+    """
+
+    def __init__(self, lines, embs, min_threshold, base_scores=None, block_size=4096):
+        self.lines = lines
+        self.min_threshold = min_threshold
+        self.base_scores = np.full(len(lines), -np.inf, dtype=np.float32) if base_scores is None \
+            else np.asarray(base_scores, dtype=np.float32)
+        self.indptr, self.indices, self.sims = neighbour_graph(embs, min_threshold, block_size)
+        self._rows = np.repeat(np.arange(len(lines)), np.diff(self.indptr))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def keep_mask(self, threshold):
+        """
+        返回阈值为 threshold 时的保留掩码。
+        """
+        if threshold < self.min_threshold:
+            raise ValueError(f"阈值 {threshold} 低于建图时的最小阈值 {self.min_threshold}")
+        keep = self.base_scores < threshold
+        strong = self.sims >= threshold
+        has_neighbour = np.zeros(len(keep), dtype=bool)
+        has_neighbour[self._rows[strong]] = True
+        # 没有相似邻居的行去留已定，只需按顺序处理有邻居的行；更早的行在处理到 i 时都已判定
+        for i in np.flatnonzero(has_neighbour & keep):
+            lo, hi = self.indptr[i], self.indptr[i + 1]
+            if keep[self.indices[lo:hi][strong[lo:hi]]].any():
+                keep[i] = False
+        return keep
+
+    def dropped_pairs(self, threshold, keep=None):
+        """
+        返回阈值为 threshold 时被删除的每一行及其命中的保留行：[(行号, 保留行号, 相似度), ...]。
+        因已有语料而删除的行，保留行号为 -1。
+        """
+        keep = self.keep_mask(threshold) if keep is None else keep
+        pairs = []
+        for i in np.flatnonzero(~keep):
+            if self.base_scores[i] >= threshold:
+                pairs.append((int(i), -1, float(self.base_scores[i])))
+                continue
+            lo, hi = self.indptr[i], self.indptr[i + 1]
+            matched = keep[self.indices[lo:hi]] & (self.sims[lo:hi] >= threshold)
+            best = lo + np.flatnonzero(matched)[np.argmax(self.sims[lo:hi][matched])]
+            pairs.append((int(i), int(self.indices[best]), float(self.sims[best])))
+        return pairs
+
+    def report(self, thresholds, n_samples=3, seed=0):
+        """
+        打印并返回每个阈值的保留行数与随机抽取的删除样例：[{'threshold', 'kept', 'dropped', 'samples'}, ...]。
+        """
+        rng = np.random.default_rng(seed)
+        rows = []
+        for threshold in sorted(thresholds):
+            keep = self.keep_mask(threshold)
+            pairs = self.dropped_pairs(threshold, keep)
+            picked = rng.choice(len(pairs), size=min(n_samples, len(pairs)), replace=False) if pairs else []
+            samples = [pairs[k] for k in sorted(picked)]
+            kept = int(keep.sum())
+            rows.append({'threshold': threshold, 'kept': kept, 'dropped': len(pairs), 'samples': samples})
+            ratio = kept / len(keep) if len(keep) else 1.0
+            print(f"阈值 {threshold:.3f}：保留 {kept} 行（{ratio:.2%}），删除 {len(pairs)} 行", file=sys.stderr)
+            for i, j, sim in samples:
+                other = "已有语料" if j < 0 else self.lines[j][:60]
+                print(f"    {sim:.3f}  删除: {self.lines[i][:60]}\n           保留: {other}", file=sys.stderr)
+        return rows
+
+    def write(self, output_file, threshold, encoding='utf-8'):
+        """
+        按阈值 threshold 的去重结果写出文件，返回写出行数。
+        """
+        keep = self.keep_mask(threshold)
+        with open_output(output_file, 'w', encoding=encoding) as fout:
+            for i in np.flatnonzero(keep):
+                fout.write(self.lines[i] + "\n")
+        return int(keep.sum())
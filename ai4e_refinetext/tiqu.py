@@ -6,6 +6,12 @@ from magic_pdf.config.make_content_config import DropMode, MakeMode
 from magic_pdf.pipe.OCRPipe import OCRPipe
 import json
 from tqdm import tqdm
+from .clean_manifest import CleanManifest, config_digest, file_fingerprint
+
+# OCR 参数或写出逻辑改变输出时递增，使 OCR 清单失效、全部 PDF 重新识别
+OCR_VERSION = 1
+# 每个 PDF 只识别前 MAX_PAGES 页
+MAX_PAGES = 2000
 
 
 # ── ① 让 Detectron2 / fvcore 只输出 WARNING ─────────────────────────────
@@ -41,7 +47,13 @@ def gather_pdf_files(input_folder):
                 pdf_files.append(pdf_file_path)
     return pdf_files
 
-def ocr_folder_to_markdown(input_folder):
+def ocr_folder_to_markdown(input_folder, incremental=True):
+    """
+    对 input_folder 下（含子目录）的全部 PDF 做 OCR，Markdown 与 JSON 写到 input_folder/markdown/markdown。
+    incremental 为 True 时在该目录中维护 OCR 清单（见 CleanManifest）：内容未变且 Markdown 仍在的 PDF 直接跳过，
+    只识别新增或改动的 PDF，手动修改过的 Markdown 不会因为其它 PDF 变化而被重新识别覆盖；PDF 被删除时连同其 Markdown 一起清理。
+    单个 PDF 出错只记入日志。
+    """
     log_file = "process.log"
     logging.basicConfig(
         filename=log_file,
@@ -55,9 +67,29 @@ def ocr_folder_to_markdown(input_folder):
     input_folder  = input_folder
     output_folder = os.path.join(input_folder, "markdown")
     os.makedirs(output_folder, exist_ok=True)
+    manifest = None
+    if incremental:
+        os.makedirs(os.path.join(output_folder, "markdown"), exist_ok=True)
+        manifest = CleanManifest(os.path.join(output_folder, "markdown"))
+        version = config_digest({'ocr': OCR_VERSION, 'max_pages': MAX_PAGES})
+        names = {pdf: os.path.relpath(pdf, input_folder) for pdf in pdf_files}
+        removed = manifest.prune(names.values())
+        for name in removed:
+            # 清单只记录 Markdown，同名的 JSON 一并删除
+            json_path = os.path.join(output_folder, "markdown", os.path.splitext(name)[0] + ".json")
+            if os.path.exists(json_path):
+                os.remove(json_path)
+        pending = [pdf for pdf in pdf_files if not manifest.is_current(
+            names[pdf], pdf, version, f"{os.path.splitext(os.path.basename(pdf))[0]}.md")]
+        print(f"增量 OCR：{len(pdf_files) - len(pending)} 个 PDF 未变化已跳过，{len(pending)} 个 PDF 待识别，"
+              f"清理 {len(removed)} 个已删除 PDF 的 Markdown。")
+        manifest.save()
+        pdf_files = pending
     for pdf_file_name in tqdm(pdf_files, desc="OCR→Markdown", unit="pdf"):
         try:
             logging.info(f"Processing file: {pdf_file_name}")
+            # 在读取 PDF 之前取指纹，识别期间 PDF 被替换时下次运行会重新识别
+            fingerprint = file_fingerprint(pdf_file_name) if manifest is not None else None
 
             # Create a temporary PDF containing only the first 2000 pages
             temp_pdf_name = os.path.join(output_folder, "temp_first_2000_pages.pdf")
@@ -66,7 +98,7 @@ def ocr_folder_to_markdown(input_folder):
                 writer = PdfWriter()
 
                 # Extract first 2000 pages (or fewer if total pages < 2000)
-                for page in reader.pages[:2000]:
+                for page in reader.pages[:MAX_PAGES]:
                     writer.add_page(page)
 
                 # Write to a temporary file
@@ -130,8 +162,17 @@ def ocr_folder_to_markdown(input_folder):
             os.remove(temp_pdf_name)
             logging.info(f"Temporary file deleted: {temp_pdf_name}")
 
+            if manifest is not None:
+                # 每识别完一个 PDF 就保存清单，中断后重新运行不再重复识别已完成的 PDF
+                manifest.record(names[pdf_file_name], pdf_file_name, version,
+                                os.path.basename(output_md_file), fingerprint)
+                manifest.save()
+
         except Exception as e:
             logging.error(f"Error processing file {pdf_file_name}: {e}")
+            if manifest is not None:
+                manifest.forget(names[pdf_file_name])
+                manifest.save()
 
     logging.info("All files processed.")
     print(f"Processing complete. Logs written to {log_file}")
@@ -0,0 +1,212 @@
+import json
+import multiprocessing
+import os
+import re
+import sys
+import numpy as np
+from tqdm import tqdm
+from .compression import open_compressed
+from .jsonl_shards import manifest_path
+
+TOKEN_MANIFEST_NAME = 'token_manifest.json'
+# 训练分片的文件名：tokens-<序号>.bin 与 tokens-<序号>.idx
+_SHARD_FILE = re.compile(r"tokens-\d{5}\.(bin|idx)")
+
+
+class ByteTokenizer:
+    """
+    字节级分词：UTF-8 字节即 token id（0–255），不依赖任何模型文件，作为没有可用分词器时的退路。
+    """
+
+    name = 'byte'
+    vocab_size = 256
+
+    def encode_batch(self, texts):
+        return [np.frombuffer(t.encode('utf-8'), dtype=np.uint8) for t in texts]
+
+
+class HFTokenizer:
+    """
+    本地的 Hugging Face 分词器：tokenizer.json 文件用 tokenizers 加载，目录或模型名用 transformers.AutoTokenizer
+    加载（只读本地缓存，不联网）。不添加特殊 token，文档边界由偏移数组记录。
+
+    参数说明：
+    - name_or_path: tokenizer.json 路径、本地模型目录或已缓存的模型名称
+    """
+
+    def __init__(self, name_or_path):
+        self.name = name_or_path
+        if name_or_path.endswith('.json'):
+            from tokenizers import Tokenizer
+
+            self._tokenizer = Tokenizer.from_file(name_or_path)
+            self.vocab_size = self._tokenizer.get_vocab_size()
+            self._fast = True
+        else:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(name_or_path, local_files_only=True)
+            self.vocab_size = len(self._tokenizer)
+            self._fast = False
+
+    def encode_batch(self, texts):
+        if self._fast:
+            return [e.ids for e in self._tokenizer.encode_batch(texts, add_special_tokens=False)]
+        return self._tokenizer(texts, add_special_tokens=False)['input_ids']
+
+
+def build_tokenizer(tokenizer=None):
+    """
+    构造分词器：None 或 'byte' 为字节级分词；字符串按 HFTokenizer 加载，加载失败（未安装依赖或本地没有模型）时
+    打印提示并退回字节级分词；其它对象需提供 name、vocab_size 与 encode_batch(texts)，原样返回。
+    """
+    if tokenizer is None or tokenizer == 'byte':
+        return ByteTokenizer()
+    if not isinstance(tokenizer, str):
+        return tokenizer
+    try:
+        return HFTokenizer(tokenizer)
+    except (ImportError, OSError, ValueError) as e:
+        print(f"加载分词器 {tokenizer} 失败（{type(e).__name__}: {e}），改用字节级分词。", file=sys.stderr)
+        return ByteTokenizer()
+
+
+def token_dtype(vocab_size):
+    return np.uint16 if vocab_size <= 1 << 16 else np.uint32
+
+
+def record_text(record):
+    # 训练文本：章节标题与正文，中间换行
+    return f"{record['section']}\n{record['content']}"
+
+
+# 当前进程使用的分词器与文本函数（进程池中由 initializer 设置，每个进程只加载一次）
+_tokenizer = None
+_text_fn = record_text
+
+
+def _set_tokenizer(tokenizer, text_fn=record_text):
+    global _tokenizer, _text_fn
+    _tokenizer, _text_fn = (None if tokenizer is None else build_tokenizer(tokenizer)), text_fn
+
+
+def _tokenize_shard_task(task):
+    # 把一个 JSONL 分片流式分词写成 <name>.bin（token id）与 <name>.idx（int64 文档偏移），
+    # 返回分片统计与按来源文件累计的 token 数
+    input_path, compression, sources, output_folder, name, dtype, batch_size = task
+    # 按清单中的 [来源文件, 记录数] 展开每条记录的来源
+    record_sources = iter([source for source, count in sources for _ in range(count)])
+    source_tokens = {}
+    offsets = [0]
+    bin_path = os.path.join(output_folder, name + '.bin')
+    with open_compressed(input_path, compression) as f, open(bin_path + '.tmp', 'wb') as out:
+        batch = []
+
+        def flush():
+            for ids in _tokenizer.encode_batch(batch):
+                ids = np.asarray(ids, dtype=dtype)
+                ids.tofile(out)
+                offsets.append(offsets[-1] + len(ids))
+                source = next(record_sources, None)
+                source_tokens[source] = source_tokens.get(source, 0) + len(ids)
+            batch.clear()
+
+        for line in f:
+            batch.append(_text_fn(json.loads(line)))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    np.asarray(offsets, dtype=np.int64).tofile(os.path.join(output_folder, name + '.idx'))
+    os.replace(bin_path + '.tmp', bin_path)
+    return {'bin': name + '.bin', 'idx': name + '.idx', 'documents': len(offsets) - 1, 'tokens': offsets[-1],
+            'source_shard': os.path.basename(input_path)}, source_tokens
+
+
+def _remove_stale_token_shards(output_folder, shards):
+    # 删除本次清单中没有的训练分片（上次运行分片更多时留下的 tokens-<序号>），避免按文件名加载时混入旧数据
+    current = {name for shard in shards for name in (shard['bin'], shard['idx'])}
+    for name in os.listdir(output_folder):
+        if _SHARD_FILE.fullmatch(name) and name not in current:
+            os.remove(os.path.join(output_folder, name))
+
+
+def tokenize_jsonl_shards(jsonl_folder, output_folder, tokenizer=None, workers=1, prefix='part', text_fn=record_text,
+                          batch_size=256):
+    """
+    流水线可选的最后一步：把 txt_to_jsonl 写出的 JSONL 分片分词成可直接 np.memmap 的训练分片，训练时无需再分词。
+    每个 JSONL 分片对应一个 tokens-<序号>.bin（扁平的 token id，词表不超过 65536 时为 uint16，否则 uint32）
+    和 tokens-<序号>.idx（int64 的文档边界偏移，长度为文档数 + 1），并写出 token_manifest.json：
+    分词器、dtype、各分片的文档数与 token 数，以及按来源文件统计的 token 数。返回该清单。
+    写出清单前删除输出目录中以前运行留下、本次清单中没有的训练分片。
+
+    参数说明：
+    - jsonl_folder: txt_to_jsonl 的输出目录
+    - output_folder: 输出目录
+    - tokenizer: 分词器，见 build_tokenizer；没有可用分词器时使用字节级分词
+    - workers: 并行的工作进程数，每个进程一次处理一个 JSONL 分片
+    - prefix: JSONL 分片的文件名前缀
+    - text_fn: 把记录转成训练文本的函数（进程池中需可 pickle，即模块级函数）
+    - batch_size: 每次送入分词器的记录数
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    with open(manifest_path(jsonl_folder, prefix), 'r', encoding='utf-8') as f:
+        jsonl_manifest = json.load(f)
+    # 在父进程中确定分词器与 dtype；字符串分词器在每个工作进程中重新加载
+    resolved = build_tokenizer(tokenizer)
+    if isinstance(tokenizer, str) and isinstance(resolved, ByteTokenizer):
+        tokenizer = None
+    dtype = token_dtype(resolved.vocab_size)
+    tasks = [(os.path.join(jsonl_folder, shard['file']), jsonl_manifest['compression'], shard['sources'],
+              output_folder, f"tokens-{i:05d}", dtype, batch_size)
+             for i, shard in enumerate(jsonl_manifest['shards'])]
+
+    shards = [None] * len(tasks)
+    sources = {}
+
+    def collect(i, result):
+        shard, source_tokens = result
+        shards[i] = shard
+        for source, n in source_tokens.items():
+            sources[source] = sources.get(source, 0) + n
+
+    with tqdm(total=len(tasks), desc="Tokenize") as pbar:
+        if workers > 1 and len(tasks) > 1:
+            initargs = (tokenizer if isinstance(tokenizer, str) else resolved, text_fn)
+            with multiprocessing.Pool(min(workers, len(tasks)), initializer=_set_tokenizer,
+                                      initargs=initargs) as pool:
+                for i, result in enumerate(pool.imap(_tokenize_shard_task, tasks)):
+                    collect(i, result)
+                    pbar.update(1)
+        else:
+            _set_tokenizer(resolved, text_fn)
+            try:
+                for i, task in enumerate(tasks):
+                    collect(i, _tokenize_shard_task(task))
+                    pbar.update(1)
+            finally:
+                _set_tokenizer(None)
+
+    manifest = {'tokenizer': resolved.name, 'vocab_size': resolved.vocab_size, 'dtype': np.dtype(dtype).name,
+                'documents': sum(s['documents'] for s in shards), 'tokens': sum(s['tokens'] for s in shards),
+                'shards': shards, 'sources': sources}
+    _remove_stale_token_shards(output_folder, shards)
+    path = os.path.join(output_folder, TOKEN_MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+    print(f"分词完成：{manifest['documents']} 个文档，{manifest['tokens']} 个 token，"
+          f"{len(shards)} 个分片（{manifest['tokenizer']}，{manifest['dtype']}）。", file=sys.stderr)
+    return manifest
+
+
+def load_token_shard(output_folder, index=0):
+    """
+    以 np.memmap 打开第 index 个训练分片，返回 (tokens, offsets)；第 i 个文档为 tokens[offsets[i]:offsets[i + 1]]。
+    """
+    with open(os.path.join(output_folder, TOKEN_MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    shard = manifest['shards'][index]
+    tokens = np.memmap(os.path.join(output_folder, shard['bin']), dtype=manifest['dtype'], mode='r') \
+        if shard['tokens'] else np.zeros(0, dtype=manifest['dtype'])
+    offsets = np.memmap(os.path.join(output_folder, shard['idx']), dtype=np.int64, mode='r')
+    return tokens, offsets
@@ -1,48 +1,63 @@
 import os
-import json
+import sys
 from tqdm import tqdm
-
-def txt_to_jsonl(input_folder, output_folder):
+from .compression import open_input, strip_compression_suffix
+from .jsonl_shards import JsonlShardWriter
+
+
+def iter_section_records(lines):
+    # 逐行解析，遇到下一个标题时立即产出上一章节的记录，只在内存中保留当前章节
+    section_title = None
+    content = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#"):  # 标题行
+            if section_title:  # 如果之前已经有部分内容，产出一条记录
+                yield {"section": section_title, "content": "".join(content).strip()}
+            section_title = line.strip("#").strip()  # 更新标题
+            content = []
+        elif line:  # 非空行添加到内容中
+            content.append(line)
+
+    # 添加最后的部分
+    if section_title:
+        yield {"section": section_title, "content": "".join(content).strip()}
+
+
+def txt_to_jsonl(input_folder, output_folder, max_bytes=256 << 20, max_records=None, compression='gzip',
+                 prefix='part'):
+    """
+    把 input_folder 所在目录下的 .txt 文件（可以是 gzip / zstd / bz2 压缩的，按文件头识别）
+    按章节转换为 {"section", "content"} 记录，流式写入 output_folder 下按大小或记录数滚动的（压缩）JSONL 分片，并写出分片清单，见 JsonlShardWriter。
+    出错的文件记录在清单的 errors 中并打印，出错前已解析的记录保留；返回 {文件名: 错误信息}。
+
+    参数说明：
+    - input_folder: 输入路径，处理其所在目录下的全部 .txt 文件
+    - output_folder: 输出目录
+    - max_bytes, max_records: 分片滚动条件
+    - compression: None、'gzip'、'bz2' 或 'zstd'
+    - prefix: 分片文件名前缀
+    """
     # 确保输出文件夹存在
     os.makedirs(output_folder, exist_ok=True)
     input_folder = os.path.dirname(input_folder)
-    # 获取文件夹中的所有txt文件
-    txt_files = [file for file in os.listdir(input_folder) if file.endswith(".txt")]
-
-    # 使用tqdm显示处理进度
-    for file_name in tqdm(txt_files, desc="Processing files"):
-        input_file_path = os.path.join(input_folder, file_name)
-        output_file_name = file_name.replace(".txt", ".jsonl")
-        output_file_path = os.path.join(output_folder, output_file_name)
-
-        try:
-            with open(input_file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-
-            jsonl_data = []
-            section_title = None
-            content = []
-
-            for line in lines:
-                line = line.strip()
-                if line.startswith("#"):  # 标题行
-                    if section_title:  # 如果之前已经有部分内容，保存到jsonl数据
-                        jsonl_data.append({"section": section_title, "content": "".join(content).strip()})
-                    section_title = line.strip("#").strip()  # 更新标题
-                    content = []
-                elif line:  # 非空行添加到内容中
-                    content.append(line)
-
-            # 添加最后的部分
-            if section_title:
-                jsonl_data.append({"section": section_title, "content": "".join(content).strip()})
-
-            # 将数据写入jsonl文件
-            with open(output_file_path, 'w', encoding='utf-8') as f:
-                for entry in jsonl_data:
-                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-
-        except Exception as e:
-            continue  # 发生错误时跳过当前文件
-
-
+    # 获取文件夹中的所有txt文件，按文件名排序保证分片内容稳定
+    txt_files = sorted(file for file in os.listdir(input_folder) if strip_compression_suffix(file).endswith(".txt"))
+
+    with JsonlShardWriter(output_folder, prefix, max_bytes, max_records, compression) as writer:
+        # 使用tqdm显示处理进度
+        for file_name in tqdm(txt_files, desc="Processing files"):
+            input_file_path = os.path.join(input_folder, file_name)
+            written = 0
+            try:
+                with open_input(input_file_path, 'r', encoding='utf-8') as f:
+                    for record in iter_section_records(f):
+                        writer.write(record, file_name)
+                        written += 1
+            except Exception as e:
+                writer.add_error(file_name, f"{type(e).__name__}: {e}（出错前已写出 {written} 条记录）")
+
+    for file_name, error in sorted(writer.errors.items()):
+        print(f"转换 {file_name} 时出错: {error}", file=sys.stderr)
+    print(f"共写出 {writer.records} 条记录，{len(writer.shards)} 个分片，清单见 {output_folder}", file=sys.stderr)
+    return writer.errors
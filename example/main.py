@@ -7,13 +7,61 @@ from ai4e_refinetext import (
     allin,
     semantic_deduplicate,
     txt_to_jsonl,
+    stream_corpus,
+    tokenize_jsonl_shards,
 )
+from ai4e_refinetext.pipeline import STATE_NAME, Pipeline
 
 
-def liucheng(input_folder_path):
+OFFICE_SUFFIXES = ('.docx', '.doc', '.pptx', '.ppt')
+
+
+def collect_files(root, suffixes, exclude=()):
+    # 返回一个函数：在检查阶段时收集 root 下（跳过 exclude 目录）指定后缀的文件，作为阶段的输入或输出
+    exclude = {os.path.abspath(p) for p in exclude}
+
+    def collect():
+        found = []
+        for dirpath, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(dirpath, d)) not in exclude]
+            found += [os.path.join(dirpath, f) for f in files if f.lower().endswith(suffixes)]
+        return found
+    return collect
+
+
+def clean_stage(input_folder, output_folder, **options):
+    # 流水线只有在阶段抛出异常时才记为失败；清洗、转换等函数对单个文件出错只返回错误，这里转为异常，
+    # 否则旧的输出会连同新的指纹一起被记为成功，之后的运行一直跳过
+    errors = process_markdown_files(input_folder, output_folder, **options)
+    if errors:
+        raise RuntimeError(f"{len(errors)} 个文件清洗失败: {sorted(errors)}")
+
+
+def jsonl_stage(input_file, output_folder, **options):
+    errors = txt_to_jsonl(input_file, output_folder, **options)
+    if errors:
+        raise RuntimeError(f"{len(errors)} 个文件转换失败: {sorted(errors)}")
+
+
+def stream_stage(input_folder, output_folder, **options):
+    errors = stream_corpus(input_folder, output_folder, **options)
+    if errors:
+        raise RuntimeError(f"{len(errors)} 个文件清洗失败: {sorted(errors)}")
+
+
+def liucheng(input_folder_path, dry_run=False, force=(), streaming=False, checkpoints=(), tokenizer=None):
+    """
+    六个阶段（转换、提取、清洗、合并、去重、json）按 DAG 执行：已是最新的阶段跳过，
+    中途失败时重新运行从第一个过期的阶段继续，dry_run 为 True 时只列出将要执行的阶段。
+    force 为强制执行的阶段名称。
+    streaming 为 True 时清洗、合并、去重、json 合并为一个流式阶段 stream（见 stream_corpus），中间结果不落盘；
+    checkpoints 为需要落盘的中间结果，可选 'clean'、'merge'、'dedup'，分别写到 cleaned_markdown、txt、deduplicate_txt 下。
+    tokenizer 不为 None 时在最后增加 tokenize 阶段，把 JSONL 分片分词成训练分片写到 tokens 下，
+    可取 'byte'、tokenizer.json 路径或本地模型名（见 tokenize_jsonl_shards）。
+    """
     # 子文件夹名称
     subdirs = ['markdown', 'cleaned_markdown', 'txt', 'deduplicate_txt', 'json']
-    # 对应子文件夹中要创建的文件名
+    # 对应子文件夹中的文件名（只确定路径，不再预先创建空文件，以免清空上次运行的结果）
     file_names = {
         'txt': 'example.txt',
         'deduplicate_txt': 'dedup.txt'
@@ -26,13 +74,8 @@ def liucheng(input_folder_path):
         try:
             # 创建子文件夹
             os.makedirs(path, exist_ok=True)
-
-            # 如果子文件夹需要创建文件，则生成文件路径并创建空文件
             if subdir in file_names:
-                file_path = os.path.join(path, file_names[subdir])
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write('')  # 创建空文件
-                created_paths.append(os.path.abspath(file_path))
+                created_paths.append(os.path.abspath(os.path.join(path, file_names[subdir])))
             else:
                 # 否则直接保存子文件夹路径
                 created_paths.append(os.path.abspath(path))
@@ -40,19 +83,45 @@ def liucheng(input_folder_path):
         except Exception as e:
             print(f"无法创建目录或文件 {path}: {e}")
     print(created_paths)
-    # 1.pdf_converter
-    pdf_converter.batch_convert(input_folder_path)
-    # 2.pdf_提取
-    output_dir = created_paths [0]
-    ocr_folder_to_markdown(input_folder_path)
-    # 3.markdown清洗
-    process_markdown_files(os.path.join(created_paths[0], "markdown"), created_paths[1])
-    # 4.merge
-    allin(created_paths[1],created_paths[2])
-    # 5.去重
-    semantic_deduplicate(created_paths[2], created_paths[3], similarity_threshold=0.8)
-    # 6.json
-    txt_to_jsonl(created_paths[3], created_paths[4])
+    tokens_dir = os.path.abspath(os.path.join(input_folder_path, 'tokens'))
+    # 流水线自己生成的子文件夹不作为原始输入
+    generated = [os.path.join(input_folder_path, subdir) for subdir in subdirs] + [tokens_dir]
+    office_files = collect_files(input_folder_path, OFFICE_SUFFIXES, generated)
+    pipeline = Pipeline(os.path.join(input_folder_path, STATE_NAME))
+    # 1.pdf_converter：转换失败的文件被忽略，输出只列出已生成的 PDF
+    pipeline.add('convert', pdf_converter.batch_convert, args=(input_folder_path,), inputs=office_files,
+                 outputs=lambda: [p for p in (os.path.splitext(f)[0] + '.pdf' for f in office_files())
+                                  if os.path.exists(p)])
+    # 2.pdf_提取：OCR 按 PDF 增量执行；输出只取 OCR 写出的 JSON，手动修改 Markdown 只让下游重新清洗，不会重新 OCR
+    pipeline.add('extract', ocr_folder_to_markdown, args=(input_folder_path,),
+                 inputs=collect_files(input_folder_path, ('.pdf',), generated),
+                 outputs=collect_files(created_paths[0], ('.json',)))
+    markdown_dir = os.path.join(created_paths[0], "markdown")
+    if streaming:
+        # 3-6.流式执行：文档在内存中依次经过清洗、去重并写成 JSONL，只在指定的检查点落盘
+        checkpoint_paths = {'clean': created_paths[1], 'merge': created_paths[2], 'dedup': created_paths[3]}
+        checkpoint_paths = {name: checkpoint_paths[name] for name in checkpoints}
+        pipeline.add('stream', stream_stage, args=(markdown_dir, created_paths[4]),
+                     kwargs={'checkpoints': checkpoint_paths, 'similarity_threshold': 0.8},
+                     inputs=[markdown_dir], outputs=[created_paths[4], *checkpoint_paths.values()])
+    else:
+        # 3.markdown清洗
+        pipeline.add('clean', clean_stage, args=(markdown_dir, created_paths[1]),
+                     inputs=[markdown_dir], outputs=[created_paths[1]])
+        # 4.merge
+        pipeline.add('merge', allin, args=(created_paths[1], created_paths[2]),
+                     inputs=[created_paths[1]], outputs=[created_paths[2]])
+        # 5.去重
+        pipeline.add('dedup', semantic_deduplicate, args=(created_paths[2], created_paths[3]),
+                     kwargs={'similarity_threshold': 0.8}, inputs=[created_paths[2]], outputs=[created_paths[3]])
+        # 6.json：txt_to_jsonl 处理去重结果所在目录下的全部 .txt
+        pipeline.add('jsonl', jsonl_stage, args=(created_paths[3], created_paths[4]),
+                     inputs=[os.path.dirname(created_paths[3])], outputs=[created_paths[4]])
+    if tokenizer is not None:
+        # 7.可选：分词成可直接 np.memmap 的训练分片
+        pipeline.add('tokenize', tokenize_jsonl_shards, args=(created_paths[4], tokens_dir),
+                     kwargs={'tokenizer': tokenizer}, inputs=[created_paths[4]], outputs=[tokens_dir])
+    return pipeline.run(dry_run=dry_run, force=force)
 
 if __name__ == '__main__':
     input_path = r"E:\合并测试"
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+
+class CharBigramEmbedder:
+    """
+    测试用嵌入后端：对原文（不归一化、区分大小写与标点）的字符二元组计数做特征哈希。
+    与真实模型一样，只差标点或大小写的行得到不同的向量。
+    """
+
+    def __init__(self, dim=64):
+        self.name = f"char-bigram-{dim}"
+        self.dim = dim
+        self.calls = 0
+
+    def encode(self, lines):
+        self.calls += 1
+        out = np.zeros((len(lines), self.dim), dtype=np.float32)
+        for i, text in enumerate(lines):
+            for k in range(len(text) - 1):
+                out[i, int.from_bytes(text[k:k + 2].encode('utf-8'), 'little') % self.dim] += 1
+            out[i, 0] += 0.01
+        return out
+
+
+@pytest.fixture
+def embedder():
+    return CharBigramEmbedder()
+
+
+def write_markdown_corpus(folder, n_files=6):
+    """
+    在 folder 下写出 n_files 个 Markdown 文件：每个文件有数个章节，含清洗规则会改动的内容（引用、图表编号、链接、
+    版权行）以及每个文件都出现的页眉行，返回文件路径列表。
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(n_files):
+        lines = [f"# 第{i}章 催化剂", "西安交通大学XIANJIAOTONGUNIVERSITY 学位论文"]
+        for j in range(4):
+            lines.append(f"## {i}.{j} 吸附与反应")
+            lines.append("学位论文 页眉")
+            for k in range(6):
+                lines.append(f"第{i}{j}{k}段 催化剂表面的吸附能 energy {i * 100 + j * 10 + k} 随温度变化[12]，"
+                             f"如图{j}-{k}所示 (Wang et al., 2019) 活性位点 catalyst surface reaction 温度 "
+                             f"详见 https://example.org/{i}/{j} 与表 {k}-1。")
+            lines.append("Copyright 2024 all rights reserved")
+        path = folder / f"doc{i:02d}.md"
+        path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def markdown_corpus(tmp_path):
+    folder = tmp_path / "md"
+    write_markdown_corpus(folder)
+    return folder
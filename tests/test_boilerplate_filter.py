@@ -0,0 +1,49 @@
+import numpy as np
+from ai4e_refinetext.boilerplate_filter import BoilerplateFilter, CountMinSketch
+
+WATERMARK = "本书由某某出版社数字化 仅供学习使用\n"
+PAGE_HEADER = "第三卷 多相催化原理 页眉\n"
+
+
+def _documents(n_docs=10):
+    documents = []
+    for i in range(n_docs):
+        lines = [f"# 第{i}章 吸附\n", WATERMARK]
+        for page in range(8):
+            lines.append(PAGE_HEADER if i == 0 else f"第{i}本书 页眉 {page}\n")
+            lines.append(f"第{i}章第{page}页的正文内容，催化剂表面的吸附能。\n")
+            lines.append(f"{page}\n")
+        if i < 2:
+            lines.append("只在两本书中出现的引言句子\n")
+        documents.append(lines)
+    return documents
+
+
+def test_removes_repeated_and_corpus_wide_lines(tmp_path):
+    documents = _documents()
+    boilerplate = BoilerplateFilter(max_doc_repeats=5, max_doc_fraction=0.3, min_docs=3)
+    for lines in documents:
+        boilerplate.fit_document(lines)
+    assert boilerplate.n_docs == len(documents)
+
+    kept = [boilerplate.filter_lines(lines) for lines in documents]
+    assert all(WATERMARK not in lines for lines in kept)
+    assert PAGE_HEADER not in kept[0]
+    for i, lines in enumerate(kept):
+        # 标题、正文、过短的页码行与只在少数文档中出现的行都保留
+        assert lines == [line for line in documents[i] if line not in (WATERMARK, PAGE_HEADER)]
+    assert boilerplate.removed == {'doc_repeats': 8, 'corpus_freq': len(documents)}
+
+    path = tmp_path / "doc00.md"
+    path.write_text("".join(documents[0]), encoding='utf-8')
+    assert list(boilerplate.filter_file(str(path))) == kept[0]
+
+
+def test_count_min_sketch_never_underestimates():
+    rng = np.random.default_rng(0)
+    keys = rng.integers(0, 1 << 63, size=5000, dtype=np.uint64)
+    counts = rng.integers(1, 5, size=len(keys))
+    sketch = CountMinSketch(width=1024, depth=4)
+    sketch.add(np.repeat(keys, counts))
+    estimates = sketch.estimate(keys)
+    assert np.all(estimates >= counts)
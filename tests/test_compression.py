@@ -0,0 +1,51 @@
+import pytest
+from ai4e_refinetext.compression import detect_compression, open_input, open_output
+
+TEXT = "第一行\nsecond line\n" * 50
+
+
+@pytest.mark.parametrize("compression, suffix", [('gzip', '.gz'), ('bz2', '.bz2'), ('zstd', '.zst')])
+def test_round_trip_and_detection(tmp_path, compression, suffix):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    path = tmp_path / f"data.txt{suffix}"
+    with open_output(str(path), 'w') as f:
+        f.write(TEXT)
+    # 检测只看文件头，与文件名无关
+    renamed = path.rename(tmp_path / "data.txt")
+    assert detect_compression(str(renamed)) == compression
+    with open_input(str(renamed)) as f:
+        assert f.read() == TEXT
+
+
+def test_empty_bz2_stream_is_detected(tmp_path):
+    path = tmp_path / "empty.txt.bz2"
+    with open_output(str(path), 'w') as f:
+        f.write("")
+    assert detect_compression(str(path)) == 'bz2'
+
+
+@pytest.mark.parametrize("head", ["BZh", "BZh9 heading", "BZh1AY", "BZhX1AY&SY", "\x1f plain"])
+def test_plain_text_with_magic_like_prefix(tmp_path, head):
+    path = tmp_path / "plain.md"
+    path.write_text(head + "\n正文\n", encoding='utf-8')
+    assert detect_compression(str(path)) is None
+    with open_input(str(path)) as f:
+        assert f.read() == head + "\n正文\n"
+
+
+def test_short_and_empty_files(tmp_path):
+    path = tmp_path / "empty.md"
+    path.write_bytes(b"")
+    assert detect_compression(str(path)) is None
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz", ".bz2"])
+def test_text_output_newline_is_explicit(tmp_path, suffix):
+    # 文本模式默认只写 "\n"，与平台换行符无关；需要 "\r\n" 时显式指定
+    for newline, expected in [(None, TEXT), ('\r\n', TEXT.replace("\n", "\r\n"))]:
+        path = tmp_path / f"cleaned-{bool(newline)}.txt{suffix}"
+        with open_output(str(path), 'w', **({'newline': newline} if newline else {})) as f:
+            f.write(TEXT)
+        with open_input(str(path), 'rb') as f:
+            assert f.read() == expected.encode('utf-8')
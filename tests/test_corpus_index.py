@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+import pytest
+from ai4e_refinetext.corpus_index import CorpusIndex
+from ai4e_refinetext.similarity_index import build_index
+
+DIM = 32
+
+
+def _unit_vectors(rng, n):
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("index_type, params", [
+    ('flat', {}),
+    ('ivf', {'nlist': 8, 'train_size': 600}),
+    ('hnsw', {'M': 8}),
+    ('quantized', {'mode': 'int8'}),
+    ('quantized', {'mode': 'binary'}),
+])
+def test_persisted_index_matches_continuous_index(tmp_path, index_type, params):
+    rng = np.random.default_rng(0)
+    chunks = [_unit_vectors(rng, n) for n in (300, 500, 400, 50)]
+    queries = _unit_vectors(rng, 200)
+
+    continuous = build_index(index_type, DIM, **params)
+    for chunk in chunks:
+        continuous.add(chunk)
+
+    # 每次运行重新打开索引目录、追加一批并提交，与一直在内存中追加的索引检索结果完全一致
+    for chunk in chunks:
+        corpus = CorpusIndex(str(tmp_path), 'model', DIM, index_type, params)
+        corpus.index.add(chunk)
+        corpus.commit()
+        corpus.close()
+    manifest = json.loads((tmp_path / "manifest.json").read_text(encoding='utf-8'))
+    assert manifest['count'] == sum(len(chunk) for chunk in chunks)
+    assert len(manifest['runs']) == len(chunks)
+
+    corpus = CorpusIndex(str(tmp_path), 'model', DIM, index_type, params)
+    try:
+        expected_scores, expected_ids = continuous.search(queries)
+        scores, ids = corpus.index.search(queries)
+        np.testing.assert_array_equal(ids, expected_ids)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-6, atol=1e-6)
+    finally:
+        corpus.close()
+
+
+def test_model_mismatch_is_rejected(tmp_path):
+    corpus = CorpusIndex(str(tmp_path), 'model', DIM)
+    corpus.commit()
+    corpus.close()
+    with pytest.raises(ValueError):
+        CorpusIndex(str(tmp_path), 'other-model', DIM)
@@ -0,0 +1,45 @@
+import numpy as np
+from ai4e_refinetext.embedding_cache import EmbeddingCache, cache_key
+from ai4e_refinetext.semantic_deduplicator import Deduplicator
+
+LINES = [
+    "A.B", "ab", "Ab", "a b",
+    "数据清洗，去重。", "数据清洗去重", "数据清洗，去重。",
+    "the quick brown fox", "The quick brown fox!", "the quick brown fox",
+    "  leading and trailing  ", "leading and trailing",
+]
+
+
+def _dedup(lines, embedder, cache_dir=None):
+    with Deduplicator(embedder=embedder, similarity_threshold=0.9, batch_size=4, cache_dir=cache_dir) as dedup:
+        kept = list(dedup.iter_unique(lines))
+        dedup.commit()
+    return kept
+
+
+def test_cache_key_uses_exact_text_and_model():
+    assert cache_key("A.B", "m") != cache_key("ab", "m")
+    assert cache_key("数据清洗，去重。", "m") != cache_key("数据清洗去重", "m")
+    assert cache_key("ab", "m") != cache_key("ab", "other")
+    assert cache_key("ab", "m") == cache_key("ab", "m")
+
+
+def test_cached_dedup_matches_uncached(tmp_path, embedder):
+    expected = _dedup(LINES, embedder)
+    # 首次运行填充缓存，第二次运行全部命中；两次都与不用缓存的结果一致
+    assert _dedup(LINES, embedder, tmp_path / "cache") == expected
+    calls = embedder.calls
+    assert _dedup(LINES, embedder, tmp_path / "cache") == expected
+    assert embedder.calls == calls
+
+
+def test_cache_round_trip(tmp_path):
+    cache = EmbeddingCache(tmp_path, "m", 4, flush_every=2)
+    keys = np.array([cache_key(t, "m") for t in ("x", "y", "z")], dtype=np.uint64)
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    cache.put_many(keys[:2], vectors[:2])
+    cache.flush()
+    reopened = EmbeddingCache(tmp_path, "m", 4)
+    found, got = reopened.get_many(keys)
+    assert found.tolist() == [True, True, False]
+    np.testing.assert_array_equal(got[:2], vectors[:2])
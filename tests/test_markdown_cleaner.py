@@ -0,0 +1,93 @@
+import os
+
+from ai4e_refinetext import markdown_cleaner
+from ai4e_refinetext.boilerplate_filter import BoilerplateFilter
+from ai4e_refinetext.quality_filter import QualityFilter
+
+
+def _clean_twice(input_folder, output_folder, workers):
+    # 同一进程内连续清洗两次，返回每次结束后累计的规则命中、模板行与质量过滤统计
+    markdown_cleaner.default_engine.hits.clear()
+    boilerplate = BoilerplateFilter(min_docs=2)
+    quality = QualityFilter()
+    results = []
+    for _ in range(2):
+        markdown_cleaner.process_markdown_files(str(input_folder), str(output_folder), workers=workers,
+                                                boilerplate=boilerplate, quality=quality, incremental=False)
+        results.append((dict(markdown_cleaner.default_engine.hits), dict(boilerplate.removed),
+                        quality.seen, quality.accepted))
+    return results
+
+
+def test_worker_stats_are_not_counted_twice(tmp_path, markdown_corpus):
+    serial = _clean_twice(markdown_corpus, tmp_path / "serial", workers=1)
+    parallel = _clean_twice(markdown_corpus, tmp_path / "parallel", workers=3)
+    assert sum(serial[0][0].values()) > 0 and sum(serial[0][1].values()) > 0
+    assert parallel == serial
+    # 第二次调用只累加本次的计数
+    hits = serial[0][0]
+    assert serial[1][0] == {name: 2 * n for name, n in hits.items()}
+
+
+def test_stream_corpus_worker_stats_are_not_counted_twice(tmp_path, markdown_corpus, embedder):
+    from ai4e_refinetext.streaming import stream_corpus
+
+    results = {}
+    for workers in (1, 3):
+        markdown_cleaner.default_engine.hits.clear()
+        boilerplate = BoilerplateFilter(min_docs=2)
+        for run in range(2):
+            stream_corpus(str(markdown_corpus), str(tmp_path / f"jsonl-{workers}-{run}"), workers=workers,
+                          boilerplate=boilerplate, embedder=embedder)
+        results[workers] = (dict(markdown_cleaner.default_engine.hits), dict(boilerplate.removed))
+    assert sum(results[1][0].values()) > 0
+    assert results[3] == results[1]
+
+
+def _cleaned_files(input_folder, output_folder, monkeypatch, workers=1):
+    # 增量清洗一次，返回本次实际清洗的输入文件名
+    cleaned = []
+    original = markdown_cleaner.process_specific_file
+
+    def spy(file_path, *args, **kwargs):
+        cleaned.append(os.path.basename(file_path))
+        return original(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(markdown_cleaner, 'process_specific_file', spy)
+    markdown_cleaner.process_markdown_files(str(input_folder), str(output_folder), workers=workers)
+    return sorted(cleaned)
+
+
+def test_incremental_skips_unchanged_and_prunes_deleted(tmp_path, markdown_corpus, monkeypatch):
+    output = tmp_path / "cleaned"
+    files = sorted(p.name for p in markdown_corpus.iterdir())
+    assert _cleaned_files(markdown_corpus, output, monkeypatch) == files
+    assert _cleaned_files(markdown_corpus, output, monkeypatch) == []
+
+    edited = markdown_corpus / files[1]
+    edited.write_text(edited.read_text(encoding='utf-8').replace("吸附能", "结合能"), encoding='utf-8')
+    (markdown_corpus / files[2]).unlink()
+    assert _cleaned_files(markdown_corpus, output, monkeypatch) == [files[1]]
+    assert "结合能" in (output / markdown_cleaner.cleaned_name(files[1])).read_text(encoding='utf-8')
+    assert not (output / markdown_cleaner.cleaned_name(files[2])).exists()
+    assert sorted(p.name for p in output.iterdir() if not p.name.startswith('.')) == \
+        sorted(markdown_cleaner.cleaned_name(f) for f in files if f != files[2])
+
+
+def test_edit_during_cleaning_is_not_recorded_as_processed(tmp_path, markdown_corpus, monkeypatch):
+    output = tmp_path / "cleaned"
+    target = markdown_corpus / "doc03.md"
+    original = markdown_cleaner.process_specific_file
+
+    def edit_while_cleaning(file_path, *args, **kwargs):
+        original(file_path, *args, **kwargs)
+        if os.path.basename(file_path) == target.name:
+            # 清洗读取之后、记入清单之前输入被修改
+            target.write_text(target.read_text(encoding='utf-8').replace("吸附能", "结合能"), encoding='utf-8')
+            st = os.stat(target)
+            os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    monkeypatch.setattr(markdown_cleaner, 'process_specific_file', edit_while_cleaning)
+    markdown_cleaner.process_markdown_files(str(markdown_corpus), str(output))
+    assert _cleaned_files(markdown_corpus, output, monkeypatch) == [target.name]
+    assert "结合能" in (output / markdown_cleaner.cleaned_name(target.name)).read_text(encoding='utf-8')
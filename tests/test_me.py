@@ -0,0 +1,38 @@
+import gzip
+import os
+
+import pytest
+from ai4e_refinetext import me
+
+
+def _write_documents(folder):
+    folder.mkdir()
+    documents = {"a_cleaned.txt": "# 标题一\n正文一\n", "b_cleaned.txt": "# Title\r\nCRLF 原样保留\r\n",
+                 "c_cleaned.txt": "", "d_cleaned.txt": "# 压缩\n" + "压缩的正文\n" * 100}
+    for name, text in documents.items():
+        data = text.encode('utf-8')
+        if name.startswith("d"):
+            (folder / (name + ".gz")).write_bytes(gzip.compress(data))
+        else:
+            (folder / name).write_bytes(data)
+    return documents
+
+
+@pytest.mark.parametrize("sendfile", [True, False])
+@pytest.mark.parametrize("output_name", ["merged.txt", "merged.txt.gz"])
+def test_allin_copies_bytes_and_indexes_documents(tmp_path, monkeypatch, sendfile, output_name):
+    documents = _write_documents(tmp_path / "cleaned")
+    if not sendfile:
+        monkeypatch.delattr(os, "sendfile", raising=False)
+    output = tmp_path / output_name
+    index = me.allin(str(tmp_path / "cleaned"), str(output))
+
+    expected = b"".join(text.encode('utf-8') + b"\n" for _, text in sorted(documents.items()))
+    data = output.read_bytes()
+    assert (gzip.decompress(data) if output_name.endswith(".gz") else data) == expected
+    assert [entry["source"] for entry in index] == ["a_cleaned.txt", "b_cleaned.txt", "c_cleaned.txt",
+                                                    "d_cleaned.txt.gz"]
+    assert me.read_index(str(output)) == index
+    with me.open_input(str(output), 'rb') as merged:
+        for entry, (_, text) in zip(index, sorted(documents.items())):
+            assert me.read_document(merged, entry) == text
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from ai4e_refinetext.semantic_deduplicator import dedup_batch_mask, semantic_deduplicate
+from ai4e_refinetext.similarity_index import build_index
+
+
+def _sequential_mask(embs, retained, threshold):
+    kept = list(retained)
+    mask = []
+    for emb in embs:
+        mask.append(all(emb @ other < threshold for other in kept))
+        if mask[-1]:
+            kept.append(emb)
+    return np.array(mask)
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 1024])
+def test_dedup_batch_mask_matches_sequential(block_size):
+    rng = np.random.default_rng(0)
+    centres = rng.normal(size=(12, 8))
+    embs = centres[rng.integers(0, len(centres), 200)] + rng.normal(scale=0.2, size=(200, 8))
+    embs = (embs / np.linalg.norm(embs, axis=1, keepdims=True)).astype(np.float32)
+    index = build_index('flat', 8)
+    index.add(embs[:5])
+    mask = dedup_batch_mask(embs[5:], index, 0.9, block_size=block_size)
+    assert mask.tolist() == _sequential_mask(embs[5:], embs[:5], 0.9).tolist()
+    assert 0 < mask.sum() < len(mask)
+
+
+def test_invalid_options_raise(tmp_path, embedder):
+    input_file = tmp_path / "in.txt"
+    input_file.write_text("a line\nanother line\n", encoding='utf-8')
+    output_file = tmp_path / "out.txt"
+    with pytest.raises(ValueError):
+        semantic_deduplicate(str(input_file), str(output_file), embedder=embedder, index_type='hnsw',
+                             quantization='int8')
+    assert not output_file.exists()
+
+
+def test_returns_counts(tmp_path, embedder):
+    input_file = tmp_path / "in.txt"
+    input_file.write_text("a line\n\na line\nanother line\n", encoding='utf-8')
+    output_file = tmp_path / "out.txt"
+    assert semantic_deduplicate(str(input_file), str(output_file), embedder=embedder) == (3, 2)
+    assert output_file.read_text(encoding='utf-8') == "a line\nanother line\n"
@@ -0,0 +1,49 @@
+import json
+from collections import Counter
+
+from ai4e_refinetext.shuffle import iter_corpus_lines, shuffle_jsonl_shards
+
+
+SIZES = {'a.jsonl': 300, 'b.jsonl': 200, 'c.jsonl': 100}
+
+
+def _write_corpus(folder):
+    folder.mkdir()
+    lines = []
+    for name, n in SIZES.items():
+        records = [json.dumps({"section": f"{name}-{i}", "content": "正文" * (i % 7)}, ensure_ascii=False) + "\n"
+                   for i in range(n)]
+        (folder / name).write_text("".join(records), encoding='utf-8')
+        lines += [line.encode('utf-8') for line in records]
+    return lines
+
+
+def _shuffled(corpus, output, **options):
+    # 小的桶内存预算：第一遍分成多个桶，第二遍还要拆分超出预算的桶
+    counts = shuffle_jsonl_shards(str(corpus), str(output), bucket_bytes=4096, max_records=128, **options)
+    return counts, [line for _, line in iter_corpus_lines(str(output))]
+
+
+def test_shuffle_is_a_deterministic_permutation(tmp_path):
+    lines = _write_corpus(tmp_path / "corpus")
+    counts, first = _shuffled(tmp_path / "corpus", tmp_path / "out1", seed=7)
+    _, again = _shuffled(tmp_path / "corpus", tmp_path / "out2", seed=7)
+    _, other = _shuffled(tmp_path / "corpus", tmp_path / "out3", seed=8)
+
+    assert counts == SIZES
+    assert sorted(first) == sorted(lines)
+    assert first != lines
+    assert again == first
+    assert sorted(other) == sorted(lines) and other != first
+
+
+def test_weights_repeat_and_drop_sources(tmp_path):
+    _write_corpus(tmp_path / "corpus")
+    counts, output = _shuffled(tmp_path / "corpus", tmp_path / "out", seed=0,
+                               weights={'a.jsonl': 2, 'c.jsonl': 0})
+    sources = Counter(json.loads(line)["section"].split("-")[0] for line in output)
+    # 权重为 0 的来源没有任何记录，也不出现在计数中
+    assert counts == {'a.jsonl': 600, 'b.jsonl': 200}
+    assert sources == {'a.jsonl': 600, 'b.jsonl': 200}
+    per_record = Counter(output)
+    assert all(per_record[line] == 2 for line in per_record if b'"a.jsonl-' in line)
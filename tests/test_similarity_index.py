@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from ai4e_refinetext.benchmark import make_clustered_vectors
+from ai4e_refinetext import similarity_index
+from ai4e_refinetext.similarity_index import _as_words, _hamming, build_index
+
+
+def test_hamming_matches_unpacked_bits():
+    rng = np.random.default_rng(0)
+    for n_bits in (64, 100, 384):
+        a = np.packbits(rng.random((7, n_bits)) > 0.5, axis=1)
+        b = np.packbits(rng.random((50, n_bits)) > 0.5, axis=1)
+        expected = (np.unpackbits(a, axis=1)[:, None, :] != np.unpackbits(b, axis=1)[None, :, :]).sum(axis=2)
+        np.testing.assert_array_equal(_hamming(_as_words(a), _as_words(b), tile=16, query_tile=3), expected)
+
+
+def test_popcount_table_fallback(monkeypatch):
+    words = np.random.default_rng(1).integers(0, 1 << 63, (5, 9), dtype=np.uint64)
+    expected = similarity_index._popcount(words)
+    monkeypatch.delattr(np, 'bitwise_count', raising=False)
+    np.testing.assert_array_equal(similarity_index._popcount(words), expected)
+
+
+@pytest.mark.parametrize("mode", ['int8', 'binary'])
+def test_quantized_decisions_match_flat(mode):
+    data = make_clustered_vectors(6000, 128, noise=0.35, seed=0)
+    base, queries = data[:5000], data[5000:]
+    flat = build_index('flat', 128)
+    flat.add(base)
+    quantized = build_index('quantized', 128, mode=mode, threshold=0.9)
+    for start in range(0, len(base), 1024):
+        quantized.add(base[start:start + 1024])
+    exact_scores, _ = flat.search(queries)
+    scores, ids = quantized.search(queries)
+    exact = exact_scores >= 0.9
+    assert exact.any() and not exact.all()
+    agreement = np.mean((scores >= 0.9) == exact)
+    assert agreement >= 0.99
+    # 重算过的查询给出的是真实相似度
+    rescored = (scores >= 0.9 - quantized.margin()) & (scores < 0.9 + quantized.margin())
+    np.testing.assert_allclose(scores[rescored], np.einsum('qd,qd->q', base[ids[rescored]], queries[rescored]),
+                               rtol=1e-5)
+
+
+def test_binary_margin_shrinks_with_code_length():
+    short = build_index('quantized', 64, mode='binary', threshold=0.9, n_bits=128)
+    long = build_index('quantized', 64, mode='binary', threshold=0.9, n_bits=512)
+    assert long.margin() == pytest.approx(short.margin() / 2)
+    assert build_index('quantized', 64, mode='binary', rescore_margin=0.05).margin() == 0.05
+
+
+def test_empty_quantized_index():
+    index = build_index('quantized', 16, mode='binary')
+    scores, ids = index.search(np.ones((3, 16), dtype=np.float32) / 4)
+    assert np.isneginf(scores).all() and (ids == -1).all()
@@ -0,0 +1,24 @@
+import os
+from ai4e_refinetext.jsonl_shards import JsonlShardWriter
+from ai4e_refinetext.token_shards import load_token_shard, tokenize_jsonl_shards
+
+
+def _write_jsonl(folder, n_records, max_records):
+    with JsonlShardWriter(str(folder), max_records=max_records, compression=None) as writer:
+        for i in range(n_records):
+            writer.write({"section": f"# 标题 {i}", "content": f"正文 {i} " * 3}, "doc.txt")
+
+
+def test_tokenize_round_trip_and_stale_shards(tmp_path):
+    jsonl, tokens = tmp_path / "json", tmp_path / "tokens"
+    _write_jsonl(jsonl, 9, max_records=3)
+    manifest = tokenize_jsonl_shards(str(jsonl), str(tokens))
+    assert len(manifest['shards']) == 3 and manifest['documents'] == 9
+    ids, offsets = load_token_shard(str(tokens), 1)
+    assert ids[offsets[0]:offsets[1]].astype("uint8").tobytes().decode('utf-8') == "# 标题 3\n" + "正文 3 " * 3
+
+    # 重跑时分片变少，上次多出的训练分片被删除
+    _write_jsonl(jsonl, 2, max_records=3)
+    manifest = tokenize_jsonl_shards(str(jsonl), str(tokens))
+    assert sorted(os.listdir(tokens)) == ['token_manifest.json', 'tokens-00000.bin', 'tokens-00000.idx']
+    assert manifest['documents'] == 2